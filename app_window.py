@@ -1,31 +1,156 @@
 # app_window.py
 import sys
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QLineEdit, QPushButton, QScrollArea, QMessageBox,
+                             QLineEdit, QPushButton, QMessageBox,
                              QFileDialog, QInputDialog, QLabel, QGraphicsOpacityEffect)
-from PyQt6.QtCore import Qt, pyqtSignal, QUrl
-from PyQt6.QtGui import QFont, QDesktopServices
+from PyQt6.QtCore import Qt, pyqtSignal, QUrl, QTimer, QEvent
+from PyQt6.QtGui import QFont, QDesktopServices, QColor
 from threading import Thread
 import os
 
-from ui_elements import ImageResultWidget
-from konachan_api import KonachanAPI
-from settings_manager import SettingsManager
+from ui_elements import PostListModel, PostDelegate, ResultsView, MetricsDock
 from config_manager import ConfigManager
+from metrics import Metrics
+from thumbnail_cache import ThumbnailCache
+from post import page_is_full
+from post_index import PostIndex, split_query
+from download_ledger import DownloadLedger, FilenameTemplate
+from subscriptions import SubscriptionWatcher
+from tag_filter import compile_blacklist
+
+THUMBNAILS_IN_FLIGHT = 6
 
 class ImageSearchApp(QMainWindow):
     update_status_signal = pyqtSignal(str)
     show_message_box_signal = pyqtSignal(str, bool)
-    update_results_signal = pyqtSignal(list)
+    # object rather than list, so a PostPage keeps its fetched count.
+    update_results_signal = pyqtSignal(int, object)
+    page_loaded_signal = pyqtSignal(int, int, object, str)
+    post_downloaded_signal = pyqtSignal(object, str)
+    results_batch_signal = pyqtSignal(int, list)
+    subscription_post_signal = pyqtSignal(object)
 
     def __init__(self):
         super().__init__()
-        self.settings_manager = SettingsManager()
         self.config_manager = ConfigManager()
-        self.api = KonachanAPI()
+        # Shared with the transport once it exists, so the dock and the
+        # results view can record from the start.
+        self.metrics = Metrics()
         self.load_settings()
+        self.post_index = PostIndex(self.config_manager.get_index_path())
+        self.ledger = DownloadLedger(self.config_manager.get_ledger_path())
+        self.migrate_legacy_settings()
+        self.local_hits = []
+        self.streamed_rows = 0
+        # md5s shown for the current query, so a post cross-posted to several
+        # sources (or repeated on a later page) appears once.
+        self.seen_md5 = set()
+        # Pagination state for the current query; search_id invalidates pages
+        # that arrive after a newer search has started.
+        self.search_id = 0
+        self.search_query = ""
+        self.next_page = 2
+        self.has_more_pages = False
+        self.prefetching_page = None
+        self.prefetched_page = None
+        memory_bytes, disk_bytes, max_age = self.config_manager.get_cache_limits()
+        self.thumbnail_cache = ThumbnailCache(
+            os.path.join(self.config_manager.get_cache_dir(), "thumbnails"),
+            memory_bytes=memory_bytes, disk_bytes=disk_bytes, max_age=max_age,
+        )
+        # The network side (requests and everything built on it) is set up
+        # by init_network() once the window has painted for the first time.
+        self.transport = None
+        self.sources = None
+        self.api = None
+        self.download_manager = None
+        self.thumbnail_loader = None
+        self.results_model = None
+        self.post_processor = None
+        self.subscription_watcher = None
+        self.subscription_thread = None
         self.initUI()
         self.apply_theme()
+        self.seed_ledger()
+        self.first_paint = False
+
+    def event(self, event):
+        if event.type() == QEvent.Type.Paint and not self.first_paint:
+            self.first_paint = True
+            QTimer.singleShot(0, self.init_network)
+        return super().event(event)
+
+    def migrate_legacy_settings(self):
+        # The download counter used to live in QSettings; carry it over once.
+        if self.ledger.counter() is not None:
+            return
+        from PyQt6.QtCore import QSettings
+        legacy = QSettings("KonachanDownloader", "ImageSearchApp")
+        self.ledger.start_counter(legacy.value("download_counter", 0, type=int))
+        legacy.remove("download_counter")
+
+    def init_network(self):
+        # Safe to call more than once; a search started before the deferred
+        # call ran sets everything up on the spot.
+        if self.transport is not None:
+            return
+        from booru_sources import create_sources
+        from download_manager import DownloadManager
+        from thumbnail_loader import ThumbnailLoader
+        from transport import TransportAdapter
+
+        source_specs = self.config_manager.get_sources()
+        # One transport for searches, downloads and thumbnails, with a pool
+        # large enough for all of them to be busy at once.
+        pool_size = (self.config_manager.get_download_workers() * self.config_manager.get_download_segments()
+                     + THUMBNAILS_IN_FLIGHT + 2 * len(source_specs))
+        self.transport = TransportAdapter(pool_maxsize=pool_size, metrics=self.metrics,
+                                          **self.config_manager.get_network_options())
+        source_options = dict(download_segments=self.config_manager.get_download_segments(),
+                              download_retries=self.config_manager.get_download_retries(),
+                              search_ttl=self.config_manager.get_search_ttl(),
+                              transport=self.transport)
+        try:
+            self.sources = create_sources(source_specs, **source_options)
+        except ValueError as e:
+            print(e)
+            self.sources = create_sources([("yande.re", None)], **source_options)
+        # The primary source also serves downloads and the local index.
+        self.api = self.sources.primary
+        self.download_manager = DownloadManager(
+            self.api,
+            self.config_manager.get_download_queue_path(),
+            workers=self.config_manager.get_download_workers(),
+            per_host_limit=self.config_manager.get_per_host_limit(),
+            ledger=self.ledger,
+        )
+        self.download_manager.on_job_finished = self.on_download_finished
+        self.post_processor = self.create_post_processor()
+        self.subscription_watcher = self.create_subscription_watcher()
+        self.thumbnail_loader = ThumbnailLoader(headers=self.api.session.headers, cache=self.thumbnail_cache,
+                                                max_in_flight=THUMBNAILS_IN_FLIGHT, transport=self.transport,
+                                                parent=self)
+
+        # Virtualized results list; only visible rows are painted
+        self.results_model = PostListModel(self.thumbnail_loader, parent=self)
+        self.results_view.setModel(self.results_model)
+        self.post_downloaded_signal.connect(self.results_model.mark_downloaded)
+
+        self.download_manager.start()
+        self.start_subscription_polling()
+        if self.config_manager.get_warm_up():
+            Thread(target=self.warm_up, daemon=True).start()
+
+    def warm_up(self):
+        # Resolves each source's host and completes the TCP and TLS handshakes
+        # in the background; the connection stays in the shared pool for the
+        # first search to reuse.
+        for api in self.sources.backends:
+            try:
+                with self.metrics.track("warm_up_seconds", source=api.name):
+                    api.session.head(api.base_url, timeout=self.transport.timeout)
+            except Exception as e:
+                print(f"Could not reach {api.name}: {e}")
 
     def initUI(self):
         width = int(self.config_manager.get_setting("General", "app_width"))
@@ -58,6 +183,18 @@ class ImageSearchApp(QMainWindow):
         self.settings_button.setObjectName("settingsButton")
         self.settings_button.clicked.connect(self.open_config_file)
         search_layout.addWidget(self.settings_button)
+        # Metrics dock, hidden until toggled with the button or F12
+        self.metrics_dock = MetricsDock(self.metrics, self)
+        self.metrics_dock.export_requested.connect(self.export_metrics)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.metrics_dock)
+        self.metrics_dock.hide()
+        metrics_action = self.metrics_dock.toggleViewAction()
+        metrics_action.setShortcut("F12")
+        self.addAction(metrics_action)
+        self.metrics_button = QPushButton("Metrics")
+        self.metrics_button.setObjectName("metricsButton")
+        self.metrics_button.clicked.connect(metrics_action.trigger)
+        search_layout.addWidget(self.metrics_button)
         self.main_layout.addLayout(search_layout)
 
         # Status Bar
@@ -65,40 +202,74 @@ class ImageSearchApp(QMainWindow):
         self.status_label = QLabel("Ready")
         self.status_bar.addWidget(self.status_label)
 
-        # Scrollable area for results
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.scroll_area_content = QWidget()
-        self.results_layout = QVBoxLayout(self.scroll_area_content)
-        self.results_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        self.results_layout.setSpacing(10)
-        self.scroll_area.setWidget(self.scroll_area_content)
-        self.main_layout.addWidget(self.scroll_area)
+        # Download queue controls and aggregate throughput
+        self.download_label = QLabel("")
+        self.pause_button = QPushButton("Pause")
+        self.pause_button.setObjectName("pauseButton")
+        self.pause_button.clicked.connect(self.toggle_downloads_paused)
+        self.cancel_button = QPushButton("Cancel All")
+        self.cancel_button.setObjectName("cancelButton")
+        self.cancel_button.clicked.connect(self.cancel_downloads)
+        self.status_bar.addPermanentWidget(self.download_label)
+        self.status_bar.addPermanentWidget(self.pause_button)
+        self.status_bar.addPermanentWidget(self.cancel_button)
+
+        self.download_stats_timer = QTimer(self)
+        self.download_stats_timer.timeout.connect(self.update_download_stats)
+        self.download_stats_timer.start(1000)
+
+        # Periodic export for external monitoring, if configured
+        self.metrics_export_path, export_interval = self.config_manager.get_metrics_export()
+        if self.metrics_export_path:
+            self.metrics_export_timer = QTimer(self)
+            self.metrics_export_timer.timeout.connect(self.write_metrics_export)
+            self.metrics_export_timer.start(int(export_interval * 1000))
+
+        # The model is attached by init_network()
+        self.results_delegate = PostDelegate(self)
+        self.results_delegate.download_requested.connect(self.download_image_threaded)
+        self.results_view = ResultsView(metrics=self.metrics)
+        self.results_view.setItemDelegate(self.results_delegate)
+        self.main_layout.addWidget(self.results_view)
 
         # Connect custom signals to their slots
         self.update_status_signal.connect(self.update_status_label)
         self.show_message_box_signal.connect(self.show_message_box)
         self.update_results_signal.connect(self.display_results)
+        self.page_loaded_signal.connect(self.on_page_loaded)
+        self.results_batch_signal.connect(self.on_results_batch)
+        self.subscription_post_signal.connect(self.download_image_threaded)
+        self.results_view.verticalScrollBar().valueChanged.connect(self.maybe_show_next_page)
 
     def load_settings(self):
         self.download_dir = self.config_manager.get_download_folder()
         self.autoexclude_tags = self.config_manager.get_autoexclude_tags()
-        self.background_color = self.config_manager.get_background_color()
-        self.button_color = self.config_manager.get_button_color()
+        self.background_color = self.to_color(self.config_manager.get_background_color(), "#f0f0f0")
+        self.button_color = self.to_color(self.config_manager.get_button_color(), "#007BFF")
+        self.page_size = self.config_manager.get_page_size()
+        try:
+            self.filename_template = FilenameTemplate(self.config_manager.get_filename_template())
+        except ValueError as e:
+            print(e)
+            self.filename_template = FilenameTemplate("{counter}{ext}")
+
+    def to_color(self, color_hex, fallback):
+        color = QColor(color_hex)
+        return color if color.isValid() else QColor(fallback)
 
     def apply_theme(self):
         self.main_widget.setStyleSheet(f"background-color: {self.background_color.name()};")
         
         button_style = f"""
-            #searchButton, #settingsButton {{
+            #searchButton, #settingsButton, #metricsButton, #pauseButton, #cancelButton {{
                 background-color: {self.button_color.name()};
                 color: white;
                 border: none;
                 border-radius: 3px;
                 padding: 5px 10px;
             }}
-            #searchButton:hover, #settingsButton:hover {{
+            #searchButton:hover, #settingsButton:hover, #metricsButton:hover, #pauseButton:hover,
+            #cancelButton:hover {{
                 background-color: {self.button_color.darker(120).name()};
             }}
         """
@@ -116,54 +287,284 @@ class ImageSearchApp(QMainWindow):
         QDesktopServices.openUrl(QUrl.fromLocalFile(self.config_manager.config_path))
 
     def update_result_button_colors(self, color):
-        for i in range(self.results_layout.count()):
-            widget = self.results_layout.itemAt(i).widget()
-            if isinstance(widget, ImageResultWidget):
-                widget.set_button_color(color)
+        self.results_delegate.set_button_color(color)
+        self.results_view.viewport().update()
 
     def clear_results(self):
-        for i in reversed(range(self.results_layout.count())):
-            widget = self.results_layout.itemAt(i).widget()
-            if widget is not None:
-                widget.setParent(None)
+        self.results_model.clear()
 
     def search_images(self):
+        self.init_network()
         search_query = self.search_box.text()
         self.update_status_signal.emit(f"Searching for: {search_query}")
         self.clear_results()
 
-        thread = Thread(target=self.perform_search, args=(search_query,))
+        self.search_id += 1
+        self.search_query = search_query
+        self.next_page = 2
+        self.has_more_pages = False
+        self.prefetching_page = None
+        self.prefetched_page = None
+        self.streamed_rows = 0
+        self.seen_md5 = set()
+
+        # Answer from the local index straight away; remote results are
+        # merged in by display_results when they arrive.
+        query = split_query(search_query, self.autoexclude_tags)
+        self.local_hits = self.post_index.query(*query, limit=self.page_size) if query else []
+        # The index only knows plain tags; wildcards and rating/score terms
+        # of the blacklist are applied here.
+        self.local_hits = compile_blacklist(self.autoexclude_tags or "").filter(self.local_hits)
+        if self.local_hits:
+            self.results_model.set_posts(self.local_hits)
+            self.update_status_signal.emit(f"Showing {len(self.local_hits)} local matches, searching for: {search_query}")
+
+        thread = Thread(target=self.perform_search, args=(search_query, self.search_id))
         thread.start()
 
-    def perform_search(self, search_query):
-        images, error = self.api.search_images(search_query, self.autoexclude_tags)
-        
+    def perform_search(self, search_query, search_id):
+        def on_batch(batch):
+            self.annotate_downloaded(batch)
+            self.results_batch_signal.emit(search_id, batch)
+
+        # A newer search makes this one stale; stop reading its response.
+        def superseded():
+            return search_id != self.search_id
+
+        images, error = self.sources.search(search_query, self.autoexclude_tags, limit=self.page_size,
+                                            on_batch=on_batch, should_stop=superseded, seen_md5=self.seen_md5,
+                                            on_error=self.on_source_error)
+        if superseded():
+            return
         if error:
             self.show_message_box_signal.emit("Search failed: " + error, True)
             self.update_status_signal.emit("Search failed.")
             return
 
-        self.update_results_signal.emit(images)
+        self.post_index.add_posts([post for post in images if post.source is None])
+        self.update_results_signal.emit(search_id, images)
 
-    def download_image_threaded(self, url, file_extension):
-        counter = self.settings_manager.increment_download_counter()
-        filename = f"{counter}{file_extension}"
-        save_path = os.path.join(self.download_dir, filename)
-        
-        self.update_status_signal.emit(f"Downloading {filename}...")
-        
-        thread = Thread(target=self.perform_download, args=(url, save_path, filename))
+    def on_results_batch(self, search_id, batch):
+        # Paint the first posts of a page while the rest is still downloading.
+        # With local hits on screen we wait for the whole page and merge.
+        if search_id != self.search_id or self.local_hits:
+            return
+        with self.metrics.track("results_update_seconds", stage="batch"):
+            if self.streamed_rows:
+                self.results_model.append_posts(batch)
+            else:
+                self.results_model.set_posts(batch)
+        self.streamed_rows += len(batch)
+        self.update_status_signal.emit(f"Loading... {self.streamed_rows} images so far.")
+
+    def prefetch_page(self, page):
+        # Fetch the next page in the background before the user reaches the end.
+        self.prefetching_page = page
+        thread = Thread(target=self.perform_page_fetch, args=(self.search_id, self.search_query, page), daemon=True)
         thread.start()
 
-    def perform_download(self, url, save_path, filename):
-        success, message = self.api.download_image(url, save_path)
-        
+    def perform_page_fetch(self, search_id, search_query, page):
+        images, error = self.sources.search(search_query, self.autoexclude_tags, limit=self.page_size, page=page,
+                                            should_stop=lambda: search_id != self.search_id,
+                                            seen_md5=self.seen_md5, on_error=self.on_source_error)
+        if images:
+            self.post_index.add_posts([post for post in images if post.source is None])
+            self.annotate_downloaded(images)
+        self.page_loaded_signal.emit(search_id, page, images or [], error or "")
+
+    def on_page_loaded(self, search_id, page, images, error):
+        if search_id != self.search_id or page != self.prefetching_page:
+            return
+        self.prefetching_page = None
+        if error:
+            self.update_status_signal.emit(f"Failed to load page {page}: {error}")
+            return
+        self.prefetched_page = images
+        self.maybe_show_next_page()
+
+    def maybe_show_next_page(self):
+        if not self.has_more_pages or not self.results_view.is_near_end():
+            return
+        if self.prefetched_page is None:
+            if self.prefetching_page is None:
+                self.prefetch_page(self.next_page)
+            return
+
+        images, self.prefetched_page = self.prefetched_page, None
+        with self.metrics.track("results_update_seconds", stage="page"):
+            self.results_model.append_posts(images)
+        self.has_more_pages = page_is_full(images, self.page_size)
+        self.next_page += 1
+        self.update_status_signal.emit(f"Showing {self.results_model.rowCount()} images.")
+        if self.has_more_pages:
+            self.prefetch_page(self.next_page)
+
+    def seed_ledger(self):
+        # One-time scan so files downloaded before the ledger existed are
+        # recognised; later downloads are recorded as they finish.
+        if self.ledger.was_scanned(self.download_dir):
+            return
+
+        def scan():
+            count = self.ledger.scan_folder(self.download_dir, resolve_md5=self.post_index.find_by_md5)
+            if count:
+                self.update_status_signal.emit(f"Indexed {count} existing downloads.")
+
+        Thread(target=scan, daemon=True).start()
+
+    def create_subscription_watcher(self):
+        subscriptions = self.config_manager.get_subscriptions()
+        if not self.config_manager.get_watch_enabled() or not subscriptions:
+            return None
+        # Watermarks are post ids, so subscriptions follow the primary source.
+        return SubscriptionWatcher(self.api, subscriptions, self.autoexclude_tags,
+                                   self.config_manager.get_subscription_state_path(),
+                                   **self.config_manager.get_watch_options())
+
+    def start_subscription_polling(self):
+        if self.subscription_watcher is None:
+            return
+        self.subscription_timer = QTimer(self)
+        self.subscription_timer.timeout.connect(self.poll_subscriptions)
+        self.subscription_timer.start(int(self.config_manager.get_watch_interval() * 1000))
+        # First poll once the window is up rather than a full interval later.
+        QTimer.singleShot(5000, self.poll_subscriptions)
+
+    def poll_subscriptions(self):
+        if self.subscription_thread is not None and self.subscription_thread.is_alive():
+            return
+        self.subscription_thread = Thread(target=self.perform_subscription_poll, daemon=True)
+        self.subscription_thread.start()
+
+    def perform_subscription_poll(self):
+        # New posts go through the same path as the download button, on the
+        # GUI thread, so the filename counter and ledger checks apply.
+        results = self.subscription_watcher.poll(on_post=lambda name, post: self.subscription_post_signal.emit(post))
+        new = sum(len(posts) for _, posts, _ in results)
+        self.post_index.add_posts([post for _, posts, _ in results for post in posts])
+        failed = [name for name, _, error in results if error]
+        if failed:
+            self.update_status_signal.emit(f"Subscriptions: {new} new posts; failed to poll {', '.join(failed)}.")
+        elif new:
+            self.update_status_signal.emit(f"Subscriptions: queued {new} new posts.")
+
+    def on_source_error(self, name, error):
+        # One source failing does not fail the search; just say so.
+        self.update_status_signal.emit(f"{name} failed: {error}")
+
+    def annotate_downloaded(self, images):
+        downloaded = self.ledger.downloaded_ids(post.local_id for post in images if post.source is None)
+        for post in images:
+            if post.source is None:
+                post.downloaded = post.id in downloaded or post.downloaded
+            elif self.ledger.lookup(md5=post.md5):
+                post.downloaded = True
+
+    def download_image_threaded(self, post):
+        existing = self.ledger.lookup(post_id=post.local_id, md5=post.md5)
+        if existing:
+            self.update_status_signal.emit(f"Already downloaded: {existing}")
+            self.results_model.mark_downloaded(post.local_id, post.md5)
+            return
+
+        save_path = self.filename_template.save_path(self.download_dir, post, self.ledger)
+        job_id = self.download_manager.enqueue(post.download_url, save_path, file_size=post.file_size,
+                                               md5=post.md5, post_id=post.local_id)
+        if job_id is None:
+            self.update_status_signal.emit(f"{post.name} is already queued.")
+            return
+        self.update_status_signal.emit(f"Queued {post.name}.")
+
+    def on_download_finished(self, job, success, message):
+        # Runs on a download worker thread; only touch the UI through signals.
         if success:
-            self.show_message_box_signal.emit(f"Successfully downloaded {filename}.", False)
-            self.update_status_signal.emit(f"Successfully downloaded {filename}.")
+            if job.get('post_id') is not None:
+                self.post_index.mark_downloaded(job['post_id'])
+            self.post_downloaded_signal.emit(job.get('post_id'), job.get('md5') or '')
+            self.update_status_signal.emit(f"Downloaded {job['filename']}.")
+            if self.post_processor is not None:
+                self.post_processor.submit(job['save_path'], self.on_post_processed)
         else:
-            self.show_message_box_signal.emit(f"Failed to download {filename}: {message}", True)
-            self.update_status_signal.emit(f"Failed to download {filename}.")
+            self.update_status_signal.emit(f"Failed to download {job['filename']}: {message}")
+
+    def create_post_processor(self):
+        if not self.config_manager.get_post_process_enabled():
+            return None
+        # Imported here so Pillow and NumPy stay optional.
+        from post_process import PostProcessor
+        try:
+            return PostProcessor(self.config_manager.get_post_process_options(),
+                                 workers=self.config_manager.get_post_process_workers())
+        except ValueError as e:
+            print(e)
+            return None
+
+    def on_post_processed(self, result):
+        # Runs on a process pool management thread.
+        name = os.path.basename(result['path'])
+        if result['error']:
+            self.update_status_signal.emit(f"Post-processing {name} failed: {result['error']}")
+        elif result['palette']:
+            colors = " ".join(color for color, _ in result['palette'])
+            self.update_status_signal.emit(f"Processed {name}. Palette: {colors}")
+        else:
+            self.update_status_signal.emit(f"Processed {name}.")
+
+    def cancel_downloads(self):
+        if self.download_manager is not None:
+            self.download_manager.cancel_all()
+
+    def toggle_downloads_paused(self):
+        if self.download_manager is None:
+            return
+        if self.download_manager.is_paused():
+            self.download_manager.resume()
+            self.pause_button.setText("Pause")
+        else:
+            self.download_manager.pause()
+            self.pause_button.setText("Resume")
+        self.update_download_stats()
+
+    def update_download_stats(self):
+        if self.download_manager is None:
+            return
+        stats = self.download_manager.stats()
+        if not (stats['queued'] or stats['active'] or stats['bytes_per_sec']):
+            self.download_label.setText(f"Downloads: {stats['done']} done, {stats['failed']} failed")
+            return
+        self.download_label.setText(
+            f"Downloads: {stats['active']} active, {stats['queued']} queued"
+            f"{' (paused)' if stats['paused'] else ''} | "
+            f"{stats['bytes_per_sec'] / 1024:.1f} KiB/s, {stats['items_per_sec']:.2f} items/s"
+        )
+
+    def export_metrics(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Metrics", os.path.join(self.download_dir, "metrics.json"),
+                                              "JSON (*.json);;Prometheus text (*.prom)")
+        if not path:
+            return
+        try:
+            self.metrics.export(path)
+            self.update_status_signal.emit(f"Metrics written to {path}.")
+        except OSError as e:
+            self.show_message_box_signal.emit(f"Could not write {path}: {e}", True)
+
+    def write_metrics_export(self):
+        try:
+            self.metrics.export(self.metrics_export_path)
+        except OSError as e:
+            print(f"Could not write metrics to {self.metrics_export_path}: {e}")
+
+    def closeEvent(self, event):
+        if self.download_manager is not None:
+            self.download_manager.stop()
+        if self.metrics_export_path:
+            self.write_metrics_export()
+        if self.thumbnail_loader is not None:
+            self.thumbnail_loader.shutdown()
+        if self.post_processor is not None:
+            self.post_processor.shutdown()
+        super().closeEvent(event)
 
     # --- Slots for Signals ---
     def update_status_label(self, message):
@@ -175,16 +576,31 @@ class ImageSearchApp(QMainWindow):
         else:
             QMessageBox.information(self, "Success", message)
 
-    def display_results(self, images):
+    def merge_local_hits(self, images):
+        # Keep local matches that fall inside the id range of the remote page;
+        # older ones will arrive with later pages.
+        oldest = images[-1].id if images and page_is_full(images, self.page_size) else 0
+        remote_ids = {post.id for post in images}
+        extra = [hit for hit in self.local_hits if hit.id not in remote_ids and hit.id > oldest]
+        return sorted(images + extra, key=lambda post: post.id, reverse=True)
+
+    def display_results(self, search_id, images):
+        if search_id != self.search_id:
+            return
+        has_more_pages = page_is_full(images, self.page_size)
+        if self.local_hits:
+            images = self.merge_local_hits(images)
+
         if not images:
             self.update_status_signal.emit("No images found.")
         else:
             self.update_status_signal.emit(f"Found {len(images)} images.")
-        
-        self.clear_results()
-        for data in images:
-            widget = ImageResultWidget(image_data=data, api=self.api)
-            widget.set_button_color(self.button_color.name())
-            widget.download_requested.connect(self.download_image_threaded)
-            self.results_layout.addWidget(widget)
-        self.update_result_button_colors(self.button_color.name())
\ No newline at end of file
+
+        with self.metrics.track("results_update_seconds", stage="results"):
+            if self.local_hits or self.streamed_rows != len(images):
+                self.results_model.set_posts(images)
+            self.update_result_button_colors(self.button_color.name())
+
+        self.has_more_pages = has_more_pages
+        if self.has_more_pages:
+            self.prefetch_page(self.next_page)
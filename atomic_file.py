@@ -0,0 +1,31 @@
+# atomic_file.py
+# Files are written under a temporary name next to the target and renamed
+# over it, so a crash mid-write, or a reader such as a metrics scraper,
+# never sees half a file.
+import os
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(path):
+    # Yields the temporary path to write; it replaces path when the block
+    # finishes and is removed if the block raises. The name is unique per
+    # thread and process, so concurrent writers do not clobber each other.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_atomic(path, data):
+    # data is bytes, or text written in the platform's default encoding.
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'w' if isinstance(data, str) else 'wb') as f:
+            f.write(data)
@@ -0,0 +1,133 @@
+# benchmarks/bench_filter.py
+# Filters a batch of synthetic posts through a large blacklist, compiled by
+# tag_filter, and compares it with checking every entry against every post
+# the straightforward way. Tags follow a Zipf-like distribution so common
+# tags are common, as on a real booru.
+#
+#     python benchmarks/bench_filter.py [--posts 100000] [--blacklist 500]
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from post import Post  # noqa: E402
+from tag_filter import TagFilter, split_blacklist  # noqa: E402
+
+
+def make_posts(count, vocabulary, tags_per_post, seed=0):
+    rng = random.Random(seed)
+    names = [sys.intern(f"tag_{i}") for i in range(vocabulary)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(vocabulary)))
+    posts = []
+    for i in range(count):
+        k = rng.randint(tags_per_post // 2, tags_per_post * 3 // 2)
+        tags = tuple(dict.fromkeys(rng.choices(names, cum_weights=cum_weights, k=k)))
+        posts.append(Post(id=i + 1, author='', tags=tags, download_url='', preview_url='',
+                          score=rng.randint(0, 200), rating=rng.choice('sqe')))
+    return posts
+
+
+def make_blacklist(size, vocabulary, seed=0):
+    # Mostly plain tags from the long tail, as real blacklists are, plus
+    # some wildcards and multi-term entries with negations and meta terms.
+    rng = random.Random(seed + 1)
+    entries = [f"tag_{rng.randrange(50, vocabulary)}" for _ in range(size * 88 // 100)]
+    entries += [f"tag_{rng.randrange(200, 2000)}*" for _ in range(size * 6 // 100)]
+    while len(entries) < size:
+        a, b = rng.randrange(10, 500), rng.randrange(0, 100)
+        entries.append(rng.choice([f"tag_{a} -tag_{b}", f"rating:e score:<{rng.randrange(5, 30)}",
+                                   f"tag_{a} rating:q", f"tag_{a} tag_{b}"]))
+    return ",".join(entries)
+
+
+def naive_hidden(post, entries):
+    # Every entry is a list of space-separated terms, all of which must hold.
+    tags = set(post.tags)
+    for terms in entries:
+        ok = True
+        for term in terms:
+            negate = term.startswith('-')
+            term = term.lstrip('-')
+            if term.startswith('rating:'):
+                hit = post.rating == term[7]
+            elif term.startswith('score:<'):
+                hit = post.score < int(term[7:])
+            elif '*' in term:
+                hit = any(fnmatch.fnmatchcase(tag, term) for tag in tags)
+            else:
+                hit = term in tags
+            if hit == negate:
+                ok = False
+                break
+        if ok:
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark client-side tag filtering.")
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--blacklist", type=int, default=500, help="blacklist entries")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="distinct tags")
+    parser.add_argument("--tags-per-post", type=int, default=25)
+    parser.add_argument("--naive-posts", type=int, default=5000,
+                        help="posts checked the straightforward way, which is much slower")
+    parser.add_argument("--budget", type=int, default=4, help="exclusions that fit in a server query")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    posts = make_posts(args.posts, args.vocabulary, args.tags_per_post)
+    text = make_blacklist(args.blacklist, args.vocabulary)
+
+    start = time.perf_counter()
+    blacklist = TagFilter(split_blacklist(text))
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    # The first pass also matches each new tag against the wildcards.
+    start = time.perf_counter()
+    kept = blacklist.filter(posts)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    blacklist.filter(posts)
+    warm = time.perf_counter() - start
+
+    entries = [entry.split() for entry in split_blacklist(text)]
+    sample = posts[:args.naive_posts]
+    start = time.perf_counter()
+    naive = [post for post in sample if not naive_hidden(post, entries)]
+    naive_seconds = time.perf_counter() - start
+    compiled = [post for post in sample if not blacklist.matches(post)]
+
+    results = {
+        'posts': args.posts,
+        'blacklist_entries': len(entries),
+        'compile_ms': compile_ms,
+        'hidden': args.posts - len(kept),
+        'cold_us_per_post': cold / args.posts * 1e6,
+        'warm_us_per_post': warm / args.posts * 1e6,
+        'naive_us_per_post': naive_seconds / len(sample) * 1e6 if sample else None,
+        'agrees_with_naive': [post.id for post in naive] == [post.id for post in compiled],
+        'server_excludes': blacklist.server_excludes(args.budget),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.posts} posts, {len(entries)} blacklist entries (compiled in {compile_ms:.1f} ms): "
+          f"{results['hidden']} hidden")
+    print(f"compiled: {results['cold_us_per_post']:.2f} us/post first pass, "
+          f"{results['warm_us_per_post']:.2f} us/post after")
+    if sample:
+        print(f"naive:    {results['naive_us_per_post']:.2f} us/post over {len(sample)} posts | "
+              f"same result: {'yes' if results['agrees_with_naive'] else 'NO'}")
+    print(f"sent to the server with room for {args.budget}: {' '.join(results['server_excludes'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_parser.py
+# Compares the old post.json handling (response.json() plus a dict per post)
+# with the streaming Post parser on a synthetic 1000-post page.
+#
+#     python benchmarks/bench_parser.py [--posts 1000] [--repeat 20]
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from post import parse_posts  # noqa: E402
+
+TAG_POOL = [f"tag_{i}" for i in range(3000)]
+
+
+def make_fixture(count, seed=0):
+    # Field set and sizes modelled on a yande.re post.json page.
+    rng = random.Random(seed)
+    posts = []
+    for i in range(count):
+        post_id = 1_000_000 - i
+        md5 = f"{rng.getrandbits(128):032x}"
+        posts.append({
+            'id': post_id,
+            'tags': " ".join(rng.sample(TAG_POOL[:400] if rng.random() < 0.7 else TAG_POOL, rng.randint(8, 40))),
+            'created_at': 1_700_000_000 + i,
+            'updated_at': 1_700_000_500 + i,
+            'creator_id': rng.randint(1, 50_000),
+            'approver_id': None,
+            'author': f"user{rng.randint(1, 5000)}",
+            'change': rng.randint(1, 10_000_000),
+            'source': f"https://www.pixiv.net/artworks/{rng.randint(1, 10**8)}",
+            'score': rng.randint(0, 500),
+            'md5': md5,
+            'file_size': rng.randint(500_000, 30_000_000),
+            'file_ext': 'jpg',
+            'file_url': f"https://files.yande.re/image/{md5}/yande.re%20{post_id}.jpg",
+            'is_shown_in_index': True,
+            'preview_url': f"https://assets.yande.re/data/preview/{md5[:2]}/{md5[2:4]}/{md5}.jpg",
+            'preview_width': 150,
+            'preview_height': 106,
+            'actual_preview_width': 300,
+            'actual_preview_height': 212,
+            'sample_url': f"https://files.yande.re/sample/{md5}/yande.re%20{post_id}%20sample.jpg",
+            'sample_width': 1500,
+            'sample_height': 1060,
+            'sample_file_size': rng.randint(100_000, 1_000_000),
+            'jpeg_url': f"https://files.yande.re/jpeg/{md5}/yande.re%20{post_id}.jpg",
+            'jpeg_width': 4000,
+            'jpeg_height': 2828,
+            'jpeg_file_size': 0,
+            'rating': rng.choice('sqe'),
+            'is_rating_locked': False,
+            'has_children': False,
+            'parent_id': None,
+            'status': 'active',
+            'is_pending': False,
+            'width': 4000,
+            'height': 2828,
+            'is_held': False,
+            'frames_pending_string': '',
+            'frames_pending': [],
+            'frames_string': '',
+            'frames': [],
+            'is_note_locked': False,
+            'last_noted_at': 0,
+            'last_commented_at': 0,
+        })
+    return json.dumps(posts).encode()
+
+
+def legacy_parse(body):
+    # What search_images did before: whole-body json, then a dict per post.
+    posts = json.loads(body)
+    return [
+        {
+            'id': post.get('id'),
+            'name': f"Post #{post.get('id')}",
+            'author': post.get('author'),
+            'tags': post.get('tags').split(),
+            'download_url': post.get('file_url'),
+            'preview_url': post.get('preview_url'),
+            'file_extension': os.path.splitext(post.get('file_url'))[1] if post.get('file_url') else '.jpg',
+            'file_size': post.get('file_size'),
+            'md5': post.get('md5'),
+        }
+        for post in posts if post.get('file_url')
+    ]
+
+
+def chunked(body, size):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def time_legacy(body, chunk_size):
+    start = time.perf_counter()
+    # The legacy path cannot look at anything until the whole body is buffered.
+    buffered = b"".join(chunked(body, chunk_size))
+    result = legacy_parse(buffered)
+    end = time.perf_counter()
+    return end - start, end - start, result
+
+
+def time_streaming(body, chunk_size):
+    start = time.perf_counter()
+    first = None
+    result = []
+    for post in parse_posts(chunked(body, chunk_size)):
+        if first is None:
+            first = time.perf_counter() - start
+        result.append(post)
+    return time.perf_counter() - start, first, result
+
+
+def measure_memory(fn, body, chunk_size):
+    gc.collect()
+    tracemalloc.start()
+    _, _, result = fn(body, chunk_size)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark post.json parsing.")
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--chunk-size", type=int, default=16 * 1024)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    body = make_fixture(args.posts)
+    results = {'posts': args.posts, 'body_bytes': len(body)}
+    for name, fn in (("legacy", time_legacy), ("streaming", time_streaming)):
+        totals, firsts = [], []
+        for _ in range(args.repeat):
+            total, first, _ = fn(body, args.chunk_size)
+            totals.append(total)
+            firsts.append(first)
+        peak, retained = measure_memory(fn, body, args.chunk_size)
+        results[name] = {
+            'total_ms': min(totals) * 1000,
+            'first_post_ms': min(firsts) * 1000,
+            'peak_bytes': peak,
+            'retained_bytes': retained,
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.posts} posts, {len(body) / 1024:.0f} KiB body, {args.chunk_size // 1024} KiB chunks")
+    for name in ("legacy", "streaming"):
+        r = results[name]
+        print(f"{name:>10}: total {r['total_ms']:7.2f} ms | first post {r['first_post_ms']:7.3f} ms | "
+              f"peak {r['peak_bytes'] / 1024:8.0f} KiB | retained {r['retained_bytes'] / 1024:8.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/bench_postprocess.py
+# Runs the post-processing pipeline over a batch of synthetic wallpapers,
+# once on a single worker and once on every core, and reports throughput
+# and how busy the worker processes kept the CPUs.
+#
+#     python benchmarks/bench_postprocess.py [--images 500] [--size 3000x2000]
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from post_process import PostProcessor  # noqa: E402
+
+
+def make_images(folder, count, size, seed=0):
+    # Smooth gradients plus noise: compresses like a photo, unlike flat colour.
+    rng = np.random.default_rng(seed)
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    paths = []
+    for i in range(count):
+        base = np.stack([(x * (i % 7 + 1)) % 256, (y * (i % 5 + 1)) % 256, ((x + y) * (i % 3 + 1)) % 256], axis=2)
+        noise = rng.integers(0, 32, size=(height, width, 3))
+        path = os.path.join(folder, f"{i}.jpg")
+        Image.fromarray(((base + noise) % 256).astype(np.uint8)).save(path, quality=92)
+        paths.append(path)
+    return paths
+
+
+def run(paths, options, workers):
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    processor = PostProcessor(options, workers=workers)
+    start = time.perf_counter()
+    errors = sum(bool(result['error']) for result in processor.process_batch(paths))
+    elapsed = time.perf_counter() - start
+    processor.shutdown(wait=True)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {
+        'workers': workers,
+        'seconds': elapsed,
+        'images_per_sec': len(paths) / elapsed,
+        'cpu_seconds': cpu,
+        # Share of the available core-seconds the workers spent computing.
+        'utilisation': cpu / (elapsed * workers),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the post-processing pipeline.")
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--size", default="3000x2000", help="source image size")
+    parser.add_argument("--target", default="1920x1080", help="wallpaper size")
+    parser.add_argument("--format", default="webp")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.split("x"))
+    options = {
+        'stages': ['fit', 'transcode', 'strip', 'palette'],
+        'size': tuple(int(v) for v in args.target.split("x")),
+        'fit_mode': 'crop',
+        'format': args.format,
+        'quality': 85,
+        'palette_colors': 8,
+        'suffix': 'wallpaper',
+    }
+    folder = tempfile.mkdtemp(prefix="konadl-bench-")
+    try:
+        paths = make_images(folder, args.images, size)
+        results = {'images': args.images, 'size': args.size, 'target': args.target, 'format': args.format,
+                   'runs': [run(paths, options, workers) for workers in sorted({1, os.cpu_count()})]}
+    finally:
+        shutil.rmtree(folder)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.images} images {args.size} -> {args.target} {args.format}")
+    for r in results['runs']:
+        print(f"{r['workers']:>3} workers: {r['seconds']:7.2f} s | {r['images_per_sec']:6.1f} img/s | "
+              f"CPU utilisation {r['utilisation'] * 100:5.1f}% | errors {r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# benchmarks/bench_startup.py
+# Measures how long the GUI takes to come up: the import time of app_window
+# broken down by module (python -X importtime), and in a fresh process each
+# run, the time to construct the window, to its first paint, and until the
+# deferred network setup has finished. Runs offscreen with a throwaway HOME,
+# so the user's config and caches are left alone.
+#
+#     python benchmarks/bench_startup.py [--repeat 5] [--top 15]
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the child: prints one JSON line with timestamps in seconds since
+# the interpreter started importing the app.
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, ROOT)
+from PyQt6.QtCore import QEvent, QObject, QTimer
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv)
+import app_window
+imported = time.perf_counter()
+marks = {}
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and 'paint' not in marks:
+            marks['paint'] = time.perf_counter()
+            marks['requests_at_paint'] = 'requests' in sys.modules
+        return False
+
+def ready():
+    if window.transport is None:
+        QTimer.singleShot(1, ready)
+        return
+    marks['network'] = time.perf_counter()
+    app.quit()
+
+window = app_window.ImageSearchApp()
+constructed = time.perf_counter()
+watcher = FirstPaint()
+window.installEventFilter(watcher)
+window.show()
+QTimer.singleShot(0, ready)
+QTimer.singleShot(10000, app.quit)
+app.exec()
+window.close()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'construct_ms': (constructed - imported) * 1000,
+    'first_paint_ms': (marks.get('paint', float('nan')) - start) * 1000,
+    'network_ready_ms': (marks.get('network', float('nan')) - start) * 1000,
+    'requests_at_paint': marks.get('requests_at_paint'),
+}))
+"""
+
+
+def child_env(home):
+    env = dict(os.environ, HOME=home, QT_QPA_PLATFORM="offscreen")
+    env.pop("PYTHONPATH", None)
+    return env
+
+
+def make_home():
+    # No warm-up: its HEAD requests would hit the real sources.
+    home = tempfile.mkdtemp(prefix="konadl-bench-")
+    config_dir = os.path.join(home, ".config", "konadl")
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, "config.ini"), 'w') as f:
+        f.write("[Network]\nwarm_up = false\n")
+    return home
+
+
+def import_breakdown(home, top):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package".
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app_window"],
+                            cwd=ROOT, env=child_env(home), capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append((name, int(self_us), int(cumulative_us)))
+    total = next((cumulative for name, _, cumulative in modules if name == "app_window"), 0)
+    loaded = {name for name, _, _ in modules}
+    return {
+        'total_ms': total / 1000,
+        'modules': len(modules),
+        'heavy_loaded': sorted(loaded & {'requests', 'urllib3', 'PIL', 'numpy', 'multiprocessing'}),
+        'top': [{'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+                for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[1])[:top]],
+    }
+
+
+def run_once(home):
+    result = subprocess.run([sys.executable, "-c", f"ROOT = {ROOT!r}\n" + CHILD],
+                            cwd=ROOT, env=child_env(home), capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GUI startup time.")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes to time")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    home = make_home()
+    try:
+        imports = import_breakdown(home, args.top)
+        runs = [run_once(home) for _ in range(max(1, args.repeat))]
+    finally:
+        shutil.rmtree(home)
+
+    keys = ('import_ms', 'construct_ms', 'first_paint_ms', 'network_ready_ms')
+    results = {
+        'imports': imports,
+        'runs': runs,
+        'median': {key: statistics.median(run[key] for run in runs) for key in keys},
+        'requests_at_paint': any(run['requests_at_paint'] for run in runs),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"import app_window: {imports['total_ms']:.1f} ms over {imports['modules']} modules; "
+          f"heavy modules loaded: {', '.join(imports['heavy_loaded']) or 'none'}")
+    for entry in imports['top']:
+        print(f"  {entry['self_ms']:8.1f} ms self {entry['cumulative_ms']:8.1f} ms cumulative  {entry['module']}")
+    median = results['median']
+    print(f"median of {len(runs)} runs: import {median['import_ms']:.0f} ms | construct {median['construct_ms']:.0f} ms | "
+          f"first paint {median['first_paint_ms']:.0f} ms | network ready {median['network_ready_ms']:.0f} ms")
+    print(f"requests imported before first paint: {'yes' if results['requests_at_paint'] else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/bench_thumbnails.py
+# Per-thumbnail decode cost of the old GUI-thread path (QPixmap.loadFromData
+# plus a smooth scale) against the worker-side QImageReader decode, for
+# JPEGs at preview, sample and original sizes.
+#
+#     QT_QPA_PLATFORM=offscreen python benchmarks/bench_thumbnails.py [--repeat 20]
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QBuffer, QIODevice, QRectF, Qt  # noqa: E402
+from PyQt6.QtGui import QColor, QImage, QLinearGradient, QPainter, QPixmap  # noqa: E402
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+from thumbnail_loader import decode_thumbnail  # noqa: E402
+from ui_elements import THUMBNAIL_SIZE  # noqa: E402
+
+SIZES = {'preview': (300, 212), 'sample': (1500, 1060), 'original': (4000, 2828)}
+
+
+def make_jpeg(width, height, seed=0):
+    rng = random.Random(seed)
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    gradient.setColorAt(1, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    painter.fillRect(0, 0, width, height, gradient)
+    for _ in range(200):
+        painter.fillRect(QRectF(rng.random() * width, rng.random() * height, rng.random() * width / 8,
+                                rng.random() * height / 8),
+                         QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256), 128))
+    painter.end()
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "JPEG", 90)
+    return bytes(buffer.data())
+
+
+def legacy(data, size):
+    # What ImageResultWidget.load_pixmap did: full decode into a QPixmap and
+    # a smooth scale, all of it on the GUI thread.
+    pixmap = QPixmap()
+    pixmap.loadFromData(data)
+    return pixmap.scaled(size[0], size[1], Qt.AspectRatioMode.KeepAspectRatio,
+                         Qt.TransformationMode.SmoothTransformation)
+
+
+def full_decode(data, size):
+    # The first worker-side version: full QImage decode, then a smooth scale.
+    return QImage.fromData(data).scaled(size[0], size[1], Qt.AspectRatioMode.KeepAspectRatio,
+                                        Qt.TransformationMode.SmoothTransformation)
+
+
+def timed(fn, *args, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thumbnail decoding.")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    app = QApplication.instance() or QApplication(sys.argv)  # noqa: F841  QPixmap needs one
+
+    results = {'thumbnail_size': THUMBNAIL_SIZE, 'sources': {}}
+    for name, (width, height) in SIZES.items():
+        data = make_jpeg(width, height)
+        legacy_ms, _ = timed(legacy, data, THUMBNAIL_SIZE, repeat=args.repeat)
+        full_ms, _ = timed(full_decode, data, THUMBNAIL_SIZE, repeat=args.repeat)
+        reader_ms, image = timed(decode_thumbnail, data, THUMBNAIL_SIZE, repeat=args.repeat)
+        # All that is left on the GUI thread with the worker-side decode.
+        upload_ms, _ = timed(QPixmap.fromImage, image, repeat=args.repeat)
+        results['sources'][name] = {
+            'width': width, 'height': height, 'bytes': len(data),
+            'legacy_gui_ms': legacy_ms,
+            'full_decode_worker_ms': full_ms,
+            'scaled_decode_worker_ms': reader_ms,
+            'gui_thread_ms': upload_ms,
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"median ms per thumbnail, scaled to {THUMBNAIL_SIZE[0]}x{THUMBNAIL_SIZE[1]}")
+    print(f"{'source':>20} | {'before (GUI)':>12} | {'full decode':>11} | {'scaled decode':>13} | {'after (GUI)':>11}")
+    for name, r in results['sources'].items():
+        label = f"{name} {r['width']}x{r['height']}"
+        print(f"{label:>20} | {r['legacy_gui_ms']:12.2f} | {r['full_decode_worker_ms']:11.2f} | "
+              f"{r['scaled_decode_worker_ms']:13.2f} | {r['gui_thread_ms']:11.3f}")
+
+
+if __name__ == "__main__":
+    main()
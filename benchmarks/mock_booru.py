@@ -0,0 +1,272 @@
+# benchmarks/mock_booru.py
+# A local stand-in for yande.re: post.json pages, preview JPEGs and
+# full-size originals, with adjustable latency, bandwidth and error rate.
+#
+#     python benchmarks/mock_booru.py [--port 8790] [--latency-ms 50] [--bandwidth-kbps 0] [--error-rate 0]
+#
+# Prints "listening on http://127.0.0.1:<port>" once ready. The knobs can be
+# changed while it runs with GET /_control?latency_ms=..&error_rate=..;
+# GET /_stats returns request and byte counts.
+import argparse
+import hashlib
+import io
+import json
+import random
+import re
+import sys
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+
+from PIL import Image
+
+TAG_POOL = [f"tag_{i}" for i in range(3000)]
+
+
+def make_jpeg(width, height, quality, seed):
+    # Noise over a gradient, so the file size is close to a real photo's.
+    rng = random.Random(seed)
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    image = Image.blend(image, noise, 0.5)
+    image = Image.merge('RGB', [band.point(lambda v, k=rng.randint(1, 3): (v * k) % 256) for band in image.split()])
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class Catalog:
+    def __init__(self, posts, original_size, preview_size, seed=0):
+        self.posts = posts
+        self.original = make_jpeg(*original_size, quality=92, seed=seed)
+        self.preview = make_jpeg(*preview_size, quality=85, seed=seed + 1)
+        self.original_size = original_size
+        # Every original is the same JPEG plus a per-post trailer after the
+        # end-of-image marker: still decodable, but each has its own md5,
+        # computed by extending a copy of the shared prefix hash.
+        self._original_hash = hashlib.md5(self.original)
+        self._rng_seed = seed
+
+    def trailer(self, post_id):
+        return f"\n{post_id}\n".encode()
+
+    def original_bytes(self, post_id):
+        return self.original + self.trailer(post_id)
+
+    def md5(self, post_id):
+        digest = self._original_hash.copy()
+        digest.update(self.trailer(post_id))
+        return digest.hexdigest()
+
+    def post(self, post_id, base):
+        rng = random.Random(self._rng_seed * 1_000_003 + post_id)
+        tags = rng.sample(TAG_POOL[:400] if rng.random() < 0.7 else TAG_POOL, rng.randint(8, 40))
+        width, height = self.original_size
+        return {
+            'id': post_id,
+            'tags': " ".join(tags),
+            'created_at': 1_700_000_000 + post_id,
+            'creator_id': rng.randint(1, 50_000),
+            'author': f"user{rng.randint(1, 5000)}",
+            'source': f"https://www.pixiv.net/artworks/{rng.randint(1, 10**8)}",
+            'score': rng.randint(0, 500),
+            'md5': self.md5(post_id),
+            'file_size': len(self.original) + len(self.trailer(post_id)),
+            'file_ext': 'jpg',
+            'file_url': f"{base}/image/{post_id}.jpg",
+            'preview_url': f"{base}/preview/{post_id}.jpg",
+            'preview_width': 150,
+            'preview_height': 106,
+            'sample_url': f"{base}/image/{post_id}.jpg",
+            'rating': rng.choice('sqe'),
+            'status': 'active',
+            'width': width,
+            'height': height,
+        }
+
+    def search(self, tags, limit, page):
+        # Newest first. Plain tags filter deterministically on the post id so
+        # different queries return different (but stable) result sets.
+        ids = range(self.posts, 0, -1)
+        for tag in tags:
+            if tag.startswith('id:>'):
+                floor = int(tag[4:])
+                ids = [i for i in ids if i > floor]
+            elif tag.startswith('id:<'):
+                ceiling = int(tag[4:])
+                ids = [i for i in ids if i < ceiling]
+            elif not tag.startswith('-'):
+                modulus = 2 + sum(map(ord, tag)) % 3
+                ids = [i for i in ids if i % modulus]
+        ids = list(ids)
+        return ids[(page - 1) * limit:page * limit]
+
+
+class Settings:
+    def __init__(self, latency_ms=0.0, bandwidth_kbps=0.0, error_rate=0.0, error_code=503):
+        self.latency_ms = latency_ms
+        self.bandwidth_kbps = bandwidth_kbps
+        self.error_rate = error_rate
+        self.error_code = error_code
+
+
+class Stats:
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = {}
+        self.errors = 0
+        self.bytes_sent = 0
+
+    def count(self, kind, sent=0, error=False):
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes_sent += sent
+            self.errors += error
+
+    def snapshot(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'errors': self.errors, 'bytes_sent': self.bytes_sent}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    catalog = None
+    settings = None
+    stats = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def handle_request(self, head):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path == '/_control':
+            for key in ('latency_ms', 'bandwidth_kbps', 'error_rate'):
+                if key in query:
+                    setattr(self.settings, key, float(query[key][0]))
+            if 'error_code' in query:
+                self.settings.error_code = int(query['error_code'][0])
+            return self.send_body(json.dumps(vars(self.settings)).encode(), 'application/json', head)
+        if url.path == '/_stats':
+            return self.send_body(json.dumps(self.stats.snapshot()).encode(), 'application/json', head)
+
+        kind = url.path.split('/')[1] or 'root'
+        if self.settings.latency_ms:
+            time.sleep(self.settings.latency_ms / 1000)
+        if self.settings.error_rate and random.random() < self.settings.error_rate:
+            self.stats.count(kind, error=True)
+            self.send_response(self.settings.error_code)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        match = re.fullmatch(r'/(image|preview)/(\d+)\.jpg', url.path)
+        if url.path == '/post.json':
+            limit = min(int(query.get('limit', ['50'])[0]), 1000)
+            page = max(int(query.get('page', ['1'])[0]), 1)
+            tags = query.get('tags', [''])[0].split()
+            base = f"http://{self.headers.get('Host')}"
+            posts = [self.catalog.post(i, base) for i in self.catalog.search(tags, limit, page)]
+            body = json.dumps(posts).encode()
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self.stats.count(kind)
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            return self.send_body(body, 'application/json', head, kind, extra={'ETag': etag})
+        if match and match.group(1) == 'preview':
+            return self.send_body(self.catalog.preview, 'image/jpeg', head, kind)
+        if match:
+            return self.send_body(self.catalog.original_bytes(int(match.group(2))), 'image/jpeg', head, kind,
+                                  ranges=True)
+        self.stats.count(kind, error=True)
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_body(self, body, content_type, head, kind=None, extra=None, ranges=False):
+        status, start, end = 200, 0, len(body)
+        range_header = self.headers.get('Range') if ranges else None
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header or '')
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) + 1, len(body)) if match.group(2) else len(body)
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(body)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start))
+        if ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end - 1}/{len(body)}")
+        for key, value in (extra or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if head:
+            return
+        view = memoryview(body)[start:end]
+        try:
+            if not self.settings.bandwidth_kbps:
+                self.wfile.write(view)
+            else:
+                # Paced in 16 KiB slices to approximate a per-connection link.
+                chunk = 16 * 1024
+                delay = chunk / (self.settings.bandwidth_kbps * 1024)
+                for offset in range(0, len(view), chunk):
+                    self.wfile.write(view[offset:offset + chunk])
+                    time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        if kind is not None:
+            self.stats.count(kind, sent=end - start)
+
+
+def parse_size(value):
+    width, _, height = value.partition('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock Moebooru API for benchmarks.")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--posts", type=int, default=5000, help="posts in the catalogue")
+    parser.add_argument("--original-size", type=parse_size, default=(2400, 1700))
+    parser.add_argument("--preview-size", type=parse_size, default=(300, 212))
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every response")
+    parser.add_argument("--bandwidth-kbps", type=float, default=0.0, help="per connection, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-code", type=int, default=503)
+    args = parser.parse_args(argv)
+
+    Handler.catalog = Catalog(args.posts, args.original_size, args.preview_size)
+    Handler.settings = Settings(args.latency_ms, args.bandwidth_kbps, args.error_rate, args.error_code)
+    Handler.stats = Stats()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    server.daemon_threads = True
+    print(f"listening on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
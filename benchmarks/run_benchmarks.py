@@ -0,0 +1,317 @@
+# benchmarks/run_benchmarks.py
+# End-to-end benchmarks against benchmarks/mock_booru.py: search latency,
+# thumbnail latency, download throughput per worker count and GUI frame
+# stalls (offscreen Qt). Writes JSON so runs can be compared across commits.
+#
+#     python benchmarks/run_benchmarks.py --output before.json
+#     python benchmarks/run_benchmarks.py --output after.json --baseline before.json
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECTIONS = ('search', 'thumbnails', 'downloads', 'gui')
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = (len(values) - 1) * q / 100
+    low = int(index)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (index - low)
+
+
+def summarize(seconds):
+    ms = [value * 1000 for value in seconds]
+    return {'count': len(ms), 'p50_ms': percentile(ms, 50), 'p95_ms': percentile(ms, 95),
+            'max_ms': max(ms) if ms else None}
+
+
+def start_server(args):
+    command = [sys.executable, os.path.join(ROOT, "benchmarks", "mock_booru.py"), "--port", "0",
+               "--posts", str(args.posts), "--latency-ms", str(args.latency_ms),
+               "--error-rate", str(args.error_rate), "--original-size", args.original_size]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith("listening on "):
+        process.kill()
+        raise RuntimeError(f"mock server did not start: {line!r}")
+    return process, line[len("listening on "):]
+
+
+def control(base, **settings):
+    query = "&".join(f"{key}={value}" for key, value in settings.items())
+    with urllib.request.urlopen(f"{base}/_control?{query}") as response:
+        return json.load(response)
+
+
+def server_stats(base):
+    with urllib.request.urlopen(f"{base}/_stats") as response:
+        return json.load(response)
+
+
+def make_api(base):
+    from konachan_api import KonachanAPI
+    return KonachanAPI(base_url=f"{base}/post.json")
+
+
+def bench_search(base, args):
+    api = make_api(base)
+    cold, first_batch = [], []
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        first = []
+
+        def on_batch(batch):
+            if not first:
+                first.append(time.perf_counter() - start)
+
+        posts, error = api.search_images(f"bench_{i}", "", limit=args.page_size, on_batch=on_batch, use_cache=False)
+        if error:
+            raise RuntimeError(error)
+        cold.append(time.perf_counter() - start)
+        first_batch.append(first[0] if first else cold[-1])
+
+    cached = []
+    api.search_images("bench_cached", "", limit=args.page_size)
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        api.search_images("bench_cached", "", limit=args.page_size)
+        cached.append(time.perf_counter() - start)
+    return {'page_size': args.page_size, 'cold': summarize(cold), 'first_batch': summarize(first_batch),
+            'cached': summarize(cached), 'cache': api.search_cache.stats()}
+
+
+def run_loop(app, until, timeout):
+    # Runs the Qt event loop until until() is true or timeout seconds pass.
+    deadline = time.perf_counter() + timeout
+    while not until() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    return until()
+
+
+def bench_thumbnails(app, base, args):
+    from thumbnail_loader import ThumbnailLoader
+    from ui_elements import THUMBNAIL_SIZE
+
+    posts, error = make_api(base).search_images("thumbs", "", limit=args.page_size, use_cache=False)
+    if error:
+        raise RuntimeError(error)
+    loader = ThumbnailLoader(cache=None)
+    done, failed = [], []
+    loader.thumbnail_ready.connect(lambda ticket, image: done.append(time.perf_counter()))
+    loader.thumbnail_failed.connect(lambda ticket: failed.append(time.perf_counter()))
+    start = time.perf_counter()
+    for post in posts:
+        loader.request(post.preview_url, THUMBNAIL_SIZE)
+    finished = run_loop(app, lambda: len(done) + len(failed) >= len(posts), args.timeout)
+    loader.shutdown()
+    return {
+        'thumbnails': len(posts),
+        'loaded': len(done),
+        'failed': len(failed),
+        'complete': finished,
+        'first_ms': (min(done) - start) * 1000 if done else None,
+        'full_page_ms': (max(done) - start) * 1000 if finished and done else None,
+        'decode': loader.decode_stats(),
+    }
+
+
+def bench_downloads(base, args, workdir):
+    from download_manager import DownloadManager
+
+    api = make_api(base)
+    posts, error = api.search_images("downloads", "", limit=args.downloads, use_cache=False)
+    if error:
+        raise RuntimeError(error)
+    control(base, bandwidth_kbps=args.bandwidth_kbps)
+    runs = []
+    try:
+        for workers in args.workers:
+            folder = os.path.join(workdir, f"downloads_{workers}")
+            os.makedirs(folder)
+            manager = DownloadManager(api, os.path.join(folder, "queue.json"), workers=workers,
+                                      per_host_limit=workers)
+            failures = []
+            manager.on_job_finished = lambda job, success, message: None if success else failures.append(message)
+            for post in posts:
+                manager.enqueue(post.download_url, os.path.join(folder, f"{post.id}.jpg"), file_size=post.file_size,
+                                md5=post.md5, post_id=post.id)
+            start = time.perf_counter()
+            manager.start()
+            manager.wait(args.timeout)
+            elapsed = time.perf_counter() - start
+            manager.stop()
+            total = sum(post.file_size for post in posts)
+            runs.append({'workers': workers, 'files': len(posts), 'failed': len(failures), 'bytes': total,
+                         'seconds': elapsed, 'mb_per_sec': total / elapsed / 1024 / 1024,
+                         'files_per_sec': len(posts) / elapsed})
+    finally:
+        control(base, bandwidth_kbps=0)
+    return {'bandwidth_kbps_per_connection': args.bandwidth_kbps, 'runs': runs}
+
+
+def bench_gui(app, base, args):
+    # A 16 ms timer stands in for the compositor: any gap well beyond 16 ms
+    # between its ticks is a frame the GUI thread could not have drawn.
+    import booru_sources
+    from konachan_api import KonachanAPI
+    from PyQt6.QtCore import QTimer
+
+    booru_sources.SOURCES['yande.re'] = (KonachanAPI, f"{base}/post.json", None)
+    from app_window import ImageSearchApp
+
+    window = ImageSearchApp()
+    window.resize(900, 1000)
+    window.show()
+    ticks = []
+    monitor = QTimer()
+    monitor.setInterval(16)
+    monitor.timeout.connect(lambda: ticks.append(time.perf_counter()))
+    monitor.start()
+
+    start = time.perf_counter()
+    window.search_box.setText("gui")
+    window.search_images()
+    model = window.results_model
+    first_rows = run_loop(app, lambda: model.rowCount() > 0, args.timeout)
+    first_rows_ms = (time.perf_counter() - start) * 1000 if first_rows else None
+    run_loop(app, lambda: window.has_more_pages or window.status_label.text().startswith("Found"), args.timeout)
+
+    scrollbar = window.results_view.verticalScrollBar()
+    scroll_end = time.perf_counter() + args.scroll_seconds
+
+    def scroll():
+        scrollbar.setValue(scrollbar.value() + args.scroll_step)
+
+    scroller = QTimer()
+    scroller.setInterval(16)
+    scroller.timeout.connect(scroll)
+    scroller.start()
+    run_loop(app, lambda: time.perf_counter() >= scroll_end, args.scroll_seconds + 1)
+    scroller.stop()
+    monitor.stop()
+    rows = model.rowCount()
+    window.close()
+    # Let in-flight thumbnail fetches finish before the server goes away.
+    window.thumbnail_loader.executor.shutdown(wait=True)
+    window.thumbnail_loader.decoder.shutdown(wait=True)
+
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    return {
+        'first_rows_ms': first_rows_ms,
+        'rows_loaded': rows,
+        'frames': len(ticks),
+        'frame_gap': summarize(gaps),
+        'stalls_over_50ms': sum(gap > 0.05 for gap in gaps),
+        'stalls_over_100ms': sum(gap > 0.1 for gap in gaps),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, path=()):
+    # Prints every numeric value that changed, with the relative difference.
+    if isinstance(results, dict) and isinstance(baseline, dict):
+        for key, value in results.items():
+            if key in baseline:
+                compare(value, baseline[key], path + (key,))
+    elif isinstance(results, list) and isinstance(baseline, list):
+        for i, (value, old) in enumerate(zip(results, baseline)):
+            compare(value, old, path + (str(i),))
+    elif (isinstance(results, (int, float)) and isinstance(baseline, (int, float))
+          and not isinstance(results, bool) and results != baseline):
+        change = f"{(results - baseline) / baseline * 100:+.1f}%" if baseline else "new"
+        print(f"{'.'.join(path):<50} {baseline:>12.3f} -> {results:>12.3f}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the konadl benchmarks against a local mock booru.")
+    parser.add_argument("--only", default=",".join(SECTIONS), help=f"comma-separated subset of {', '.join(SECTIONS)}")
+    parser.add_argument("--output", help="write results to this JSON file (default: stdout)")
+    parser.add_argument("--baseline", help="print the differences from an earlier results file")
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10, help="search repetitions")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="server latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests the server fails")
+    parser.add_argument("--original-size", default="2400x1700")
+    parser.add_argument("--downloads", type=int, default=24, help="originals per download run")
+    parser.add_argument("--workers", default="1,2,4,8", help="download worker counts to compare")
+    parser.add_argument("--bandwidth-kbps", type=float, default=4096, help="per-connection bandwidth for downloads")
+    parser.add_argument("--scroll-seconds", type=float, default=5.0)
+    parser.add_argument("--scroll-step", type=int, default=60, help="pixels per 16 ms scroll tick")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    args.workers = [int(value) for value in args.workers.split(",")]
+    sections = [section.strip() for section in args.only.split(",") if section.strip()]
+
+    # Keep the app's config, caches and downloads out of the real home directory.
+    workdir = tempfile.mkdtemp(prefix="konadl-bench-")
+    os.environ["HOME"] = workdir
+    os.environ["XDG_CONFIG_HOME"] = os.path.join(workdir, ".config")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    app = None
+    if {'thumbnails', 'gui'} & set(sections):
+        from PyQt6.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication(sys.argv)
+
+    process, base = start_server(args)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'server': {'posts': args.posts, 'latency_ms': args.latency_ms, 'error_rate': args.error_rate,
+                       'original_size': args.original_size},
+        },
+    }
+    try:
+        if 'search' in sections:
+            results['search'] = bench_search(base, args)
+        if 'thumbnails' in sections:
+            results['thumbnails'] = bench_thumbnails(app, base, args)
+        if 'downloads' in sections:
+            results['downloads'] = bench_downloads(base, args, workdir)
+        if 'gui' in sections:
+            results['gui'] = bench_gui(app, base, args)
+        results['meta']['server']['stats'] = server_stats(base)
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# booru_sources.py
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from konachan_api import KonachanAPI, SEARCH_SUPERSEDED
+from post import Post, PostPage, page_is_full, page_max_id
+from transport import TransportAdapter
+
+
+class DanbooruAPI(KonachanAPI):
+    NAME = "danbooru"
+    BASE_URL = "https://danbooru.donmai.us/posts.json"
+    # Danbooru refuses page sizes above 200, and more than two tags per
+    # query for anonymous and basic accounts.
+    MAX_LIMIT = 200
+    MAX_TAGS = 2
+
+    def post_from_json(self, data):
+        return Post.from_danbooru_json(data, source=None if self.primary else self.name)
+
+
+# name -> (backend class, search endpoint, default requests per second)
+SOURCES = {
+    "yande.re": (KonachanAPI, "https://yande.re/post.json", 2),
+    "konachan": (KonachanAPI, "https://konachan.com/post.json", 2),
+    "danbooru": (DanbooruAPI, "https://danbooru.donmai.us/posts.json", 5),
+}
+
+
+def create_source(name, primary=True, rate_limit=None, **kwargs):
+    try:
+        backend, base_url, default_rate = SOURCES[name]
+    except KeyError:
+        raise ValueError(f"Unknown source {name!r}, expected one of: {', '.join(SOURCES)}")
+    return backend(name=name, base_url=base_url, rate_limit=rate_limit or default_rate, primary=primary, **kwargs)
+
+
+def create_sources(specs, transport=None, **kwargs):
+    # specs is [(name, rate_limit), ...]; the first source is the primary one.
+    # All sources share one transport, so each host has one rate limiter and
+    # one circuit breaker however many places talk to it.
+    transport = transport or TransportAdapter()
+    return FanOutSearch(create_source(name, primary=i == 0, rate_limit=rate, transport=transport, **kwargs)
+                        for i, (name, rate) in enumerate(specs))
+
+
+class FanOutSearch:
+    # Sends the same query to every source at once, so a search takes as
+    # long as the slowest source rather than the sum of them all.
+    def __init__(self, backends):
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("At least one source is required.")
+        self.primary = self.backends[0]
+
+    def _fan_out(self, backends, tags, excluded_tags, limit, page, on_batch, should_stop, seen_md5, use_cache):
+        # Posts are merged in the order they arrive. A post whose md5 was
+        # already seen (cross-posted to another source) is dropped.
+        seen = set() if seen_md5 is None else seen_md5
+        merged = []
+        lock = Lock()
+
+        def accept(batch):
+            with lock:
+                fresh = []
+                for post in batch:
+                    if post.md5:
+                        if post.md5 in seen:
+                            continue
+                        seen.add(post.md5)
+                    fresh.append(post)
+                merged.extend(fresh)
+                if fresh and on_batch is not None:
+                    on_batch(fresh)
+
+        with ThreadPoolExecutor(max_workers=len(backends)) as executor:
+            futures = {
+                backend: executor.submit(backend.search_images, tags, excluded_tags, limit=limit, page=page,
+                                         on_batch=accept, should_stop=should_stop, use_cache=use_cache)
+                for backend in backends
+            }
+        return merged, {backend: future.result() for backend, future in futures.items()}
+
+    def _errors(self, results, on_error):
+        errors = []
+        for backend, (_, error) in results.items():
+            if error:
+                errors.append(error if error == SEARCH_SUPERSEDED else f"{backend.name}: {error}")
+        if errors and len(errors) == len(results):
+            return SEARCH_SUPERSEDED if SEARCH_SUPERSEDED in errors else "; ".join(errors)
+        if on_error is not None:
+            for backend, (_, error) in results.items():
+                if error and error != SEARCH_SUPERSEDED:
+                    on_error(backend.name, error)
+        return None
+
+    def search(self, tags, excluded_tags, limit=50, page=1, on_batch=None, should_stop=None, seen_md5=None,
+               on_error=None, use_cache=True):
+        # Same contract as KonachanAPI.search_images. error is only set when
+        # every source failed; on_error(name, message) hears about the rest.
+        merged, results = self._fan_out(self.backends, tags, excluded_tags, limit, page, on_batch, should_stop,
+                                        seen_md5, use_cache)
+        error = self._errors(results, on_error)
+        if error:
+            return None, error
+        return self._page(merged, results), None
+
+    @staticmethod
+    def _page(merged, results):
+        # More pages exist while any source sent a full one, however many of
+        # its posts were filtered out or were duplicates.
+        pages = [posts for posts, _ in results.values() if posts is not None]
+        return PostPage(merged, fetched=max((getattr(posts, 'fetched', len(posts)) for posts in pages), default=0),
+                        max_id=max((page_max_id(posts) for posts in pages), default=0))
+
+    def iter_pages(self, tags, excluded_tags, limit=50, start_page=1, end_page=None, on_error=None, use_cache=True):
+        # Like KonachanAPI.iter_pages. A source drops out once it runs out of
+        # posts or fails; iteration ends when none are left.
+        active = list(self.backends)
+        seen = set()
+        page = start_page
+        while active and (end_page is None or page <= end_page):
+            merged, results = self._fan_out(active, tags, excluded_tags, limit, page, None, None, seen, use_cache)
+            error = self._errors(results, on_error)
+            if error:
+                yield page, None, error
+                return
+            yield page, self._page(merged, results), None
+            active = [backend for backend, (posts, error) in results.items()
+                      if not error and page_is_full(posts, min(limit, backend.MAX_LIMIT))]
+            page += 1
@@ -0,0 +1,393 @@
+# cli.py
+# Headless entry point.
+import argparse
+import json
+import os
+import sys
+
+from config_manager import ConfigManager
+
+
+def parse_page_range(value):
+    # "3" -> (3, 3), "2-5" -> (2, 5), "4-" -> (4, None)
+    start, sep, end = value.partition("-")
+    try:
+        start = int(start) if start else 1
+        end = (int(end) if end else None) if sep else start
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid page range: {value!r}")
+    if start < 1 or (end is not None and end < start):
+        raise argparse.ArgumentTypeError(f"invalid page range: {value!r}")
+    return start, end
+
+
+def parse_tag_filter(value):
+    from tag_filter import TagFilter
+
+    try:
+        return TagFilter([value])
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser(config):
+    parser = argparse.ArgumentParser(prog="konadl", description="Search and download images from Moebooru and Danbooru sites.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    search = subparsers.add_parser("search", help="list matching posts as JSON lines and download them")
+    search.add_argument("tags", nargs="*", help="tags to search for")
+    search.add_argument("-x", "--exclude", default=None,
+                        help="comma-separated tags to exclude (default: autoexclude_tags from config.ini)")
+    search.add_argument("--no-autoexclude", action="store_true", help="do not apply the configured autoexclude tags")
+    search.add_argument("-f", "--filter", type=parse_tag_filter, default=None, metavar="EXPR",
+                        help="only keep posts matching EXPR, e.g. '( cat or dog ) -sketch rating:s score:>10'; "
+                             "applied locally, also with --offline")
+    search.add_argument("-s", "--source", action="append", default=None,
+                        help="source to search, repeat for several (default: [Sources] enabled in config.ini)")
+    search.add_argument("-p", "--pages", type=parse_page_range, default=(1, 1),
+                        help="page or page range, e.g. 1, 2-5 or 3- for every page from 3 (default: 1)")
+    search.add_argument("-l", "--limit", type=int, default=config.get_page_size(), help="posts per page")
+    search.add_argument("-m", "--max-posts", type=int, default=None, help="stop after this many posts")
+    search.add_argument("-o", "--output", default=config.get_download_folder(), help="download directory")
+    search.add_argument("-j", "--workers", type=int, default=config.get_download_workers(),
+                        help="concurrent downloads")
+    search.add_argument("--per-host", type=int, default=config.get_per_host_limit(),
+                        help="concurrent downloads per host")
+    search.add_argument("-t", "--template", default=None,
+                        help="filename template using {id}, {md5}, {ext}, {author}, {source}, {counter} "
+                             "(default: from config.ini)")
+    search.add_argument("-n", "--dry-run", action="store_true", help="only list posts, do not download")
+    search.add_argument("--offline", action="store_true",
+                        help="answer from the local post index only (implies --dry-run)")
+    search.add_argument("--metrics", default=None, metavar="FILE",
+                        help="write request timings and transfer stats to FILE when done "
+                             "(.prom for Prometheus text, otherwise JSON)")
+
+    scan = subparsers.add_parser("scan", help="hash an existing download folder into the download ledger")
+    scan.add_argument("folder", nargs="?", default=config.get_download_folder(), help="folder to scan")
+    scan.add_argument("-j", "--workers", type=int, default=None, help="hashing threads (default: CPU count)")
+
+    process = subparsers.add_parser("process", help="run the [PostProcess] pipeline over images or folders")
+    process.add_argument("paths", nargs="+", help="image files or folders")
+    process.add_argument("-j", "--workers", type=int, default=config.get_post_process_workers(),
+                         help="worker processes (default: CPU count)")
+
+    watch = subparsers.add_parser("watch", help="poll the [Subscriptions] queries and download new posts")
+    watch.add_argument("--once", action="store_true", help="poll once, wait for the downloads and exit")
+    watch.add_argument("-i", "--interval", type=float, default=None,
+                       help="minutes between polls (default: [Watch] interval_minutes)")
+    watch.add_argument("-o", "--output", default=config.get_download_folder(), help="download directory")
+    watch.add_argument("-j", "--workers", type=int, default=config.get_download_workers(), help="concurrent downloads")
+    watch.add_argument("--per-host", type=int, default=config.get_per_host_limit(),
+                       help="concurrent downloads per host")
+
+    sync = subparsers.add_parser("sync", help="fetch posts newer than the last sync into the local index")
+    sync.add_argument("tags", nargs="*", help="tags to sync")
+    sync.add_argument("-x", "--exclude", default=None, help="comma-separated tags to exclude")
+    sync.add_argument("--no-autoexclude", action="store_true", help="do not apply the configured autoexclude tags")
+    sync.add_argument("-m", "--max-posts", type=int, default=1000, help="stop after this many new posts")
+    return parser
+
+
+def emit(record):
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+def iter_posts(sources, args, excluded, index):
+    start, end = args.pages
+    count = 0
+
+    def on_error(name, error):
+        print(f"{name} failed: {error}", file=sys.stderr)
+
+    for page, posts, error in sources.iter_pages(" ".join(args.tags), excluded, limit=args.limit,
+                                                 start_page=start, end_page=end, on_error=on_error):
+        if error:
+            print(f"Page {page} failed: {error}", file=sys.stderr)
+            return
+        index.add_posts([post for post in posts if post.source is None])
+        for post in posts:
+            if args.filter is not None and not args.filter.matches(post):
+                continue
+            if args.max_posts is not None and count >= args.max_posts:
+                return
+            count += 1
+            yield post
+
+
+def excluded_tags(args, config):
+    excluded = "" if args.no_autoexclude else config.get_autoexclude_tags()
+    if args.exclude:
+        excluded = ",".join(filter(None, [excluded, args.exclude]))
+    return excluded
+
+
+def run_offline_search(args, config, excluded):
+    from post_index import PostIndex, split_query
+    from tag_filter import compile_blacklist
+
+    query = split_query(" ".join(args.tags), excluded)
+    if query is None:
+        print("Meta tags cannot be answered from the local index.", file=sys.stderr)
+        return 2
+    # The limit is applied after filtering, which the index cannot do.
+    posts = PostIndex(config.get_index_path()).query(*query)
+    posts = compile_blacklist(excluded or "").filter(posts)
+    if args.filter is not None:
+        posts = args.filter.select(posts)
+    for post in posts[:args.max_posts]:
+        emit({'type': 'post', **post.to_dict()})
+    return 0
+
+
+def run_scan(args, config):
+    from download_ledger import DownloadLedger
+    from post_index import PostIndex
+
+    index = PostIndex(config.get_index_path())
+    count = DownloadLedger(config.get_ledger_path()).scan_folder(args.folder, resolve_md5=index.find_by_md5,
+                                                                 workers=args.workers)
+    emit({'type': 'scan', 'folder': os.path.abspath(args.folder), 'recorded': count})
+    return 0
+
+
+def create_post_processor(config, workers=None):
+    # Raises ValueError if Pillow is missing or [PostProcess] is invalid.
+    from post_process import PostProcessor
+    return PostProcessor(config.get_post_process_options(), workers=workers)
+
+
+def run_process(args, config):
+    from download_ledger import IMAGE_EXTENSIONS
+
+    try:
+        processor = create_post_processor(config, args.workers)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    suffix = "." + processor.options['suffix']
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                paths.extend(os.path.join(root, name) for name in sorted(files))
+        else:
+            paths.append(path)
+    # Skip our own outputs so running twice does not process them again.
+    paths = [path for path in paths if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+             and not os.path.splitext(path)[0].endswith(suffix)]
+
+    failed = 0
+    try:
+        for result in processor.process_batch(paths):
+            failed += bool(result['error'])
+            emit({'type': 'processed', **result})
+    finally:
+        processor.shutdown()
+    return 1 if failed else 0
+
+
+def run_sync(args, config):
+    from booru_sources import create_source
+    from post_index import PostIndex
+    from transport import TransportAdapter
+
+    # The local index holds posts of the primary source only.
+    name, rate = config.get_sources()[0]
+    try:
+        api = create_source(name, rate_limit=rate, transport=TransportAdapter(**config.get_network_options()))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    tags, excluded = " ".join(args.tags), excluded_tags(args, config)
+    index = PostIndex(config.get_index_path())
+    added, error = index.sync(api, tags, excluded, max_posts=args.max_posts)
+    emit({'type': 'sync', 'query': index.sync_key(tags, excluded), 'added': len(added),
+          'complete': not index.sync_pending(tags, excluded), 'indexed': index.count(), 'error': error})
+    return 1 if error else 0
+
+
+def run_watch(args, config):
+    from threading import Event
+    from booru_sources import create_source
+    from download_manager import DownloadManager
+    from download_ledger import DownloadLedger, FilenameTemplate
+    from post_index import PostIndex
+    from subscriptions import SubscriptionWatcher
+    from transport import TransportAdapter
+
+    subscriptions = config.get_subscriptions()
+    if not subscriptions:
+        print("No subscriptions; add \"<name> = <tags>\" lines under [Subscriptions] in config.ini.", file=sys.stderr)
+        return 2
+    # Watermarks are post ids, so subscriptions follow the primary source.
+    name, rate = config.get_sources()[0]
+    transport = TransportAdapter(pool_maxsize=args.workers * config.get_download_segments() + 2,
+                                 **config.get_network_options())
+    try:
+        api = create_source(name, rate_limit=rate, transport=transport,
+                            download_segments=config.get_download_segments(),
+                            download_retries=config.get_download_retries())
+        template = FilenameTemplate(config.get_filename_template())
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    index = PostIndex(config.get_index_path())
+    ledger = DownloadLedger(config.get_ledger_path())
+    os.makedirs(args.output, exist_ok=True)
+    manager = DownloadManager(api, config.get_download_queue_path("watch_download_queue.json"),
+                              workers=args.workers, per_host_limit=args.per_host, ledger=ledger)
+    watcher = SubscriptionWatcher(api, subscriptions, config.get_autoexclude_tags(),
+                                  config.get_subscription_state_path(), **config.get_watch_options())
+    failures = []
+
+    def on_job_finished(job, success, message):
+        if not success:
+            failures.append(job)
+        elif job.get('post_id') is not None:
+            index.mark_downloaded(job['post_id'])
+        emit({'type': 'download', 'path': job['save_path'], 'url': job['url'],
+              'status': 'ok' if success else 'failed', 'message': message})
+
+    def on_post(name, post):
+        emit({'type': 'post', 'subscription': name, **post.to_dict()})
+        manager.enqueue(post.download_url, template.save_path(args.output, post, ledger),
+                        file_size=post.file_size, md5=post.md5, post_id=post.local_id)
+
+    def on_cycle(results):
+        for name, posts, error in results:
+            index.add_posts(posts)
+            emit({'type': 'subscription', 'name': name, 'new': len(posts), 'error': error})
+            if error:
+                failures.append(name)
+
+    manager.on_job_finished = on_job_finished
+    manager.start()
+    try:
+        if args.once:
+            on_cycle(watcher.poll(on_post))
+            manager.wait()
+        else:
+            interval = args.interval * 60 if args.interval else config.get_watch_interval()
+            watcher.run(interval, Event(), on_post, on_cycle)
+    except KeyboardInterrupt:
+        # Queued downloads are saved and resumed by the next run.
+        manager.stop()
+        return 130
+    manager.stop()
+    return 1 if failures else 0
+
+
+def run_search(args, config):
+    from booru_sources import create_sources
+    from transport import TransportAdapter
+
+    excluded = excluded_tags(args, config)
+    if args.offline:
+        return run_offline_search(args, config, excluded)
+
+    specs = [(name, None) for name in args.source] if args.source else config.get_sources()
+    transport = TransportAdapter(pool_maxsize=args.workers * config.get_download_segments() + 2 * len(specs),
+                                 **config.get_network_options())
+    try:
+        sources = create_sources(specs, transport=transport, download_segments=config.get_download_segments(),
+                                 download_retries=config.get_download_retries())
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    try:
+        return search_and_download(args, config, sources, excluded)
+    finally:
+        if args.metrics:
+            try:
+                transport.metrics.export(args.metrics)
+            except OSError as e:
+                print(f"Could not write metrics to {args.metrics}: {e}", file=sys.stderr)
+
+
+def search_and_download(args, config, sources, excluded):
+    from download_manager import DownloadManager
+    from download_ledger import DownloadLedger, FilenameTemplate
+    from post_index import PostIndex
+
+    api = sources.primary
+    index = PostIndex(config.get_index_path())
+    if args.dry_run:
+        for post in iter_posts(sources, args, excluded, index):
+            emit({'type': 'post', **post.to_dict()})
+        return 0
+
+    try:
+        template = FilenameTemplate(args.template or config.get_filename_template())
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    ledger = DownloadLedger(config.get_ledger_path())
+    os.makedirs(args.output, exist_ok=True)
+    manager = DownloadManager(api, config.get_download_queue_path("cli_download_queue.json"),
+                              workers=args.workers, per_host_limit=args.per_host, ledger=ledger)
+    failures = []
+
+    def on_job_finished(job, success, message):
+        if not success:
+            failures.append(job)
+        elif job.get('post_id') is not None:
+            index.mark_downloaded(job['post_id'])
+        emit({'type': 'download', 'path': job['save_path'], 'url': job['url'],
+              'status': 'ok' if success else 'failed', 'message': message})
+        if success and processor is not None:
+            processor.submit(job['save_path'], on_processed)
+
+    processor = None
+    if config.get_post_process_enabled():
+        try:
+            processor = create_post_processor(config, config.get_post_process_workers())
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    def on_processed(result):
+        emit({'type': 'processed', **result})
+
+    manager.on_job_finished = on_job_finished
+    manager.start()
+    try:
+        for post in iter_posts(sources, args, excluded, index):
+            post.downloaded = bool(ledger.lookup(post_id=post.local_id, md5=post.md5))
+            emit({'type': 'post', **post.to_dict()})
+            if post.downloaded:
+                continue
+            manager.enqueue(post.download_url, template.save_path(args.output, post, ledger),
+                            file_size=post.file_size, md5=post.md5, post_id=post.local_id)
+        manager.wait()
+    except KeyboardInterrupt:
+        # The queue is saved, so the next run picks up the remaining posts.
+        manager.stop()
+        if processor is not None:
+            processor.shutdown()
+        return 130
+    manager.stop()
+    if processor is not None:
+        processor.shutdown(wait=True)
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    config = ConfigManager()
+    args = build_parser(config).parse_args(argv)
+    if args.command == "search":
+        return run_search(args, config)
+    if args.command == "sync":
+        return run_sync(args, config)
+    if args.command == "watch":
+        return run_watch(args, config)
+    if args.command == "scan":
+        return run_scan(args, config)
+    if args.command == "process":
+        return run_process(args, config)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,9 @@
 # config_manager.py
 import configparser
+import io
 import os
-from PyQt6.QtGui import QColor
+
+from atomic_file import write_atomic
 
 class ConfigManager:
     def __init__(self, app_name="konadl"):
@@ -15,7 +17,8 @@ class ConfigManager:
 
     def load_config(self):
         self.config.read(self.config_path)
-        
+        sections = set(self.config.sections())
+
         # Set default values if not present
         if "General" not in self.config:
             self.config["General"] = {
@@ -24,20 +27,102 @@ class ConfigManager:
                 "autoexclude_tags": "loli,shota,young",
                 "app_width": "800",
                 "app_height": "900",
-                "app_opacity": "1.0"
+                "app_opacity": "1.0",
+                "page_size": "50"
+            }
+
+        if "Downloads" not in self.config:
+            self.config["Downloads"] = {
+                "workers": "4",
+                "per_host_limit": "2",
+                "segments": "1",
+                "retries": "5",
+                "filename_template": "{counter}{ext}"
             }
         
+        if "Cache" not in self.config:
+            self.config["Cache"] = {
+                "memory_mb": "64",
+                "disk_mb": "256",
+                "max_age_hours": "24",
+                "search_ttl_seconds": "300"
+            }
+
+        if "Network" not in self.config:
+            # warm_up opens connections to the sources in the background
+            # right after startup, so the first search skips the handshakes.
+            self.config["Network"] = {
+                "connect_timeout": "10",
+                "read_timeout": "30",
+                "retries": "3",
+                "breaker_failures": "5",
+                "breaker_reset_seconds": "30",
+                "warm_up": "true"
+            }
+
+        if "PostProcess" not in self.config:
+            # Runs on each finished download when enabled. stages is any of
+            # fit, transcode, strip, palette; outputs are written next to the
+            # original as <name>.<suffix>.<ext>.
+            self.config["PostProcess"] = {
+                "enabled": "false",
+                "stages": "fit, transcode, strip, palette",
+                "size": "1920x1080",
+                "fit_mode": "crop",
+                "format": "webp",
+                "quality": "85",
+                "palette_colors": "8",
+                "suffix": "wallpaper",
+                "workers": "0"
+            }
+
+        if "Sources" not in self.config:
+            # Comma-separated; the first source is the primary one. A
+            # "<name>_rate" key overrides that source's requests per second.
+            self.config["Sources"] = {
+                "enabled": "yande.re"
+            }
+
+        if "Subscriptions" not in self.config:
+            # One saved query per line, "<name> = <tags>"; the autoexclude
+            # tags are applied to each.
+            self.config["Subscriptions"] = {}
+
+        if "Watch" not in self.config:
+            # Polling of [Subscriptions]. The GUI polls while enabled is true;
+            # cli.py watch always does. initial_posts is how many existing
+            # posts a new subscription downloads on its first poll.
+            self.config["Watch"] = {
+                "enabled": "false",
+                "interval_minutes": "30",
+                "poll_limit": "20",
+                "initial_posts": "0",
+                "max_posts": "200"
+            }
+
+        if "Metrics" not in self.config:
+            # export_path, if set, is rewritten every export_interval_seconds;
+            # a .prom or .txt extension selects the Prometheus text format.
+            self.config["Metrics"] = {
+                "export_path": "",
+                "export_interval_seconds": "15"
+            }
+
         if "Colors" not in self.config:
             self.config["Colors"] = {
                 "background": "#f0f0f0",
                 "button": "#007BFF"
             }
-            
-        self.save_config()
+
+        # Only written when a section had to be added, so a normal start
+        # never rewrites (or races with edits to) the user's file.
+        if set(self.config.sections()) != sections:
+            self.save_config()
 
     def save_config(self):
-        with open(self.config_path, 'w') as config_file:
-            self.config.write(config_file)
+        text = io.StringIO()
+        self.config.write(text)
+        write_atomic(self.config_path, text.getvalue())
 
     def get_setting(self, section, key):
         try:
@@ -61,13 +146,13 @@ class ConfigManager:
     def get_autoexclude_tags(self):
         return self.get_setting("General", "autoexclude_tags")
         
+    # Colours are returned as strings so this module stays free of Qt;
+    # the GUI validates them when it builds its QColors.
     def get_background_color(self):
-        color_hex = self.get_setting("Colors", "background")
-        return QColor(color_hex) if QColor(color_hex).isValid() else QColor("#f0f0f0")
+        return self.get_setting("Colors", "background") or "#f0f0f0"
     
     def get_button_color(self):
-        color_hex = self.get_setting("Colors", "button")
-        return QColor(color_hex) if QColor(color_hex).isValid() else QColor("#007BFF")
+        return self.get_setting("Colors", "button") or "#007BFF"
         
     def get_app_size(self):
         width = int(self.get_setting("General", "app_width"))
@@ -75,4 +160,117 @@ class ConfigManager:
         return width, height
         
     def get_app_opacity(self):
-        return float(self.get_setting("General", "app_opacity"))
\ No newline at end of file
+        return float(self.get_setting("General", "app_opacity"))
+
+    def get_page_size(self):
+        return max(1, int(self.get_setting("General", "page_size") or 50))
+
+    def get_download_workers(self):
+        return max(1, int(self.get_setting("Downloads", "workers") or 4))
+
+    def get_per_host_limit(self):
+        return max(1, int(self.get_setting("Downloads", "per_host_limit") or 2))
+
+    def get_download_segments(self):
+        return max(1, int(self.get_setting("Downloads", "segments") or 1))
+
+    def get_download_retries(self):
+        return max(0, int(self.get_setting("Downloads", "retries") or 5))
+
+    def get_cache_dir(self):
+        return os.path.join(os.path.expanduser("~"), ".cache", "konadl")
+
+    def get_data_dir(self):
+        return os.path.join(os.path.expanduser("~"), ".local", "share", "konadl")
+
+    def get_index_path(self):
+        return os.path.join(self.get_data_dir(), "posts.sqlite3")
+
+    def get_ledger_path(self):
+        return os.path.join(self.get_data_dir(), "downloads.sqlite3")
+
+    def get_filename_template(self):
+        return self.get_setting("Downloads", "filename_template") or "{counter}{ext}"
+
+    def get_cache_limits(self):
+        memory_mb = float(self.get_setting("Cache", "memory_mb") or 64)
+        disk_mb = float(self.get_setting("Cache", "disk_mb") or 256)
+        max_age_hours = float(self.get_setting("Cache", "max_age_hours") or 24)
+        return int(memory_mb * 1024 * 1024), int(disk_mb * 1024 * 1024), max_age_hours * 3600
+
+    def get_search_ttl(self):
+        return float(self.get_setting("Cache", "search_ttl_seconds") or 300)
+
+    def get_sources(self):
+        names = [name.strip() for name in (self.get_setting("Sources", "enabled") or "yande.re").split(",")]
+        sources = []
+        for name in filter(None, names):
+            rate = self.get_setting("Sources", f"{name}_rate")
+            sources.append((name, float(rate) if rate else None))
+        return sources or [("yande.re", None)]
+
+    def get_network_options(self):
+        # Keyword arguments for transport.TransportAdapter.
+        connect_timeout = float(self.get_setting("Network", "connect_timeout") or 10)
+        read_timeout = float(self.get_setting("Network", "read_timeout") or 30)
+        return {
+            "timeout": (connect_timeout, read_timeout),
+            "max_retries": max(0, int(self.get_setting("Network", "retries") or 3)),
+            "breaker_threshold": max(0, int(self.get_setting("Network", "breaker_failures") or 5)),
+            "breaker_reset": float(self.get_setting("Network", "breaker_reset_seconds") or 30),
+        }
+
+    def get_warm_up(self):
+        return (self.get_setting("Network", "warm_up") or "true").strip().lower() in ("1", "true", "yes", "on")
+
+    def get_post_process_enabled(self):
+        return (self.get_setting("PostProcess", "enabled") or "false").strip().lower() in ("1", "true", "yes", "on")
+
+    def get_post_process_options(self):
+        # Raises ValueError for a malformed size.
+        stages = self.get_setting("PostProcess", "stages") or "fit, transcode, strip, palette"
+        size = (self.get_setting("PostProcess", "size") or "1920x1080").lower().split("x")
+        if len(size) != 2:
+            raise ValueError(f"Invalid post-processing size {'x'.join(size)!r}, expected e.g. 1920x1080")
+        return {
+            "stages": [stage.strip() for stage in stages.split(",") if stage.strip()],
+            "size": (int(size[0]), int(size[1])),
+            "fit_mode": self.get_setting("PostProcess", "fit_mode") or "crop",
+            "format": (self.get_setting("PostProcess", "format") or "webp").lower(),
+            "quality": int(self.get_setting("PostProcess", "quality") or 85),
+            "palette_colors": int(self.get_setting("PostProcess", "palette_colors") or 8),
+            "suffix": self.get_setting("PostProcess", "suffix") or "",
+        }
+
+    def get_post_process_workers(self):
+        return int(self.get_setting("PostProcess", "workers") or 0) or None
+
+    def get_subscriptions(self):
+        if "Subscriptions" not in self.config:
+            return []
+        return [(name, tags.strip()) for name, tags in self.config["Subscriptions"].items() if tags.strip()]
+
+    def get_watch_enabled(self):
+        return (self.get_setting("Watch", "enabled") or "false").strip().lower() in ("1", "true", "yes", "on")
+
+    def get_watch_interval(self):
+        return max(1.0, float(self.get_setting("Watch", "interval_minutes") or 30)) * 60
+
+    def get_watch_options(self):
+        # Keyword arguments for subscriptions.SubscriptionWatcher.
+        return {
+            "poll_limit": max(1, int(self.get_setting("Watch", "poll_limit") or 20)),
+            "initial_posts": max(0, int(self.get_setting("Watch", "initial_posts") or 0)),
+            "max_posts": max(1, int(self.get_setting("Watch", "max_posts") or 200)),
+        }
+
+    def get_subscription_state_path(self):
+        return os.path.join(self.get_data_dir(), "subscriptions.json")
+
+    def get_metrics_export(self):
+        path = (self.get_setting("Metrics", "export_path") or "").strip()
+        interval = float(self.get_setting("Metrics", "export_interval_seconds") or 15)
+        return (os.path.expanduser(path) if path else None), max(1.0, interval)
+
+    def get_download_queue_path(self, name="download_queue.json"):
+        return os.path.join(os.path.dirname(self.config_path), name)
\ No newline at end of file
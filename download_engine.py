@@ -0,0 +1,249 @@
+# download_engine.py
+import hashlib
+import json
+import os
+import time
+from threading import Thread, Lock
+
+import requests
+
+from metrics import Metrics
+from transport import CircuitOpenError, backoff_delay
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadCancelled(DownloadError):
+    pass
+
+
+class DownloadEngine:
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, session, timeout=(10, 30), max_retries=5, backoff=1.0,
+                 segments=1, segment_threshold=16 * 1024 * 1024, metrics=None):
+        self.session = session
+        self.metrics = metrics or Metrics()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+
+    def download(self, url, save_path, expected_size=None, md5=None, progress=None, cancel_event=None):
+        with self.metrics.track("download_seconds", in_flight="downloads_in_flight"):
+            return self._download(url, save_path, expected_size, md5, progress, cancel_event)
+
+    def _download(self, url, save_path, expected_size, md5, progress, cancel_event):
+        # Data goes to <save_path>.part and is only renamed into place once it
+        # has been fully received and verified.
+        part_path = save_path + ".part"
+        state_path = part_path + ".json"
+
+        total = expected_size
+        large = self.segments > 1 and (expected_size is None or expected_size >= self.segment_threshold)
+        if os.path.exists(state_path) or large:
+            ranged_size = self._probe_size(url)
+            if ranged_size is not None and (os.path.exists(state_path) or ranged_size >= self.segment_threshold):
+                total = ranged_size
+                self._download_segmented(url, part_path, total, progress, cancel_event)
+                self._verify(part_path, total, md5)
+                os.replace(part_path, save_path)
+                return save_path
+            if os.path.exists(state_path):
+                # Leftover from a segmented attempt that can no longer be continued.
+                os.remove(state_path)
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+        total = self._download_stream(url, part_path, total, progress, cancel_event)
+        self._verify(part_path, total, md5)
+        os.replace(part_path, save_path)
+        return save_path
+
+    def _check_cancel(self, cancel_event, part_path):
+        if cancel_event is not None and cancel_event.is_set():
+            for path in (part_path, part_path + ".json"):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise DownloadCancelled("Download cancelled.")
+
+    def _is_permanent(self, error):
+        # Client errors other than timeouts and throttling will not go away on
+        # retry, and neither will a host whose circuit breaker is open.
+        if isinstance(error, CircuitOpenError):
+            return True
+        response = getattr(error, 'response', None)
+        return response is not None and 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+    def _sleep_before_retry(self, attempt):
+        time.sleep(backoff_delay(attempt, self.backoff))
+
+    def _probe_size(self, url):
+        try:
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+        if response.headers.get('Accept-Ranges', '').lower() != 'bytes':
+            return None
+        length = response.headers.get('Content-Length')
+        return int(length) if length else None
+
+    def _download_stream(self, url, part_path, total, progress, cancel_event):
+        attempt = 0
+        while True:
+            self._check_cancel(cancel_event, part_path)
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if total is not None and offset == total:
+                return total
+            headers = {'Range': f"bytes={offset}-"} if offset else {}
+            try:
+                with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+                    if response.status_code == 416:
+                        # Our .part is larger than the remote file; start over.
+                        os.remove(part_path)
+                        raise DownloadError("Requested range not satisfiable.")
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        # The server ignored the Range header and sent the whole body.
+                        offset = 0
+                    total = self._response_total(response, offset, total)
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for chunk in response.iter_content(self.CHUNK_SIZE):
+                            if cancel_event is not None and cancel_event.is_set():
+                                break
+                            self._write(f, chunk)
+                            if progress:
+                                progress(len(chunk))
+                self._check_cancel(cancel_event, part_path)
+                received = os.path.getsize(part_path)
+                if total is None or received >= total:
+                    return received
+                raise DownloadError(f"Connection closed after {received} of {total} bytes.")
+            except (requests.RequestException, DownloadError) as e:
+                if isinstance(e, DownloadCancelled):
+                    raise
+                if self._is_permanent(e):
+                    raise DownloadError(str(e))
+                grew = os.path.exists(part_path) and os.path.getsize(part_path) > offset
+                # Any forward progress resets the retry budget.
+                attempt = 0 if grew else attempt + 1
+                if attempt > self.max_retries:
+                    raise DownloadError(f"Giving up after {self.max_retries} retries: {e}")
+                self._sleep_before_retry(attempt)
+
+    def _response_total(self, response, offset, total):
+        content_range = response.headers.get('Content-Range')
+        if response.status_code == 206 and content_range and '/' in content_range:
+            size = content_range.rsplit('/', 1)[1]
+            if size != '*':
+                return int(size)
+        length = response.headers.get('Content-Length')
+        if length is not None and 'Content-Encoding' not in response.headers:
+            return int(length) + (offset if response.status_code == 206 else 0)
+        return total
+
+    def _download_segmented(self, url, part_path, total, progress, cancel_event):
+        # Each segment is [start, position, end]; positions are saved to a
+        # sidecar file so a failed segmented download resumes per segment.
+        state_path = part_path + ".json"
+        segments = None
+        if os.path.exists(state_path) and os.path.exists(part_path):
+            try:
+                with open(state_path, 'r') as f:
+                    state = json.load(f)
+                if state.get('total') == total:
+                    segments = state['segments']
+            except (OSError, ValueError, KeyError):
+                segments = None
+        if segments is None:
+            step = -(-total // self.segments)
+            segments = [[start, start, min(start + step, total) - 1] for start in range(0, total, step)]
+            with open(part_path, 'wb') as f:
+                f.truncate(total)
+
+        lock = Lock()
+        errors = []
+
+        def save_state():
+            with lock:
+                with open(state_path, 'w') as f:
+                    json.dump({'total': total, 'segments': segments}, f)
+
+        def fetch(segment):
+            try:
+                self._fetch_segment(url, part_path, segment, lock, progress, cancel_event)
+            except DownloadError as e:
+                errors.append(e)
+            finally:
+                if os.path.exists(part_path):
+                    save_state()
+
+        save_state()
+        threads = [Thread(target=fetch, args=(segment,), daemon=True)
+                   for segment in segments if segment[1] <= segment[2]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self._check_cancel(cancel_event, part_path)
+        if errors:
+            raise errors[0]
+        os.remove(state_path)
+
+    def _fetch_segment(self, url, part_path, segment, lock, progress, cancel_event):
+        attempt = 0
+        while segment[1] <= segment[2]:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            start = segment[1]
+            try:
+                headers = {'Range': f"bytes={start}-{segment[2]}"}
+                with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise DownloadError("Server does not support byte ranges.")
+                    with open(part_path, 'r+b') as f:
+                        f.seek(start)
+                        for chunk in response.iter_content(self.CHUNK_SIZE):
+                            if cancel_event is not None and cancel_event.is_set():
+                                return
+                            chunk = chunk[:segment[2] - segment[1] + 1]
+                            self._write(f, chunk)
+                            with lock:
+                                segment[1] += len(chunk)
+                            if progress:
+                                progress(len(chunk))
+                if segment[1] <= segment[2]:
+                    raise DownloadError(f"Segment {segment[0]} closed early.")
+            except (requests.RequestException, DownloadError) as e:
+                if self._is_permanent(e):
+                    raise DownloadError(str(e))
+                attempt = 0 if segment[1] > start else attempt + 1
+                if attempt > self.max_retries:
+                    raise DownloadError(f"Giving up on segment {segment[0]} after {self.max_retries} retries: {e}")
+                self._sleep_before_retry(attempt)
+
+    def _write(self, f, chunk):
+        start = time.perf_counter()
+        f.write(chunk)
+        self.metrics.observe("download_write_seconds", time.perf_counter() - start)
+        self.metrics.inc("download_bytes_written_total", len(chunk))
+
+    def _verify(self, part_path, total, md5):
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            os.remove(part_path)
+            raise DownloadError(f"Size mismatch: expected {total} bytes, got {size}.")
+        if md5:
+            digest = hashlib.md5()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            if digest.hexdigest() != md5.lower():
+                os.remove(part_path)
+                raise DownloadError("MD5 mismatch; the downloaded file is corrupt.")
@@ -0,0 +1,216 @@
+# download_ledger.py
+import hashlib
+import mmap
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.bmp'}
+
+
+def hash_file(path):
+    # md5 over an mmap'd view; hashlib drops the GIL for large buffers, so
+    # several files hash in parallel on a thread pool.
+    digest = hashlib.md5()
+    size = os.path.getsize(path)
+    if size:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            digest.update(view)
+    return digest.hexdigest(), size
+
+
+def try_hash_file(path):
+    # (md5, error) for the scanner's worker threads, so one unreadable or
+    # vanished file does not end the whole scan.
+    try:
+        return hash_file(path)[0], None
+    except OSError as e:
+        return None, e
+
+
+class DownloadLedger:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                path TEXT PRIMARY KEY,
+                post_id INTEGER,
+                md5 TEXT,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                recorded_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS downloads_post ON downloads (post_id);
+            CREATE INDEX IF NOT EXISTS downloads_md5 ON downloads (md5);
+            CREATE TABLE IF NOT EXISTS scanned_folders (
+                folder TEXT PRIMARY KEY,
+                scanned_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def record(self, path, post_id=None, md5=None):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)",
+                (path, post_id, md5.lower() if md5 else None, stat.st_size, stat.st_mtime, time.time()),
+            )
+            self._db.commit()
+
+    def lookup(self, post_id=None, md5=None):
+        # Returns the path of a file we already have for this post, dropping
+        # ledger rows whose file has since been deleted.
+        clauses, params = [], []
+        if post_id is not None:
+            clauses.append("post_id = ?")
+            params.append(post_id)
+        if md5:
+            clauses.append("md5 = ?")
+            params.append(md5.lower())
+        if not clauses:
+            return None
+        with self._lock:
+            rows = self._db.execute(f"SELECT path FROM downloads WHERE {' OR '.join(clauses)}", params).fetchall()
+        for (path,) in rows:
+            if os.path.exists(path):
+                return path
+            self.forget(path)
+        return None
+
+    def downloaded_ids(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return set()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT DISTINCT post_id FROM downloads WHERE post_id IN ({','.join('?' * len(post_ids))})",
+                post_ids,
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def forget(self, path):
+        with self._lock:
+            self._db.execute("DELETE FROM downloads WHERE path = ?", (path,))
+            self._db.commit()
+
+    def counter(self, name="download"):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def start_counter(self, value, name="download"):
+        # Sets the counter unless it already exists, e.g. to carry one over.
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO counters VALUES (?, ?)", (name, value))
+            self._db.commit()
+
+    def next_counter(self, name="download"):
+        # SQLite holds the write lock from the UPDATE until the commit, so
+        # threads and other processes sharing the ledger never get the same
+        # number twice.
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO counters VALUES (?, 0)", (name,))
+            self._db.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+            value = self._db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+            self._db.commit()
+        return value
+
+    def was_scanned(self, folder):
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM scanned_folders WHERE folder = ?",
+                                   (os.path.abspath(folder),)).fetchone()
+        return row is not None
+
+    def scan_folder(self, folder, resolve_md5=None, workers=None):
+        # Hashes every image under folder and seeds the ledger. resolve_md5
+        # maps an md5 to a post id (e.g. via the post index). File names say
+        # nothing reliable ("17.jpg" may be the 17th download, not post 17),
+        # so files it cannot resolve are recorded by md5 only.
+        folder = os.path.abspath(folder)
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in
+                     self._db.execute("SELECT path, size, mtime FROM downloads").fetchall()}
+
+        paths = []
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    # A dangling symlink, or a file deleted since os.walk.
+                    print(f"Skipping {path}: {e}")
+                    continue
+                if known.get(path) == (stat.st_size, stat.st_mtime):
+                    continue
+                paths.append(path)
+
+        recorded = 0
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            for path, (md5, error) in zip(paths, executor.map(try_hash_file, paths)):
+                if error is None:
+                    post_id = resolve_md5(md5) if resolve_md5 is not None else None
+                    try:
+                        self.record(path, post_id=post_id, md5=md5)
+                    except OSError as e:
+                        error = e
+                if error is not None:
+                    print(f"Skipping {path}: {error}")
+                    continue
+                recorded += 1
+
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO scanned_folders VALUES (?, ?)", (folder, time.time()))
+            self._db.commit()
+        return recorded
+
+
+class FilenameTemplate:
+    # Placeholders: {id}, {md5}, {ext}, {author}, {source}, {counter}.
+    # {counter} is the ledger's download counter, so the GUI and the CLI
+    # number files in one sequence.
+    FIELDS = ('id', 'md5', 'ext', 'author', 'source', 'counter')
+
+    def __init__(self, template):
+        self.template = template
+        try:
+            template.format(**{field: '' for field in self.FIELDS})
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"Invalid filename template {template!r}: {e}")
+
+    def uses_counter(self):
+        return '{counter}' in self.template
+
+    def save_path(self, folder, post, ledger):
+        # For DownloadManager.enqueue, which only calls it once the post has
+        # been accepted, so duplicates do not use up counter numbers.
+        def path():
+            counter = ledger.next_counter() if self.uses_counter() else None
+            return os.path.join(folder, self.render(post, counter))
+        return path
+
+    def render(self, post, counter=None):
+        if counter is None and self.uses_counter():
+            raise ValueError(f"Filename template {self.template!r} needs a download counter")
+        name = self.template.format(
+            id=post.id,
+            md5=post.md5 or '',
+            ext=post.file_extension or '.jpg',
+            author=re.sub(r'[\\/:*?"<>|]', '_', post.author or 'unknown'),
+            source=post.source or '',
+            counter=counter,
+        )
+        return os.path.basename(name)
@@ -0,0 +1,301 @@
+# download_manager.py
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from threading import Thread
+from urllib.parse import urlparse
+
+from atomic_file import write_atomic
+
+
+class DownloadManager:
+    # Throughput is averaged over this many seconds of finished jobs.
+    THROUGHPUT_WINDOW = 5.0
+    # Queue changes are written at most this often, so queueing a large
+    # batch does not rewrite the queue file once per job.
+    SAVE_DELAY = 0.5
+
+    def __init__(self, api, queue_path, workers=4, per_host_limit=2, ledger=None):
+        self.api = api
+        self.ledger = ledger
+        self.queue_path = queue_path
+        self.workers = workers
+        self.per_host_limit = per_host_limit
+
+        # Called from worker threads as on_job_finished(job, success, message).
+        self.on_job_finished = None
+
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._active = {}
+        # post ids of every pending and active job, for duplicate checks.
+        self._queued_ids = set()
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+        self._cancel_events = {}
+        self._host_counts = {}
+        self._paused = False
+        self._stopping = False
+        self._threads = []
+        self._finished = deque()
+        self._samples = deque()
+        self._bytes_done = 0
+        self.done_count = 0
+        self.failed_count = 0
+        self._load_queue()
+        api.metrics.add_collector("downloads", self.stats)
+
+    def start(self):
+        with self._cond:
+            self._stopping = False
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = Thread(target=self._worker, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self.flush_queue()
+
+    def wait(self, timeout=None):
+        # Blocks until every queued and active job has finished.
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._active, timeout)
+
+    def enqueue(self, url, save_path, file_size=None, md5=None, post_id=None):
+        # Returns None without queueing anything if the ledger says we
+        # already have this post on disk, or it is already queued. save_path
+        # may be a function returning the path, called only if the job is
+        # accepted (see FilenameTemplate.save_path).
+        if self.ledger is not None and self.ledger.lookup(post_id=post_id, md5=md5):
+            return None
+        if post_id is not None:
+            with self._cond:
+                if post_id in self._queued_ids:
+                    return None
+                self._queued_ids.add(post_id)
+        if callable(save_path):
+            try:
+                save_path = save_path()
+            except BaseException:
+                with self._cond:
+                    self._queued_ids.discard(post_id)
+                raise
+        job = {
+            'id': uuid.uuid4().hex,
+            'post_id': post_id,
+            'url': url,
+            'save_path': save_path,
+            'filename': os.path.basename(save_path),
+            'file_size': file_size,
+            'md5': md5,
+        }
+        with self._cond:
+            self._pending.append(job)
+            self._schedule_save()
+            self._cond.notify()
+        return job['id']
+
+    def pause(self):
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    def is_paused(self):
+        return self._paused
+
+    def cancel(self, job_id):
+        with self._cond:
+            for job in self._pending:
+                if job['id'] == job_id:
+                    self._pending.remove(job)
+                    self._queued_ids.discard(job.get('post_id'))
+                    self._schedule_save()
+                    return True
+            if job_id in self._cancel_events:
+                self._cancel_events[job_id].set()
+                return True
+        return False
+
+    def cancel_all(self):
+        with self._cond:
+            for job in self._pending:
+                self._queued_ids.discard(job.get('post_id'))
+            self._pending.clear()
+            for event in self._cancel_events.values():
+                event.set()
+            self._schedule_save()
+
+    def flush_queue(self):
+        # Writes the queue file now if anything changed since the last write.
+        # Not to be called with self._cond held.
+        with self._save_lock:
+            with self._cond:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                # Jobs in flight are saved too so an interrupted batch resumes them.
+                jobs = list(self._active.values()) + list(self._pending)
+            self._write_queue(jobs)
+
+    def stats(self):
+        with self._cond:
+            self._trim_window(time.monotonic())
+            window_bytes = sum(size for _, size in self._samples)
+            return {
+                'queued': len(self._pending),
+                'active': len(self._active),
+                'done': self.done_count,
+                'failed': self.failed_count,
+                'bytes_total': self._bytes_done,
+                'bytes_per_sec': window_bytes / self.THROUGHPUT_WINDOW,
+                'items_per_sec': len(self._finished) / self.THROUGHPUT_WINDOW,
+                'paused': self._paused,
+            }
+
+    # --- Internals (call with self._cond held unless noted) ---
+    def _host(self, job):
+        return urlparse(job['url']).netloc
+
+    def _take_job(self):
+        for job in self._pending:
+            host = self._host(job)
+            if self._host_counts.get(host, 0) < self.per_host_limit:
+                self._pending.remove(job)
+                self._host_counts[host] = self._host_counts.get(host, 0) + 1
+                self._active[job['id']] = job
+                self._cancel_events[job['id']] = threading.Event()
+                return job
+        return None
+
+    def _release_job(self, job):
+        host = self._host(job)
+        self._host_counts[host] -= 1
+        if not self._host_counts[host]:
+            del self._host_counts[host]
+        self._active.pop(job['id'], None)
+        self._queued_ids.discard(job.get('post_id'))
+        return self._cancel_events.pop(job['id'])
+
+    def _claim_path(self, job):
+        # A finished file is never overwritten: it may belong to another post,
+        # e.g. one named by a different template or by another instance.
+        taken = {active['save_path'] for active in self._active.values() if active is not job}
+        path = job['save_path']
+        stem, ext = os.path.splitext(path)
+        n = 0
+        while os.path.exists(path) or path in taken:
+            n += 1
+            path = f"{stem}_{n}{ext}"
+        if n:
+            job['save_path'] = path
+            job['filename'] = os.path.basename(path)
+            self._schedule_save()
+
+    def _trim_window(self, now):
+        # Trimmed as samples come in too, since nothing may ever call stats().
+        while self._finished and now - self._finished[0] > self.THROUGHPUT_WINDOW:
+            self._finished.popleft()
+        while self._samples and now - self._samples[0][0] > self.THROUGHPUT_WINDOW:
+            self._samples.popleft()
+
+    def _record_progress(self, nbytes):
+        # Called from worker threads once per received chunk.
+        with self._cond:
+            now = time.monotonic()
+            self._samples.append((now, nbytes))
+            self._trim_window(now)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopping:
+                    if not self._paused:
+                        job = self._take_job()
+                        if job:
+                            break
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                self._claim_path(job)
+
+            cancel_event = self._cancel_events[job['id']]
+            success, message = self.api.download_image(
+                job['url'], job['save_path'],
+                file_size=job.get('file_size'), md5=job.get('md5'),
+                progress=self._record_progress, cancel_event=cancel_event,
+            )
+
+            with self._cond:
+                self._release_job(job)
+                if success:
+                    if self.ledger is not None:
+                        self.ledger.record(job['save_path'], post_id=job.get('post_id'), md5=job.get('md5'))
+                    now = time.monotonic()
+                    self._bytes_done += os.path.getsize(job['save_path'])
+                    self._finished.append(now)
+                    self._trim_window(now)
+                    self.done_count += 1
+                elif cancel_event.is_set():
+                    message = "Download cancelled."
+                else:
+                    self.failed_count += 1
+                self._schedule_save()
+                stopping = self._stopping
+                self._cond.notify_all()
+
+            if stopping:
+                # The timer may not get to run before the process exits.
+                self.flush_queue()
+            if self.on_job_finished:
+                self.on_job_finished(job, success, message)
+
+    def _load_queue(self):
+        try:
+            with open(self.queue_path, 'r') as f:
+                jobs = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Could not restore download queue: {e}")
+            return
+        for job in jobs:
+            # Jobs that finished after the queue was last written.
+            if self.ledger is not None and self.ledger.lookup(post_id=job.get('post_id'), md5=job.get('md5')):
+                continue
+            post_id = job.get('post_id')
+            if post_id is not None:
+                if post_id in self._queued_ids:
+                    continue
+                self._queued_ids.add(post_id)
+            self._pending.append(job)
+        if len(self._pending) != len(jobs):
+            self._dirty = True
+
+    def _schedule_save(self):
+        self._dirty = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.SAVE_DELAY, self.flush_queue)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _write_queue(self, jobs):
+        try:
+            write_atomic(self.queue_path, json.dumps(jobs))
+        except OSError as e:
+            print(f"Could not save download queue: {e}")
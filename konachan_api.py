@@ -1,56 +1,166 @@
 # konachan_api.py
+import time
+
 import requests
-import os
-import shutil
+
+from download_engine import DownloadEngine, DownloadError
+from post import Post, PostPage, page_is_full, parse_posts
+from search_cache import SearchCache
+from tag_filter import compile_blacklist
+from transport import TransportAdapter, create_session, host_of
+
+SEARCH_SUPERSEDED = "Search superseded."
 
 class KonachanAPI:
+    # Moebooru backend (yande.re, konachan.com). Other boorus subclass this
+    # and override BASE_URL, MAX_LIMIT and post_from_json.
+    NAME = "yande.re"
     # Changed the base URL to yande.re, a known mirror that is more lenient.
     BASE_URL = "https://yande.re/post.json"
+    # Moebooru refuses to return more than this many posts per page.
+    MAX_LIMIT = 1000
+    # Moebooru rejects queries with more tags than this (tag_query_limit).
+    MAX_TAGS = 6
+    STREAM_CHUNK_SIZE = 16 * 1024
     
-    def __init__(self):
+    def __init__(self, download_segments=1, download_retries=5, search_ttl=300, name=None, base_url=None,
+                 rate_limit=None, primary=True, transport=None):
+        self.name = name or self.NAME
+        self.base_url = base_url or self.BASE_URL
+        # Posts from a secondary source are tagged with its name so their ids
+        # are not mistaken for primary post ids.
+        self.primary = primary
+        # Rate limits, retries, timeouts and the circuit breaker live in the
+        # transport, which several sources (and the thumbnail loader) can share.
+        self.transport = transport or TransportAdapter()
+        if rate_limit:
+            self.transport.set_rate_limit(host_of(self.base_url), rate_limit)
         # Create a requests session with a custom User-Agent to avoid 403 errors
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.session = create_session({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        }, transport=self.transport)
+        self.metrics = self.transport.metrics
+        self.download_engine = DownloadEngine(self.session, segments=download_segments,
+                                              max_retries=download_retries, metrics=self.metrics)
+        self.search_cache = SearchCache(ttl=search_ttl)
+        self.metrics.add_collector("search_cache", self.search_cache.stats, source=self.name)
 
-    def search_images(self, tags, excluded_tags, limit=50):
+    def build_params(self, tags, excluded_tags, limit=50, page=1):
         # The API uses spaces for inclusive tags and '-' for exclusive tags.
+        # Only the exclusions that fit in the tag limit are sent; search_images
+        # filters the results against the whole list.
         query_tags = tags.split()
         if excluded_tags:
-            query_tags.extend([f"-{tag.strip()}" for tag in excluded_tags.split(',')])
+            budget = self.MAX_TAGS - len(query_tags)
+            query_tags.extend(f"-{tag}" for tag in compile_blacklist(excluded_tags).server_excludes(budget))
 
-        params = {
+        return {
             'tags': " ".join(query_tags),
-            'limit': limit,
+            'limit': max(1, min(limit, self.MAX_LIMIT)),
+            'page': page,
         }
-        
+
+    def post_from_json(self, data):
+        return Post.from_json(data, source=None if self.primary else self.name)
+
+    def search_images(self, tags, excluded_tags, limit=50, page=1, on_batch=None, batch_size=25,
+                      should_stop=None, use_cache=True):
+        # on_batch, if given, receives each group of batch_size posts as soon
+        # as it has been parsed, before the rest of the page has arrived.
+        # should_stop, if given, is polled while streaming; a search nobody
+        # wants any more returns (None, SEARCH_SUPERSEDED) early. Posts
+        # matching excluded_tags are dropped here, so a page can come back
+        # short; page_is_full() tells whether there are more.
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        blacklist = compile_blacklist(excluded_tags or "")
+        if blacklist and on_batch is not None:
+            on_batch = self._filtered_batches(on_batch, blacklist)
+        posts, error = self._search(tags, excluded_tags, limit, page, on_batch, batch_size, should_stop, use_cache)
+        if posts is None:
+            return posts, error
+        kept = blacklist.filter(posts) if blacklist else posts
+        if len(kept) < len(posts):
+            self.metrics.inc("posts_filtered_total", len(posts) - len(kept), source=self.name)
+        return PostPage(kept, fetched=len(posts), max_id=max((post.id for post in posts), default=0)), error
+
+    def _filtered_batches(self, on_batch, blacklist):
+        def filtered(batch):
+            batch = [post for post in batch if not blacklist.matches(post)]
+            if batch:
+                on_batch(batch)
+        return filtered
+
+    def _search(self, tags, excluded_tags, limit, page, on_batch, batch_size, should_stop, use_cache):
+        # The search cache keeps what the server sent, before filtering.
+        if not use_cache:
+            return self._fetch_page(tags, excluded_tags, limit, page, on_batch, batch_size, should_stop)
+
+        key = self.search_cache.key(tags, excluded_tags, limit, page)
+        entry, fresh = self.search_cache.lookup(key)
+        if fresh:
+            self._replay(entry.posts, on_batch, batch_size)
+            return list(entry.posts), None
+
+        # Identical searches already on the wire wait for that response
+        # instead of sending their own.
+        while True:
+            flight, leader = self.search_cache.join_flight(key)
+            if leader:
+                break
+            posts, error = flight.wait()
+            if error == SEARCH_SUPERSEDED and not (should_stop is not None and should_stop()):
+                # The leader gave up just as this caller joined; this one
+                # still wants the page, so it goes again.
+                continue
+            if posts is not None:
+                self._replay(posts, on_batch, batch_size)
+                posts = list(posts)
+            return posts, error
+
+        posts, error = None, "Search failed."
+        try:
+            # Other callers are waiting on this response, so it is only
+            # abandoned when none are.
+            def stop():
+                return flight.waiters == 0 and should_stop is not None and should_stop()
+            posts, error = self._fetch_page(tags, excluded_tags, limit, page, on_batch, batch_size, stop,
+                                            key=key, entry=entry)
+            return posts, error
+        finally:
+            self.search_cache.finish_flight(key, flight, posts, error)
+
+    def _fetch_page(self, tags, excluded_tags, limit, page, on_batch, batch_size, should_stop, key=None, entry=None):
+        params = self.build_params(tags, excluded_tags, limit, page)
+        headers = entry.validators() if entry is not None else {}
+        posts, batch = [], []
         try:
-            # Use the session object for the request
-            response = self.session.get(self.BASE_URL, params=params)
-            response.raise_for_status()  # This will raise an exception for 4xx or 5xx errors
-            
-            posts = response.json()
-            
-            # The API returns an empty list for no results, which is a valid JSON
-            if not posts:
-                return [], None
-            
-            images = [
-                {
-                    'id': post.get('id'),
-                    'name': f"Post #{post.get('id')}",
-                    'author': post.get('author'),
-                    'tags': post.get('tags').split(),
-                    # The API response has 'file_url' for the full image and 'preview_url' for the thumbnail
-                    'download_url': post.get('file_url'),
-                    'preview_url': post.get('preview_url'),
-                    'file_extension': os.path.splitext(post.get('file_url'))[1] if post.get('file_url') else '.jpg',
-                } 
-                for post in posts if post.get('file_url')
-            ]
-            return images, None
-        
+            start = time.perf_counter()
+            with self.session.get(self.base_url, params=params, headers=headers, stream=True) as response:
+                headers_at = time.perf_counter()
+                self.metrics.observe("search_headers_seconds", headers_at - start, source=self.name)
+                if response.status_code == 304 and entry is not None:
+                    self.search_cache.refresh(key)
+                    self._replay(entry.posts, on_batch, batch_size)
+                    return list(entry.posts), None
+                response.raise_for_status()  # This will raise an exception for 4xx or 5xx errors
+                # The API returns an empty list for no results, which is a valid JSON
+                for post in parse_posts(response.iter_content(self.STREAM_CHUNK_SIZE), self.post_from_json):
+                    if should_stop is not None and should_stop():
+                        return None, SEARCH_SUPERSEDED
+                    posts.append(post)
+                    if on_batch is not None:
+                        batch.append(post)
+                        if len(batch) >= batch_size:
+                            on_batch(batch)
+                            batch = []
+                if batch:
+                    on_batch(batch)
+                # Headers to the last parsed post: transfer plus parsing.
+                self.metrics.observe("search_body_seconds", time.perf_counter() - headers_at, source=self.name)
+                if key is not None:
+                    self.search_cache.store(key, tuple(posts), response.headers.get('ETag'),
+                                            response.headers.get('Last-Modified'))
+            return posts, None
         except requests.RequestException as e:
             return None, f"Network error: {e}"
         except ValueError as e:
@@ -58,15 +168,32 @@ class KonachanAPI:
         except Exception as e:
             return None, f"An unexpected error occurred: {e}"
 
-    def download_image(self, url, save_path):
+    def _replay(self, posts, on_batch, batch_size):
+        if on_batch is None:
+            return
+        for i in range(0, len(posts), batch_size):
+            on_batch(list(posts[i:i + batch_size]))
+
+    def iter_pages(self, tags, excluded_tags, limit=50, start_page=1, end_page=None, use_cache=True):
+        # Yields (page, images, error) until the server runs out of posts,
+        # end_page is reached or a request fails.
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        page = start_page
+        while end_page is None or page <= end_page:
+            images, error = self.search_images(tags, excluded_tags, limit=limit, page=page, use_cache=use_cache)
+            yield page, images, error
+            if error or not page_is_full(images, limit):
+                return
+            page += 1
+
+    def download_image(self, url, save_path, file_size=None, md5=None, progress=None, cancel_event=None):
         try:
-            # Use the session object for the request
-            response = self.session.get(url, stream=True)
-            response.raise_for_status()
-            with open(save_path, 'wb') as f:
-                shutil.copyfileobj(response.raw, f)
+            self.download_engine.download(url, save_path, expected_size=file_size, md5=md5,
+                                          progress=progress, cancel_event=cancel_event)
             return True, "Download successful."
-        except requests.RequestException as e:
+        except DownloadError as e:
             return False, f"Download failed: {e}"
+        except OSError as e:
+            return False, f"Could not write {save_path}: {e}"
         except Exception as e:
-            return False, f"An unexpected error occurred: {e}"
\ No newline at end of file
+            return False, f"An unexpected error occurred: {e}"
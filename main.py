@@ -1,4 +1,5 @@
 # main.py
+import multiprocessing
 import sys
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtCore import QCoreApplication
@@ -6,6 +7,8 @@ from PyQt6.QtCore import QCoreApplication
 from app_window import ImageSearchApp
 
 if __name__ == "__main__":
+    # Post-processing workers are spawned; frozen builds need this to start them.
+    multiprocessing.freeze_support()
     # Ensure QCoreApplication is created before any widgets
     QCoreApplication.setApplicationName("konadl")
     app = QApplication(sys.argv)
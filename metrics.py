@@ -0,0 +1,190 @@
+# metrics.py
+# In-process instrumentation: latency histograms, counters and gauges keyed
+# by name and labels, plus collectors that pull stats (cache hit rates and
+# the like) from other objects when a snapshot is taken. Exports as JSON or
+# Prometheus text.
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+from atomic_file import write_atomic
+
+# Histogram bucket upper bounds in seconds: 0.25 ms growing by 1.5x to ~6 min.
+BUCKETS = tuple(0.00025 * 1.5 ** i for i in range(36))
+QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_PREFIX = "konadl_"
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Interpolates inside the bucket holding the q-th observation, like
+        # Prometheus' histogram_quantile; never reports more than the max.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def summary(self):
+        summary = {'count': self.count, 'sum': self.sum, 'max': self.max}
+        for q in QUANTILES:
+            summary[f"p{int(q * 100)}"] = self.quantile(q)
+        return summary
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._collectors = []
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add(self, name, delta, **labels):
+        # Gauges that go up and down, e.g. requests in flight.
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    @contextmanager
+    def track(self, name, in_flight=None, **labels):
+        # Times the block into histogram `name`; `in_flight`, if given, is a
+        # gauge counting blocks currently running.
+        if in_flight:
+            self.add(in_flight, 1, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+            if in_flight:
+                self.add(in_flight, -1, **labels)
+
+    def add_collector(self, prefix, collect, **labels):
+        # collect() returns a dict; its numeric values are reported as gauges
+        # named <prefix>_<key> every time a snapshot is taken.
+        with self._lock:
+            self._collectors.append((prefix, collect, labels))
+
+    def _collect(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        gauges = {}
+        for prefix, collect, labels in collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Metrics collector {prefix} failed: {e}")
+                continue
+            for name, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[self._key(f"{prefix}_{name}", labels)] = value
+        return gauges
+
+    def snapshot(self):
+        collected = self._collect()
+        with self._lock:
+            histograms = [{'name': name, 'labels': dict(labels), **histogram.summary()}
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            gauges = {**self._gauges, **collected}
+        return {
+            'timestamp': time.time(),
+            'histograms': histograms,
+            'counters': counters,
+            'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                       for (name, labels), value in sorted(gauges.items())],
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        collected = self._collect()
+        with self._lock:
+            histograms = [(key, list(h.counts), h.count, h.sum) for key, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+            gauges = sorted({**self._gauges, **collected}.items())
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), counts, count, total in histograms:
+            name = PROMETHEUS_PREFIX + name
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + (float('inf'),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float('inf') else f"{bound:.6g}"
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:.9g}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            name = PROMETHEUS_PREFIX + name
+            declare(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value:.9g}")
+        for (name, labels), value in gauges:
+            name = PROMETHEUS_PREFIX + name
+            declare(name, "gauge")
+            lines.append(f"{name}{format_labels(labels)} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        # .prom and .txt get the Prometheus text format (e.g. for the
+        # node_exporter textfile collector), anything else JSON.
+        text = self.to_prometheus() if os.path.splitext(path)[1].lower() in ('.prom', '.txt') else self.to_json()
+        write_atomic(path, text)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
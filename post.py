@@ -0,0 +1,166 @@
+# post.py
+import codecs
+import json
+import os
+import sys
+from dataclasses import dataclass, asdict
+
+
+@dataclass(slots=True)
+class Post:
+    # Compact record for one search result. Tags are a tuple of interned
+    # strings, so the same tag across thousands of posts is stored once.
+    id: int
+    author: str
+    tags: tuple
+    download_url: str
+    preview_url: str
+    file_extension: str = '.jpg'
+    file_size: int = None
+    md5: str = None
+    score: int = None
+    rating: str = None
+    downloaded: bool = False
+    # None for posts from the primary source; the local index and download
+    # ledger key on its post ids. Other sources are matched by md5 only.
+    source: str = None
+
+    @property
+    def name(self):
+        return f"Post #{self.id}"
+
+    @property
+    def local_id(self):
+        # The id the local index and download ledger know this post by.
+        return self.id if self.source is None else None
+
+    @classmethod
+    def from_json(cls, post, source=None):
+        # Moebooru post.json record. Returns None for posts without a
+        # downloadable file (deleted or hidden).
+        file_url = absolute_url(post.get('file_url'))
+        if not file_url:
+            return None
+        intern = sys.intern
+        return cls(
+            id=post.get('id'),
+            author=intern(post.get('author') or ''),
+            tags=tuple(intern(tag) for tag in (post.get('tags') or '').split()),
+            download_url=file_url,
+            preview_url=absolute_url(post.get('preview_url')),
+            file_extension=intern(os.path.splitext(file_url)[1] or '.jpg'),
+            file_size=post.get('file_size'),
+            md5=post.get('md5'),
+            score=post.get('score'),
+            rating=post.get('rating'),
+            source=source,
+        )
+
+    @classmethod
+    def from_danbooru_json(cls, post, source=None):
+        # Danbooru posts.json record. There is no uploader name, so the
+        # artist tags stand in for the author.
+        file_url = absolute_url(post.get('file_url'))
+        if not file_url:
+            return None
+        intern = sys.intern
+        ext = post.get('file_ext')
+        return cls(
+            id=post.get('id'),
+            author=intern(post.get('tag_string_artist') or ''),
+            tags=tuple(intern(tag) for tag in (post.get('tag_string') or '').split()),
+            download_url=file_url,
+            preview_url=absolute_url(post.get('preview_file_url')),
+            file_extension=intern(f".{ext}" if ext else os.path.splitext(file_url)[1] or '.jpg'),
+            file_size=post.get('file_size'),
+            md5=post.get('md5'),
+            score=post.get('score'),
+            rating=post.get('rating'),
+            source=source,
+        )
+
+    def to_dict(self):
+        data = asdict(self)
+        data['name'] = self.name
+        data['tags'] = list(self.tags)
+        return data
+
+
+class PostPage(list):
+    # One page of results after client-side filtering. fetched is how many
+    # posts the server sent, which is what says whether another page exists;
+    # max_id is the newest of them, which is how far a watermark may move.
+    def __init__(self, posts=(), fetched=None, max_id=None):
+        super().__init__(posts)
+        self.fetched = len(self) if fetched is None else fetched
+        self.max_id = max((post.id for post in self), default=0) if max_id is None else max_id
+
+
+def page_is_full(posts, limit):
+    return getattr(posts, 'fetched', len(posts)) >= limit
+
+
+def page_max_id(posts):
+    if isinstance(posts, PostPage):
+        return posts.max_id
+    return max((post.id for post in posts), default=0)
+
+
+def absolute_url(url):
+    # Some mirrors hand out protocol-relative URLs ("//host/path").
+    if url and url.startswith('//'):
+        return 'https:' + url
+    return url
+
+
+def iter_json_array(chunks):
+    # Yields the elements of a top-level JSON array as its bytes arrive, so
+    # callers can act on the first posts before the response is complete.
+    # Only the unparsed tail of the body is kept in memory.
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    started = False
+    finished = False
+
+    for chunk in chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        while not finished:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("Expected a JSON array.")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                finished = True
+                break
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely an element split across chunks; wait for more.
+                break
+            if type(value) in (int, float) and not buffer[end:].strip('0123456789+-.eE'):
+                # A number may go on in the next chunk ("12" + "3", "1.5" + "e3").
+                break
+            yield value
+            pos = end
+
+    if not finished:
+        if buffer[pos:].strip():
+            # Surface the real parse error for whatever is left over.
+            decoder.raw_decode(buffer, pos)
+        raise ValueError("Truncated JSON array.")
+
+
+def parse_posts(chunks, from_json=Post.from_json):
+    for data in iter_json_array(chunks):
+        post = from_json(data)
+        if post is not None:
+            yield post
@@ -0,0 +1,244 @@
+# post_index.py
+import os
+import sqlite3
+import sys
+import time
+from threading import Lock
+
+from post import Post, page_is_full, page_max_id
+from tag_filter import compile_blacklist
+
+
+class PostIndex:
+    # Every post we have seen, plus an inverted tag index (post_tags) so
+    # include/exclude tag queries can be answered without the network.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY,
+            author TEXT,
+            tags TEXT NOT NULL,
+            file_url TEXT,
+            preview_url TEXT,
+            file_extension TEXT,
+            file_size INTEGER,
+            md5 TEXT,
+            downloaded INTEGER NOT NULL DEFAULT 0,
+            seen_at REAL NOT NULL,
+            score INTEGER,
+            rating TEXT
+        );
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS post_tags (
+            tag_id INTEGER NOT NULL,
+            post_id INTEGER NOT NULL,
+            PRIMARY KEY (tag_id, post_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS post_tags_post ON post_tags (post_id);
+        CREATE INDEX IF NOT EXISTS posts_md5 ON posts (md5);
+        CREATE TABLE IF NOT EXISTS sync_state (
+            query TEXT PRIMARY KEY,
+            max_id INTEGER NOT NULL,
+            synced_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(posts)")}
+        for column, kind in (("score", "INTEGER"), ("rating", "TEXT")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE posts ADD COLUMN {column} {kind}")
+        # A sync cut short by max_posts (or an error) leaves max_id alone and
+        # records where to carry on: below resume_below, down to max_id.
+        # resume_max becomes the new max_id once the gap is closed.
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sync_state)")}
+        for column in ("resume_below", "resume_max"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE sync_state ADD COLUMN {column} INTEGER")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add_posts(self, posts):
+        if not posts:
+            return
+        now = time.time()
+        with self._lock:
+            cursor = self._db.cursor()
+            for post in posts:
+                cursor.execute(
+                    """INSERT INTO posts (id, author, tags, file_url, preview_url, file_extension, file_size, md5,
+                                          seen_at, score, rating)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(id) DO UPDATE SET
+                           author = excluded.author, tags = excluded.tags, file_url = excluded.file_url,
+                           preview_url = excluded.preview_url, file_extension = excluded.file_extension,
+                           file_size = excluded.file_size, md5 = excluded.md5, seen_at = excluded.seen_at,
+                           score = excluded.score, rating = excluded.rating""",
+                    (post.id, post.author, " ".join(post.tags), post.download_url, post.preview_url,
+                     post.file_extension, post.file_size, post.md5, now, post.score, post.rating),
+                )
+                cursor.execute("DELETE FROM post_tags WHERE post_id = ?", (post.id,))
+                cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(tag,) for tag in post.tags])
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO post_tags (tag_id, post_id) SELECT id, ? FROM tags WHERE name = ?",
+                    [(post.id, tag) for tag in post.tags],
+                )
+            self._db.commit()
+
+    def query(self, include_tags=(), exclude_tags=(), limit=None, below_id=None):
+        # Newest first. Posts must carry every include tag and none of the excludes.
+        include_tags = sorted(set(include_tags))
+        exclude_tags = sorted(set(exclude_tags))
+        sql = ("SELECT id, author, tags, file_url, preview_url, file_extension, file_size, md5, downloaded, score, rating "
+               "FROM posts")
+        clauses, params = [], []
+        if include_tags:
+            clauses.append(f"""id IN (
+                SELECT post_id FROM post_tags JOIN tags ON tags.id = post_tags.tag_id
+                WHERE tags.name IN ({",".join("?" * len(include_tags))})
+                GROUP BY post_id HAVING COUNT(*) = ?)""")
+            params.extend(include_tags)
+            params.append(len(include_tags))
+        if exclude_tags:
+            clauses.append(f"""id NOT IN (
+                SELECT post_id FROM post_tags JOIN tags ON tags.id = post_tags.tag_id
+                WHERE tags.name IN ({",".join("?" * len(exclude_tags))}))""")
+            params.extend(exclude_tags)
+        if below_id is not None:
+            clauses.append("id < ?")
+            params.append(below_id)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [self._row_to_post(row) for row in rows]
+
+    def _row_to_post(self, row):
+        intern = sys.intern
+        return Post(
+            id=row[0],
+            author=intern(row[1] or ''),
+            tags=tuple(intern(tag) for tag in row[2].split()),
+            download_url=row[3],
+            preview_url=row[4],
+            file_extension=row[5] or '.jpg',
+            file_size=row[6],
+            md5=row[7],
+            downloaded=bool(row[8]),
+            score=row[9],
+            rating=row[10],
+        )
+
+    def find_by_md5(self, md5):
+        with self._lock:
+            row = self._db.execute("SELECT id FROM posts WHERE md5 = ?", (md5,)).fetchone()
+        return row[0] if row else None
+
+    def max_id(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(id), 0) FROM posts").fetchone()[0]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def mark_downloaded(self, post_id, downloaded=True):
+        with self._lock:
+            self._db.execute("UPDATE posts SET downloaded = ? WHERE id = ?", (int(downloaded), post_id))
+            self._db.commit()
+
+    def sync_key(self, tags, excluded_tags):
+        return query_key(tags, excluded_tags)
+
+    def sync_pending(self, tags, excluded_tags):
+        # True while an earlier sync of this query stopped before catching up.
+        with self._lock:
+            row = self._db.execute("SELECT resume_below FROM sync_state WHERE query = ?",
+                                   (self.sync_key(tags, excluded_tags),)).fetchone()
+        return bool(row and row[0])
+
+    def sync(self, api, tags, excluded_tags, max_posts=1000):
+        # Only asks the server for posts newer than the last sync of this
+        # query. Pages come newest first, so a sync that stops early records
+        # the oldest post it got and the next one continues from there.
+        key = self.sync_key(tags, excluded_tags)
+        with self._lock:
+            row = self._db.execute("SELECT max_id, resume_below, resume_max FROM sync_state WHERE query = ?",
+                                   (key,)).fetchone()
+        watermark, resume_below, resume_max = row if row else (0, None, None)
+        query = tags
+        if watermark:
+            query += f" id:>{watermark}"
+        if resume_below:
+            query += f" id:<{resume_below}"
+
+        added, error, complete, fetched_max = [], None, True, 0
+        for _, posts, page_error in api.iter_pages(query, excluded_tags, limit=api.MAX_LIMIT, use_cache=False):
+            if page_error:
+                error, complete = page_error, False
+                break
+            self.add_posts(posts)
+            added.extend(posts)
+            # Blacklisted posts count too, or every sync would fetch them again.
+            fetched_max = max(fetched_max, page_max_id(posts))
+            if len(added) >= max_posts:
+                # A short page was the last one anyway.
+                complete = not page_is_full(posts, api.MAX_LIMIT)
+                break
+
+        newest = resume_max if resume_below else fetched_max or None
+        if complete:
+            if newest is None:
+                return added, error
+            state = (max(watermark, newest), None, None)
+        elif added:
+            state = (watermark, min(post.id for post in added), newest)
+        else:
+            return added, error
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sync_state (query, max_id, synced_at, resume_below, resume_max) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, state[0], time.time(), state[1], state[2]),
+            )
+            self._db.commit()
+        return added, error
+
+
+def query_key(tags, excluded_tags):
+    # Canonical form of a query, so tag order and spacing do not matter.
+    excludes = {tag.strip() for tag in (excluded_tags or "").split(',') if tag.strip()}
+    return " ".join(sorted(set(tags.split())) + [f"-{tag}" for tag in sorted(excludes)])
+
+
+def split_query(tags, excluded_tags):
+    # Turns the search box text and the comma-separated autoexclude list into
+    # (include, exclude) tag sets, or None if the query uses meta tags the
+    # local index cannot answer.
+    include, exclude = set(), set()
+    for tag in tags.split():
+        target = exclude if tag.startswith('-') else include
+        tag = tag.lstrip('-')
+        if ':' in tag or '*' in tag or tag.startswith('~'):
+            return None
+        target.add(tag)
+    if excluded_tags:
+        # Only plain tags; the rest of the blacklist is applied to the results.
+        exclude.update(compile_blacklist(excluded_tags).plain_tags())
+    return include, exclude
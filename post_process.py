@@ -0,0 +1,198 @@
+# post_process.py
+# Optional post-download pipeline (fit/crop, transcode, strip metadata,
+# palette extraction). Runs in a process pool so image work neither holds
+# the GIL nor touches the GUI thread.
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from threading import Lock
+
+from atomic_file import atomic_path, write_atomic
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STAGES = ('fit', 'transcode', 'strip', 'palette')
+FIT_MODES = ('crop', 'contain')
+# format name -> (Pillow format, file extension)
+FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'avif': ('AVIF', '.avif'),
+    'jpeg': ('JPEG', '.jpg'),
+    'png': ('PNG', '.png'),
+}
+
+
+def check_options(options):
+    # Raises ValueError for anything process_image could not honour, so a bad
+    # config.ini fails once up front instead of once per image.
+    if Image is None:
+        raise ValueError("Post-processing needs Pillow (pip install Pillow).")
+    unknown = [stage for stage in options['stages'] if stage not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown post-processing stage(s): {', '.join(unknown)}")
+    if options['fit_mode'] not in FIT_MODES:
+        raise ValueError(f"fit_mode must be one of: {', '.join(FIT_MODES)}")
+    if options['format'] not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    if not options['suffix']:
+        # Outputs go next to the original and must never replace it.
+        raise ValueError("Post-processing needs a non-empty suffix.")
+    if 'transcode' in options['stages'] and options['format'] == 'avif' and not features.check('avif'):
+        raise ValueError("This Pillow build cannot write AVIF.")
+
+
+def output_path(path, options, ext):
+    return f"{os.path.splitext(path)[0]}.{options['suffix']}{ext}"
+
+
+def kmeans_palette(pixels, k, iterations=20, seed=0):
+    # pixels is an (n, 3) float array. Returns [(hex, share), ...], largest
+    # cluster first. Distances use |p|^2 - 2p.c + |c|^2 so each iteration is
+    # one matrix product rather than an (n, k, 3) temporary.
+    rng = np.random.default_rng(seed)
+    k = min(k, len(pixels))
+    centers = pixels[rng.choice(len(pixels), size=k, replace=False)]
+    pixel_norms = (pixels ** 2).sum(axis=1)[:, None]
+    for _ in range(iterations):
+        distances = pixel_norms - 2 * pixels @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=k) for c in range(3)], axis=1)
+        # Empty clusters keep their old centre.
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.abs(updated - centers).max() < 0.5:
+            centers = updated
+            break
+        centers = updated
+    order = np.argsort(-counts)
+    return [('#%02x%02x%02x' % tuple(int(round(v)) for v in centers[i]), float(counts[i] / len(pixels)))
+            for i in order if counts[i]]
+
+
+def extract_palette(image, colors):
+    sample = image.convert('RGB')
+    sample.thumbnail((128, 128))
+    if np is not None:
+        pixels = np.asarray(sample, dtype=np.float64).reshape(-1, 3)
+        return kmeans_palette(pixels, colors)
+    # Without NumPy fall back to Pillow's median cut.
+    quantized = sample.quantize(colors=colors)
+    palette = quantized.getpalette()
+    total = sample.width * sample.height
+    return [('#%02x%02x%02x' % tuple(palette[index * 3:index * 3 + 3]), count / total)
+            for count, index in sorted(quantized.getcolors(), reverse=True)]
+
+
+def process_image(path, options):
+    # Worker entry point. Returns {'path', 'outputs', 'palette', 'error'}.
+    result = {'path': path, 'outputs': [], 'palette': None, 'error': None}
+    stages = options['stages']
+    try:
+        with Image.open(path) as original:
+            source_format = original.format
+            width, height = options['size']
+            if 'fit' in stages and source_format == 'JPEG':
+                # Let libjpeg decode at a reduced scale that still covers the
+                # target either way round (EXIF rotation is applied later).
+                side = max(width, height)
+                original.draft('RGB', (side, side))
+            elif 'fit' not in stages and 'transcode' not in stages and 'strip' not in stages:
+                original.draft('RGB', (256, 256))
+            image = ImageOps.exif_transpose(original)
+            image.load()
+        # Read after transposing, which drops the now-applied orientation tag.
+        exif = image.info.get('exif')
+        icc_profile = image.info.get('icc_profile')
+
+        if 'palette' in stages:
+            result['palette'] = extract_palette(image, options['palette_colors'])
+            palette_path = output_path(path, options, '.palette.json')
+            write_atomic(palette_path, json.dumps(result['palette']).encode())
+            result['outputs'].append(palette_path)
+
+        if not {'fit', 'transcode', 'strip'} & set(stages):
+            return result
+
+        if 'fit' in stages:
+            if options['fit_mode'] == 'crop':
+                image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+            else:
+                image = ImageOps.contain(image, (width, height), Image.Resampling.LANCZOS)
+
+        if 'transcode' in stages:
+            pillow_format, ext = FORMATS[options['format']]
+        else:
+            pillow_format, ext = source_format, os.path.splitext(path)[1]
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha and pillow_format != 'JPEG' else 'RGB')
+
+        save_options = {}
+        if pillow_format in ('JPEG', 'WEBP', 'AVIF'):
+            save_options['quality'] = options['quality']
+        if 'strip' not in stages:
+            if exif:
+                save_options['exif'] = exif
+            if icc_profile:
+                save_options['icc_profile'] = icc_profile
+        target = output_path(path, options, ext)
+        with atomic_path(target) as temp_path:
+            image.save(temp_path, format=pillow_format, **save_options)
+        result['outputs'].append(target)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+class PostProcessor:
+    def __init__(self, options, workers=None):
+        check_options(options)
+        self.options = options
+        self.workers = workers or os.cpu_count()
+        self._executor = None
+        self._lock = Lock()
+
+    def _pool(self):
+        # Created on first use. "spawn" because forking a process that runs
+        # Qt and download threads can deadlock the child.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, path, on_done=None):
+        # on_done(result) runs on a pool management thread.
+        future = self._pool().submit(process_image, path, self.options)
+        if on_done is not None:
+            def done(future):
+                if future.cancelled():
+                    return
+                error = future.exception()
+                if error is None:
+                    on_done(future.result())
+                else:
+                    on_done({'path': path, 'outputs': [], 'palette': None, 'error': str(error)})
+            future.add_done_callback(done)
+        return future
+
+    def process_batch(self, paths):
+        # Yields results as they finish, not in input order.
+        futures = [self._pool().submit(process_image, path, self.options) for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def shutdown(self, wait=False):
+        # wait=True finishes queued work; otherwise it is dropped.
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
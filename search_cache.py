@@ -0,0 +1,127 @@
+# search_cache.py
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+
+
+class CacheEntry:
+    __slots__ = ('posts', 'etag', 'last_modified', 'stored_at')
+
+    def __init__(self, posts, etag=None, last_modified=None):
+        self.posts = posts
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = time.monotonic()
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class Flight:
+    # One in-flight request that identical concurrent searches wait on.
+    def __init__(self):
+        self.done = Event()
+        self.waiters = 0
+        self.result = (None, None)
+
+    def wait(self):
+        self.done.wait()
+        return self.result
+
+
+class SearchCache:
+    def __init__(self, ttl=300, max_entries=200):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = Lock()
+        self.requests = 0
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(tags, excluded_tags, limit, page):
+        # The same query typed with tags in another order, or a tag repeated,
+        # maps to the same entry.
+        include, exclude = set(), set()
+        for tag in tags.split():
+            if tag.startswith('-'):
+                exclude.add(tag[1:])
+            else:
+                include.add(tag)
+        if excluded_tags:
+            exclude.update(tag.strip() for tag in excluded_tags.split(',') if tag.strip())
+        return tuple(sorted(include)), tuple(sorted(exclude)), limit, page
+
+    def lookup(self, key):
+        # Returns (entry, fresh); entry is None on a miss.
+        with self._lock:
+            self.requests += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(key)
+            fresh = time.monotonic() - entry.stored_at < self.ttl
+            if fresh:
+                self.fresh_hits += 1
+            return entry, fresh
+
+    def join_flight(self, key):
+        # Returns (flight, leader). Only the leader goes to the network.
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def finish_flight(self, key, flight, posts, error):
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.result = (posts, error)
+        flight.done.set()
+
+    def store(self, key, posts, etag=None, last_modified=None):
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = CacheEntry(posts, etag, last_modified)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, key):
+        # The server answered 304 Not Modified.
+        with self._lock:
+            self.revalidated += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.stored_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            served = self.fresh_hits + self.revalidated + self.coalesced
+            return {
+                'requests': self.requests,
+                'fresh_hits': self.fresh_hits,
+                'revalidated': self.revalidated,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'hit_rate': served / self.requests if self.requests else 0.0,
+                # Revalidations still cost a round trip, just not the body.
+                'saved_round_trips': self.fresh_hits + self.coalesced,
+                'entries': len(self._entries),
+            }
@@ -0,0 +1,127 @@
+# subscriptions.py
+# Saved tag queries polled for new posts. Each subscription keeps a "since
+# id" watermark, so a poll asks the server only for posts newer than the last
+# one it saw: one small request per subscription unless a lot is new.
+import json
+import os
+import time
+from threading import Lock
+
+from atomic_file import write_atomic
+from post import page_is_full, page_max_id
+from post_index import query_key
+
+
+class SubscriptionWatcher:
+    def __init__(self, api, subscriptions, excluded_tags, state_path, poll_limit=20, initial_posts=0, max_posts=200):
+        # subscriptions is a list of (name, tags); api is the source polled,
+        # normally the primary one so post ids match the local index.
+        self.api = api
+        self.subscriptions = subscriptions
+        self.excluded_tags = excluded_tags
+        self.state_path = state_path
+        self.poll_limit = max(1, min(poll_limit, api.MAX_LIMIT))
+        # Posts taken on the very first poll of a subscription; 0 only marks
+        # where the query stands, so old posts are not all downloaded.
+        self.initial_posts = initial_posts
+        # Cap per subscription and poll; older posts beyond it are left for
+        # the next poll.
+        self.max_posts = max_posts
+        self._lock = Lock()
+        self._state = self._load_state()
+
+    def poll(self, on_post=None, should_stop=None):
+        # One cycle over every subscription, one at a time so the source's
+        # rate limit is shared fairly. on_post(name, post) is called for each
+        # new post, oldest first. Returns a list of (name, new_posts, error).
+        results = []
+        with self._lock:
+            for name, tags in self.subscriptions:
+                if should_stop is not None and should_stop():
+                    break
+                posts, error = self._poll_one(name, tags)
+                if on_post is not None:
+                    for post in reversed(posts):
+                        on_post(name, post)
+                results.append((name, posts, error))
+        return results
+
+    def run(self, interval, stop_event, on_post=None, on_cycle=None):
+        # Polls every `interval` seconds until stop_event is set.
+        while not stop_event.is_set():
+            results = self.poll(on_post, should_stop=stop_event.is_set)
+            if on_cycle is not None:
+                on_cycle(results)
+            stop_event.wait(interval)
+
+    def watermark(self, tags):
+        entry = self._state.get(query_key(tags, self.excluded_tags))
+        return entry['since_id'] if entry else None
+
+    def _poll_one(self, name, tags):
+        key = query_key(tags, self.excluded_tags)
+        entry = self._state.get(key)
+        if entry is None:
+            posts, error = self.api.search_images(tags, self.excluded_tags, limit=max(1, self.initial_posts),
+                                                  use_cache=False)
+            if error:
+                return [], error
+            # Counted before blacklist filtering, so a hidden newest post
+            # still marks where the query stands.
+            self._advance(key, name, page_max_id(posts))
+            return posts[:self.initial_posts], None
+
+        # A poll cut short by max_posts leaves since_id alone and records
+        # where to carry on: below resume_below, down to since_id. The next
+        # polls work through that gap; then since_id becomes resume_max.
+        since_id = entry['since_id']
+        resume_below = entry.get('resume_below')
+        newest = entry['resume_max'] if resume_below else since_id
+        query = f"{tags} id:>{since_id}"
+        if resume_below:
+            query += f" id:<{resume_below}"
+        new, capped = [], False
+        for _, posts, error in self.api.iter_pages(query, self.excluded_tags, limit=self.poll_limit, use_cache=False):
+            if error:
+                # Pages come newest first, so keeping what did arrive would
+                # move the watermark past the posts that did not.
+                return [], error
+            # Blacklisted posts move the watermark too, or every poll would
+            # fetch them again.
+            newest = max(newest, page_max_id(posts))
+            # Posts arriving between pages shift them, so one can show up twice.
+            seen = {post.id for post in new}
+            new.extend(post for post in posts if post.id > since_id and post.id not in seen)
+            if len(new) >= self.max_posts:
+                capped = len(new) > self.max_posts or page_is_full(posts, self.poll_limit)
+                new = new[:self.max_posts]
+                break
+        if capped:
+            self._advance(key, name, since_id, resume_below=min(post.id for post in new), resume_max=newest)
+        else:
+            self._advance(key, name, newest)
+        return new, None
+
+    def _advance(self, key, name, since_id, resume_below=None, resume_max=None):
+        entry = {'name': name, 'since_id': since_id, 'polled_at': time.time()}
+        if resume_below:
+            entry.update(resume_below=resume_below, resume_max=resume_max)
+        self._state[key] = entry
+        self._save_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Could not read subscription state: {e}")
+            return {}
+
+    def _save_state(self):
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            write_atomic(self.state_path, json.dumps(self._state, indent=1))
+        except OSError as e:
+            print(f"Could not save subscription state: {e}")
@@ -0,0 +1,313 @@
+# tag_filter.py
+# Client-side tag filtering. An expression is a Moebooru-style tag query:
+# space-separated terms that must all match, "-term" for NOT, "~a ~b" or
+# "a or b" for OR, "( ... )" / "-( ... )" for grouping, "*" wildcards,
+# rating:s/q/e and score:>N, <=N, N..M. Expressions are compiled to clauses
+# of (required bits, forbidden bits, meta tests), with one bit per tag or
+# wildcard the filter mentions; a post's tags are turned into a bitmap with
+# one dict lookup each, so checking a post costs about the same however
+# long the blacklist is.
+import re
+from functools import lru_cache
+
+# Beyond this many clauses (OR-heavy or negated groups multiply out) an
+# expression is rejected rather than slowing down every check.
+MAX_CLAUSES = 256
+# Tags a wildcard filter has matched (and rating/score outcomes) are
+# remembered; past this many, new ones are worked out each time instead.
+MAX_CACHED_TAGS = 200000
+
+SCORE_TERM = re.compile(r"(>=|<=|>|<|=)?(-?\d+)$")
+SCORE_RANGE = re.compile(r"(-?\d+)\.\.(-?\d+)$")
+
+
+def parse_term(term):
+    # Atoms are hashable tuples so clauses can be sets of (atom, positive).
+    key, _, value = term.partition(':')
+    key = key.lower()
+    if key == 'rating' and value:
+        return ('rating', value[0].lower())
+    if key == 'score' and value:
+        span = SCORE_RANGE.match(value)
+        if span:
+            return ('score', int(span.group(1)), int(span.group(2)))
+        match = SCORE_TERM.match(value)
+        if not match:
+            raise ValueError(f"Invalid score term {term!r}, expected e.g. score:>10 or score:5..20")
+        op, n = match.group(1) or '=', int(match.group(2))
+        low, high = {'>': (n + 1, None), '>=': (n, None), '<': (None, n - 1), '<=': (None, n), '=': (n, n)}[op]
+        return ('score', low, high)
+    if '*' in term:
+        return ('wild', term)
+    return ('tag', term)
+
+
+def parse_expression(text):
+    # Returns a tree of ('and', [...]), ('or', [...]), ('not', node) and atoms.
+    tokens = text.split()
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def parse_or():
+        nonlocal pos
+        alternatives = [parse_and()]
+        while peek() in ('or', '|'):
+            pos += 1
+            alternatives.append(parse_and())
+        return alternatives[0] if len(alternatives) == 1 else ('or', alternatives)
+
+    def parse_and():
+        nonlocal pos
+        terms, either = [], []
+        while peek() not in (None, 'or', '|', ')'):
+            token = tokens[pos]
+            pos += 1
+            if token in ('(', '-('):
+                node = parse_or()
+                if peek() != ')':
+                    raise ValueError(f"Unbalanced parentheses in {text!r}")
+                pos += 1
+                terms.append(('not', node) if token == '-(' else node)
+            elif token.startswith('-') and len(token) > 1:
+                terms.append(('not', parse_term(token[1:])))
+            elif token.startswith('~') and len(token) > 1:
+                either.append(parse_term(token[1:]))
+            else:
+                terms.append(parse_term(token))
+        if either:
+            terms.append(either[0] if len(either) == 1 else ('or', either))
+        if not terms:
+            raise ValueError(f"Empty term in tag expression {text!r}")
+        return terms[0] if len(terms) == 1 else ('and', terms)
+
+    node = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"Unbalanced parentheses in {text!r}")
+    return node
+
+
+def to_clauses(node, negate=False):
+    # Disjunctive normal form: a list of clauses, each a frozenset of
+    # (atom, positive), any one of which matching means the node matches.
+    kind = node[0]
+    if kind == 'not':
+        return to_clauses(node[1], not negate)
+    if kind not in ('and', 'or'):
+        return [frozenset([(node, not negate)])]
+    parts = [to_clauses(child, negate) for child in node[1]]
+    if (kind == 'or') != negate:
+        clauses = [clause for part in parts for clause in part]
+    else:
+        clauses = [frozenset()]
+        for part in parts:
+            clauses = [a | b for a in clauses for b in part]
+            if len(clauses) > MAX_CLAUSES:
+                break
+    if len(clauses) > MAX_CLAUSES:
+        raise ValueError(f"Tag expression too complex (more than {MAX_CLAUSES} alternatives)")
+    # A clause requiring a term and its negation can never match.
+    return [clause for clause in clauses if not any((atom, not positive) in clause for atom, positive in clause)]
+
+
+def meta_test(atom, positive):
+    if atom[0] == 'rating':
+        letter = atom[1]
+        if positive:
+            return lambda post: bool(post.rating) and post.rating[0].lower() == letter
+        return lambda post: not post.rating or post.rating[0].lower() != letter
+    _, low, high = atom
+
+    def in_range(post):
+        score = post.score
+        return score is not None and (low is None or score >= low) and (high is None or score <= high)
+
+    return in_range if positive else lambda post: not in_range(post)
+
+
+def wildcard_regex(pattern):
+    return re.compile('.*'.join(re.escape(part) for part in pattern.split('*')))
+
+
+class TagFilter:
+    # A post matches when any of the expressions matches; match() says which.
+    # Used both for blacklists (matching posts are hidden) and for keeping
+    # only the posts a query expression selects.
+    def __init__(self, expressions):
+        self.expressions = [expression.strip() for expression in expressions if expression.strip()]
+        self.hits = [0] * len(self.expressions)
+        # tag -> index of a single-tag expression; checked as a set first.
+        self._single = {}
+        # tag -> bits of every exact term and wildcard it satisfies; only
+        # tags with some bits are kept. _seen is every tag already matched
+        # against the wildcards.
+        self._masks = {}
+        self._seen = set()
+        self._wildcards = []
+        # Clauses that require some tag are filed under their lowest
+        # required bit, so only those a post's bits point at are checked.
+        self._by_bit = {}
+        self._untagged = []
+        # Clauses requiring no tag only depend on the rating, the score and
+        # their forbidden bits, so their outcome is cached on those.
+        self._untagged_bits = 0
+        self._untagged_cache = {}
+        self._clause_count = 0
+        bits = {}
+
+        def bit(atom):
+            if atom not in bits:
+                bits[atom] = 1 << len(bits)
+            return bits[atom]
+
+        for index, expression in enumerate(self.expressions):
+            clauses = to_clauses(parse_expression(expression))
+            if len(clauses) == 1 and len(clauses[0]) == 1:
+                (atom, positive), = clauses[0]
+                if positive and atom[0] == 'tag':
+                    self._single.setdefault(atom[1], index)
+                    continue
+            for clause in clauses:
+                required = forbidden = 0
+                tests = []
+                for atom, positive in clause:
+                    if atom[0] in ('tag', 'wild'):
+                        if positive:
+                            required |= bit(atom)
+                        else:
+                            forbidden |= bit(atom)
+                    else:
+                        tests.append(meta_test(atom, positive))
+                clause = (required, forbidden, tuple(tests), index)
+                if required:
+                    self._by_bit.setdefault(required & -required, []).append(clause)
+                else:
+                    self._untagged.append(clause)
+                    self._untagged_bits |= forbidden
+                self._clause_count += 1
+
+        for atom, value in bits.items():
+            if atom[0] == 'wild':
+                self._wildcards.append((wildcard_regex(atom[1]), value))
+        for atom, value in bits.items():
+            if atom[0] == 'tag':
+                self._masks[atom[1]] = value | self._wildcard_bits(atom[1])
+                self._seen.add(atom[1])
+
+    def __bool__(self):
+        return bool(self.expressions)
+
+    def match(self, post):
+        # Index of an expression the post matches, or None.
+        tags = post.tags
+        single = self._single
+        if single and not single.keys().isdisjoint(tags):
+            return min(single[tag] for tag in single.keys() & set(tags))
+        if not self._clause_count:
+            return None
+        mask = self._mask(tags)
+        if self._untagged:
+            key = (post.rating, post.score, mask & self._untagged_bits)
+            index = self._untagged_cache.get(key, -1)
+            if index == -1:
+                index = self._first_match(self._untagged, mask, post)
+                if len(self._untagged_cache) < MAX_CACHED_TAGS:
+                    self._untagged_cache[key] = index
+            if index is not None:
+                return index
+        bits = mask
+        while bits:
+            low = bits & -bits
+            index = self._first_match(self._by_bit.get(low, ()), mask, post)
+            if index is not None:
+                return index
+            bits ^= low
+        return None
+
+    @staticmethod
+    def _first_match(clauses, mask, post):
+        for required, forbidden, tests, index in clauses:
+            if mask & required != required or mask & forbidden:
+                continue
+            for test in tests:
+                if not test(post):
+                    break
+            else:
+                return index
+        return None
+
+    def matches(self, post):
+        return self.match(post) is not None
+
+    def filter(self, posts):
+        # The posts matching no expression; counts what each one removed.
+        kept, hits = [], self.hits
+        for post in posts:
+            index = self.match(post)
+            if index is None:
+                kept.append(post)
+            else:
+                hits[index] += 1
+        return kept
+
+    def select(self, posts):
+        return [post for post in posts if self.match(post) is not None]
+
+    def plain_tags(self):
+        # Expressions that are a single tag, i.e. what a server or the local
+        # index can exclude with "-tag".
+        return list(self._single)
+
+    def server_excludes(self, budget):
+        # The plain tags sent as "-tag" when only `budget` fit in the query:
+        # the first ones listed. Always the same ones, since pages are fetched
+        # by offset and a query that changed between pages would skip or
+        # repeat posts. Everything else is filtered locally.
+        if budget <= 0:
+            return []
+        return list(self._single)[:budget]
+
+    def _mask(self, tags):
+        masks = self._masks
+        mask = 0
+        if self._wildcards and not self._seen.issuperset(tags):
+            seen = self._seen
+            for tag in set(tags) - seen:
+                bits = self._wildcard_bits(tag)
+                if len(seen) >= MAX_CACHED_TAGS:
+                    mask |= bits
+                    continue
+                seen.add(tag)
+                if bits:
+                    masks[tag] = bits
+        for tag in masks.keys() & tags:
+            mask |= masks[tag]
+        return mask
+
+    def _wildcard_bits(self, tag):
+        bits = 0
+        for regex, value in self._wildcards:
+            if regex.fullmatch(tag):
+                bits |= value
+        return bits
+
+
+def split_blacklist(text):
+    # autoexclude_tags is a comma-separated list; each entry is an expression.
+    return [entry.strip() for entry in (text or "").split(',') if entry.strip()]
+
+
+@lru_cache(maxsize=16)
+def compile_blacklist(text):
+    # Shared per blacklist string, so every source (and search thread) adds
+    # to the same hit counts. Malformed entries are reported and skipped.
+    entries = []
+    for entry in split_blacklist(text):
+        try:
+            to_clauses(parse_expression(entry))
+        except ValueError as e:
+            print(f"Ignoring autoexclude entry: {e}")
+            continue
+        entries.append(entry)
+    return TagFilter(entries)
@@ -0,0 +1,31 @@
+# tests/conftest.py
+import os
+import sys
+from http.server import ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def serve():
+    # serve(handler_class, **attributes) starts a local HTTP server on a free
+    # port and returns (server, base_url); attributes are set on the server
+    # for the handler to read through self.server.
+    servers = []
+
+    def start(handler, **attributes):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        for name, value in attributes.items():
+            setattr(server, name, value)
+        Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,28 @@
+# tests/test_atomic_file.py
+import os
+
+import pytest
+
+from atomic_file import atomic_path, write_atomic
+
+
+def test_write_replaces_the_file(tmp_path):
+    path = str(tmp_path / "state.json")
+    write_atomic(path, "old")
+    write_atomic(path, b"new")
+    with open(path) as f:
+        assert f.read() == "new"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_failed_write_leaves_the_old_file(tmp_path):
+    path = str(tmp_path / "state.json")
+    write_atomic(path, "old")
+    with pytest.raises(RuntimeError):
+        with atomic_path(path) as tmp:
+            with open(tmp, 'w') as f:
+                f.write("half")
+            raise RuntimeError("crashed mid-write")
+    with open(path) as f:
+        assert f.read() == "old"
+    assert os.listdir(tmp_path) == ["state.json"]
@@ -0,0 +1,181 @@
+# tests/test_download_engine.py
+import hashlib
+import json
+import os
+import random
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from download_engine import DownloadCancelled, DownloadEngine, DownloadError
+
+DATA = random.Random(0).randbytes(512 * 1024)
+MD5 = hashlib.md5(DATA).hexdigest()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    # Serves DATA, honouring Range headers when server.ranges is set. Each
+    # GET takes the next entry of server.drops (bytes sent before the
+    # connection is closed mid-body), then of server.errors (a status sent
+    # instead of the body).
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def respond(self, body):
+        server = self.server
+        range_header = self.headers.get('Range')
+        with server.lock:
+            server.requests.append((self.command, range_header))
+            drop = server.drops.pop(0) if body and server.drops else None
+            error = server.errors.pop(0) if body and drop is None and server.errors else None
+        if error:
+            self.send_response(error)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start, end, status = 0, len(DATA) - 1, 200
+        if range_header and server.ranges:
+            first, _, last = range_header[len('bytes='):].partition('-')
+            start = int(first)
+            if start >= len(DATA):
+                with server.lock:
+                    server.unsatisfiable += 1
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(DATA)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            end = min(int(last), end) if last else end
+            status = 206
+        payload = DATA[start:end + 1]
+        self.send_response(status)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(DATA)}")
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if not body:
+            return
+        if drop is not None:
+            self.wfile.write(payload[:drop])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def range_server(serve):
+    def start(ranges=True, drops=(), errors=()):
+        server, base = serve(RangeHandler, ranges=ranges, drops=list(drops), errors=list(errors),
+                             requests=[], unsatisfiable=0, lock=threading.Lock())
+        return server, f"{base}/image.jpg"
+    return start
+
+
+def make_engine(**kwargs):
+    kwargs.setdefault('max_retries', 3)
+    return DownloadEngine(requests.Session(), timeout=(2, 5), backoff=0, **kwargs)
+
+
+def gets(server):
+    return [range_header for method, range_header in server.requests if method == 'GET']
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_resumes_after_dropped_connections(range_server, tmp_path):
+    server, url = range_server(drops=[150000, 150000, 150000])
+    path = str(tmp_path / "image.jpg")
+    assert make_engine().download(url, path, expected_size=len(DATA), md5=MD5) == path
+    assert read(path) == DATA
+    assert not os.path.exists(path + ".part")
+    ranges = gets(server)
+    assert ranges[0] is None
+    offsets = [int(r[len('bytes='):].rstrip('-')) for r in ranges[1:]]
+    assert len(offsets) == 3 and offsets == sorted(offsets) and offsets[0] > 0
+
+
+def test_full_reply_to_range_request_starts_over(range_server, tmp_path):
+    server, url = range_server(ranges=False, drops=[150000])
+    path = str(tmp_path / "image.jpg")
+    make_engine().download(url, path, md5=MD5)
+    assert read(path) == DATA
+    ranges = gets(server)
+    assert len(ranges) == 2 and ranges[1] is not None
+
+
+def test_unsatisfiable_range_restarts_download(range_server, tmp_path):
+    server, url = range_server()
+    path = str(tmp_path / "image.jpg")
+    with open(path + ".part", 'wb') as f:
+        f.write(b"\0" * (len(DATA) + 10))
+    make_engine().download(url, path, md5=MD5)
+    assert read(path) == DATA
+    assert server.unsatisfiable == 1
+
+
+def test_md5_mismatch_is_an_error(range_server, tmp_path):
+    _, url = range_server()
+    path = str(tmp_path / "image.jpg")
+    with pytest.raises(DownloadError, match="MD5"):
+        make_engine().download(url, path, md5="0" * 32)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".part")
+
+
+def test_cancel_removes_partial_file(range_server, tmp_path):
+    _, url = range_server()
+    path = str(tmp_path / "image.jpg")
+    cancel_event = threading.Event()
+    with pytest.raises(DownloadCancelled):
+        make_engine().download(url, path, progress=lambda n: cancel_event.set(), cancel_event=cancel_event)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".part")
+
+
+def test_segmented_download_survives_drops(range_server, tmp_path):
+    server, url = range_server(drops=[100000] * 3)
+    path = str(tmp_path / "image.jpg")
+    make_engine(segments=4, segment_threshold=1).download(url, path, md5=MD5)
+    assert read(path) == DATA
+    assert not os.path.exists(path + ".part.json")
+    assert ('HEAD', None) in server.requests
+    assert all(r is not None for r in gets(server))
+
+
+def test_segmented_download_resumes_from_sidecar(range_server, tmp_path):
+    # Every segment loses its connection part way, then gets a 503 with no
+    # retries left: the attempt fails and leaves .part and .part.json behind.
+    server, url = range_server(drops=[100000] * 4, errors=[503] * 8)
+    path = str(tmp_path / "image.jpg")
+    with pytest.raises(DownloadError):
+        make_engine(segments=4, segment_threshold=1, max_retries=0).download(url, path, md5=MD5)
+    with open(path + ".part.json") as f:
+        state = json.load(f)
+    assert state['total'] == len(DATA)
+    assert any(position > start for start, position, _ in state['segments'])
+
+    server.requests.clear()
+    server.errors.clear()
+    make_engine(segments=4).download(url, path, md5=MD5)
+    assert read(path) == DATA
+    assert not os.path.exists(path + ".part.json")
+    # Each unfinished segment continues from its saved position.
+    expected = sorted(f"bytes={position}-{end}" for _, position, end in state['segments'] if position <= end)
+    assert sorted(gets(server)) == expected
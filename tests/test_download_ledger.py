@@ -0,0 +1,39 @@
+# tests/test_download_ledger.py
+import hashlib
+import os
+import threading
+
+from download_ledger import DownloadLedger
+
+
+def test_scan_skips_files_it_cannot_read(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    (folder / "good.jpg").write_bytes(b"image")
+    os.symlink(folder / "missing.jpg", folder / "dangling.jpg")
+    ledger = DownloadLedger(str(tmp_path / "ledger.sqlite3"))
+
+    assert ledger.scan_folder(str(folder), workers=2) == 1
+    assert ledger.lookup(md5=hashlib.md5(b"image").hexdigest()) == str(folder / "good.jpg")
+    assert ledger.was_scanned(str(folder))
+
+
+def test_counter_is_shared_between_connections(tmp_path):
+    # Two ledgers on one file stand in for the GUI and the CLI.
+    path = str(tmp_path / "ledger.sqlite3")
+    first, second = DownloadLedger(path), DownloadLedger(path)
+    assert first.counter() is None
+    first.start_counter(41)
+    second.start_counter(7)
+    numbers = []
+
+    def draw(ledger):
+        for _ in range(50):
+            numbers.append(ledger.next_counter())
+
+    threads = [threading.Thread(target=draw, args=(ledger,)) for ledger in (first, second, first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(numbers) == list(range(42, 242))
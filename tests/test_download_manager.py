@@ -0,0 +1,29 @@
+# tests/test_download_manager.py
+import json
+
+from download_ledger import DownloadLedger, FilenameTemplate
+from download_manager import DownloadManager
+from metrics import Metrics
+from post import Post
+
+
+class FakeAPI:
+    def __init__(self):
+        self.metrics = Metrics()
+
+
+def make_post(post_id):
+    return Post(id=post_id, author='', tags=(), download_url=f"http://127.0.0.1:9/{post_id}.jpg", preview_url='')
+
+
+def test_duplicates_do_not_use_up_counter_numbers(tmp_path):
+    ledger = DownloadLedger(str(tmp_path / "ledger.sqlite3"))
+    manager = DownloadManager(FakeAPI(), str(tmp_path / "queue.json"), ledger=ledger)
+    template = FilenameTemplate("{counter}{ext}")
+    folder = str(tmp_path)
+    for post in (make_post(1), make_post(1), make_post(2), make_post(1)):
+        manager.enqueue(post.download_url, template.save_path(folder, post, ledger), post_id=post.id)
+    manager.flush_queue()
+    with open(tmp_path / "queue.json") as f:
+        assert [job['filename'] for job in json.load(f)] == ["1.jpg", "2.jpg"]
+    assert ledger.counter() == 2
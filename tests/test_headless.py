@@ -0,0 +1,19 @@
+# tests/test_headless.py
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# cli.py runs where there is no display (servers, cron), so it and every
+# module it builds on must never import PyQt6, not even indirectly.
+HEADLESS = ['cli', 'atomic_file', 'booru_sources', 'config_manager', 'download_engine', 'download_ledger',
+            'download_manager', 'konachan_api', 'metrics', 'post', 'post_index', 'post_process', 'search_cache',
+            'subscriptions', 'tag_filter', 'thumbnail_cache', 'transport']
+
+
+def test_headless_modules_do_not_import_qt():
+    code = "import sys\n" + "".join(f"import {name}\n" for name in HEADLESS) + \
+        "print(sorted(name for name in sys.modules if name.startswith('PyQt6')))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
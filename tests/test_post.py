@@ -0,0 +1,64 @@
+# tests/test_post.py
+import json
+
+import pytest
+
+from post import iter_json_array, parse_posts
+
+VALUES = [
+    {"id": 1, "tags": "cat", "source": "a \"quoted\" ] } [ { , value"},
+    {"id": 2, "author": "猫 ✓ 😀", "note": "back\\slash \\\" é"},
+    [1, [2, {"x": "]"}]],
+    12345,
+    -0.5e3,
+    "plain [string]",
+    True,
+    None,
+    {},
+    [],
+]
+BODY = json.dumps(VALUES, ensure_ascii=False).encode('utf-8')
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, len(BODY)])
+def test_elements_survive_any_chunk_boundary(size):
+    assert list(iter_json_array(split(BODY, size))) == VALUES
+
+
+def test_every_split_point():
+    # Cuts inside escapes, multi-byte characters and numbers included.
+    for cut in range(1, len(BODY)):
+        assert list(iter_json_array([BODY[:cut], BODY[cut:]])) == VALUES
+
+
+def test_whitespace_and_empty_chunks():
+    assert list(iter_json_array([b"", b" \n[ ", b"", b"{\"a\": 1} ,\n", b"2 ]  "])) == [{"a": 1}, 2]
+    assert list(iter_json_array([b"[]"])) == []
+
+
+def test_elements_arrive_before_the_array_ends():
+    chunks = iter([b'[{"id": 1}, {"id"', b': 2}'])
+    elements = iter_json_array(chunks)
+    assert next(elements) == {"id": 1}
+    assert next(elements) == {"id": 2}
+    with pytest.raises(ValueError, match="Truncated"):
+        next(elements)
+
+
+def test_bad_input_is_an_error():
+    with pytest.raises(ValueError, match="Expected a JSON array"):
+        list(iter_json_array([b'{"id": 1}']))
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[{"id": 1}, {"id": ']))
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[{"id": 1}, nonsense]']))
+
+
+def test_parse_posts_skips_what_from_json_rejects():
+    posts = parse_posts(split(b'[{"id": 1}, {"id": 2}, {"id": 3}]', 4),
+                        from_json=lambda data: data['id'] if data['id'] != 2 else None)
+    assert list(posts) == [1, 3]
@@ -0,0 +1,68 @@
+# tests/test_post_index.py
+from post import Post, PostPage
+from post_index import PostIndex
+from tag_filter import compile_blacklist
+
+
+class FakeAPI:
+    # Newest first, MAX_LIMIT posts per page; understands id:> and id:<.
+    # Posts in `gore` carry that tag and are dropped by a blacklist after
+    # fetching, like KonachanAPI.search_images does.
+    MAX_LIMIT = 2
+
+    def __init__(self, ids, gore=()):
+        self.ids = sorted(ids, reverse=True)
+        self.gore = set(gore)
+        self.requests = 0
+
+    def iter_pages(self, tags, excluded_tags, limit=50, use_cache=True):
+        ids = self.ids
+        for term in tags.split():
+            if term.startswith('id:>'):
+                ids = [i for i in ids if i > int(term[4:])]
+            elif term.startswith('id:<'):
+                ids = [i for i in ids if i < int(term[4:])]
+        for page, start in enumerate(range(0, len(ids) + 1, limit), 1):
+            self.requests += 1
+            posts = [Post(id=i, author='', tags=('cat', 'gore') if i in self.gore else ('cat',),
+                          download_url='', preview_url='')
+                     for i in ids[start:start + limit]]
+            yield page, PostPage(compile_blacklist(excluded_tags).filter(posts), fetched=len(posts),
+                                 max_id=max(post.id for post in posts) if posts else 0), None
+            if len(posts) < limit:
+                return
+
+
+def test_capped_sync_resumes_where_it_stopped(tmp_path):
+    index = PostIndex(str(tmp_path / "posts.sqlite3"))
+    api = FakeAPI(range(1, 4))
+    assert len(index.sync(api, "cat", "")[0]) == 3
+    assert not index.sync_pending("cat", "")
+
+    # Seven new posts, but only room for four per sync: the older three
+    # must not be skipped.
+    api.ids = sorted(range(1, 11), reverse=True)
+    added, _ = index.sync(api, "cat", "", max_posts=4)
+    assert [post.id for post in added] == [10, 9, 8, 7]
+    assert index.sync_pending("cat", "")
+    added, _ = index.sync(api, "cat", "", max_posts=4)
+    assert [post.id for post in added] == [6, 5, 4]
+    assert not index.sync_pending("cat", "")
+    assert index.count() == 10
+
+    api.ids = sorted(range(1, 12), reverse=True)
+    assert [post.id for post in index.sync(api, "cat", "")[0]] == [11]
+
+
+def test_blacklisted_posts_are_not_fetched_again(tmp_path):
+    index = PostIndex(str(tmp_path / "posts.sqlite3"))
+    api = FakeAPI(range(1, 4), gore={3})
+    assert [post.id for post in index.sync(api, "cat", "gore")[0]] == [2, 1]
+    api.requests = 0
+    assert index.sync(api, "cat", "gore") == ([], None)
+    assert api.requests == 1
+    api.ids = [5, 4] + api.ids
+    api.gore.add(5)
+    assert [post.id for post in index.sync(api, "cat", "gore")[0]] == [4]
+    assert index.sync(api, "cat", "gore") == ([], None)
+    assert api.requests == 4
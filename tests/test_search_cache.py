@@ -0,0 +1,122 @@
+# tests/test_search_cache.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from konachan_api import SEARCH_SUPERSEDED, KonachanAPI
+
+POSTS = [{"id": i, "tags": "cat", "file_url": f"http://127.0.0.1:9/{i}.jpg"} for i in range(40, 0, -1)]
+BODY = json.dumps(POSTS).encode()
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    # Sends the first half of BODY, then waits for server.release before
+    # sending the rest, so tests can line callers up on one request.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        half = len(BODY) // 2
+        self.wfile.write(BODY[:half])
+        self.wfile.flush()
+        server.release.wait(5)
+        self.wfile.write(BODY[half:])
+
+
+@pytest.fixture
+def api(serve):
+    server, base = serve(PageHandler, requests=0, release=threading.Event(), lock=threading.Lock())
+    api = KonachanAPI(name='test', base_url=f"{base}/post.json")
+    api.server = server
+    return api
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def search(api, results, should_stop=None):
+    results.append(api.search_images("cat", "", limit=40, should_stop=should_stop))
+
+
+def ids(result):
+    posts, error = result
+    assert error is None
+    return [post.id for post in posts]
+
+
+def test_identical_searches_share_one_request(api):
+    results = []
+    leader = threading.Thread(target=search, args=(api, results))
+    leader.start()
+    wait_for(lambda: api.server.requests == 1)
+    follower = threading.Thread(target=search, args=(api, results))
+    follower.start()
+    wait_for(lambda: api.search_cache.coalesced == 1)
+    api.server.release.set()
+    leader.join()
+    follower.join()
+    assert api.server.requests == 1
+    assert ids(results[0]) == ids(results[1]) == list(range(40, 0, -1))
+
+
+def test_superseded_search_is_not_cached(api):
+    api.server.release.set()
+    assert api.search_images("cat", "", limit=40, should_stop=lambda: True) == (None, SEARCH_SUPERSEDED)
+    assert ids(api.search_images("cat", "", limit=40)) == list(range(40, 0, -1))
+    assert api.server.requests == 2
+    # Now it is cached.
+    assert ids(api.search_images("cat", "", limit=40)) == list(range(40, 0, -1))
+    assert api.server.requests == 2
+
+
+def test_leader_with_waiters_is_not_superseded(api):
+    superseded = threading.Event()
+    results = []
+    leader = threading.Thread(target=search, args=(api, results, superseded.is_set))
+    leader.start()
+    wait_for(lambda: api.server.requests == 1)
+    follower = threading.Thread(target=search, args=(api, results))
+    follower.start()
+    wait_for(lambda: api.search_cache.coalesced == 1)
+    # The leader's own caller gives up, but someone is still waiting.
+    superseded.set()
+    api.server.release.set()
+    leader.join()
+    follower.join()
+    assert [ids(result) for result in results] == [list(range(40, 0, -1))] * 2
+    assert api.server.requests == 1
+
+
+def test_follower_of_a_superseded_leader_fetches_for_itself(api):
+    # The follower joins just as the leader decides to give up, i.e. after
+    # the leader checked for waiters and before the flight is finished.
+    api.server.release.set()
+    results = []
+    follower = threading.Thread(target=search, args=(api, results))
+
+    def give_up():
+        if not follower.is_alive():
+            follower.start()
+            wait_for(lambda: api.search_cache.coalesced == 1)
+        return True
+
+    assert api.search_images("cat", "", limit=40, should_stop=give_up) == (None, SEARCH_SUPERSEDED)
+    follower.join()
+    assert ids(results[0]) == list(range(40, 0, -1))
+    assert api.server.requests == 2
@@ -0,0 +1,81 @@
+# tests/test_subscriptions.py
+from post import Post, PostPage
+from subscriptions import SubscriptionWatcher
+from tag_filter import compile_blacklist
+
+
+class FakeAPI:
+    # Newest first; understands id:> and id:<, drops blacklisted posts after fetching
+    # them like KonachanAPI.search_images, and counts requests.
+    MAX_LIMIT = 3
+
+    def __init__(self, posts):
+        self.posts = posts
+        self.requests = 0
+
+    def search_images(self, tags, excluded_tags, limit=50, page=1, use_cache=True):
+        self.requests += 1
+        posts = sorted(self.posts, key=lambda post: -post.id)
+        for term in tags.split():
+            if term.startswith('id:>'):
+                posts = [post for post in posts if post.id > int(term[4:])]
+            elif term.startswith('id:<'):
+                posts = [post for post in posts if post.id < int(term[4:])]
+        posts = posts[(page - 1) * limit:page * limit]
+        kept = compile_blacklist(excluded_tags).filter(posts)
+        return PostPage(kept, fetched=len(posts), max_id=max((post.id for post in posts), default=0)), None
+
+    def iter_pages(self, tags, excluded_tags, limit=50, use_cache=True):
+        page = 1
+        while True:
+            posts, error = self.search_images(tags, excluded_tags, limit=limit, page=page)
+            yield page, posts, error
+            if posts.fetched < limit:
+                return
+            page += 1
+
+
+def make_post(post_id, *tags):
+    return Post(id=post_id, author='', tags=('cat',) + tags, download_url='', preview_url='')
+
+
+def test_blacklisted_posts_move_the_watermark(tmp_path):
+    api = FakeAPI([make_post(i) for i in range(1, 10)] + [make_post(10, 'gore')])
+    watcher = SubscriptionWatcher(api, [("cats", "cat")], "gore", str(tmp_path / "state.json"))
+    assert watcher.poll() == [("cats", [], None)]
+    assert watcher.watermark("cat") == 10
+
+    api.posts += [make_post(11), make_post(12, 'gore')]
+    (_, new, _), = watcher.poll()
+    assert [post.id for post in new] == [11]
+    assert watcher.watermark("cat") == 12
+
+    # Nothing new: a single request that comes back empty.
+    api.requests = 0
+    assert watcher.poll() == [("cats", [], None)]
+    assert api.requests == 1
+
+
+def test_capped_poll_resumes_where_it_stopped(tmp_path):
+    api = FakeAPI([make_post(i) for i in range(1, 11)])
+    watcher = SubscriptionWatcher(api, [("cats", "cat")], "", str(tmp_path / "state.json"), max_posts=3)
+    watcher.poll()
+    assert watcher.watermark("cat") == 10
+
+    # Eight new posts, three per poll: none may be skipped.
+    api.posts += [make_post(i) for i in range(11, 19)]
+    polled = []
+    for _ in range(3):
+        (_, new, _), = watcher.poll()
+        polled.append([post.id for post in new])
+    assert polled == [[18, 17, 16], [15, 14, 13], [12, 11]]
+    assert watcher.watermark("cat") == 18
+
+    # The state survives a restart.
+    api.posts += [make_post(i) for i in range(19, 24)]
+    watcher.poll()
+    watcher = SubscriptionWatcher(api, [("cats", "cat")], "", str(tmp_path / "state.json"), max_posts=3)
+    (_, new, _), = watcher.poll()
+    assert [post.id for post in new] == [20, 19]
+    assert watcher.poll() == [("cats", [], None)]
+    assert watcher.watermark("cat") == 23
@@ -0,0 +1,26 @@
+# tests/test_tag_filter.py
+from konachan_api import KonachanAPI
+from post import Post
+from tag_filter import compile_blacklist
+
+BLACKLIST = "b0, b1, b2, b3, b4, b5, b6, b7, b8, *_gore, rating:e score:<5"
+
+
+def make_post(post_id, *tags):
+    return Post(id=post_id, author='', tags=tags, download_url='', preview_url='')
+
+
+def test_server_excludes_are_the_first_plain_tags():
+    blacklist = compile_blacklist(BLACKLIST)
+    assert blacklist.server_excludes(3) == ['b0', 'b1', 'b2']
+    assert blacklist.server_excludes(0) == []
+
+
+def test_query_does_not_change_between_pages():
+    # Filtering page 1 must not change what page 2 asks the server for, or
+    # offset pagination would skip or repeat posts.
+    api = KonachanAPI(name='test', base_url='http://127.0.0.1:9/post.json')
+    first = api.build_params("cat", BLACKLIST, page=1)
+    compile_blacklist(BLACKLIST).filter([make_post(i, 'cat', 'b8') for i in range(50)])
+    second = api.build_params("cat", BLACKLIST, page=2)
+    assert first['tags'] == second['tags'] == "cat -b0 -b1 -b2 -b3 -b4"
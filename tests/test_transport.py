@@ -0,0 +1,177 @@
+# tests/test_transport.py
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from transport import CircuitOpenError, create_session, parse_retry_after
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    # Each request takes the next entry of server.replies, a status or a
+    # (status, Retry-After) pair; 200 once they run out. server.watch, if
+    # set, is called per request and its result kept in server.seen.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.respond()
+
+    def respond(self):
+        server = self.server
+        with server.lock:
+            reply = server.replies.pop(0) if server.replies else 200
+            server.requests.append((self.command, time.monotonic()))
+            if server.watch:
+                server.seen.append(server.watch())
+        status, retry_after = reply if isinstance(reply, tuple) else (reply, None)
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header('Retry-After', retry_after)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+@pytest.fixture
+def status_server(serve):
+    def start(replies=()):
+        return serve(StatusHandler, replies=list(replies), requests=[], watch=None, seen=[], lock=threading.Lock())
+    return start
+
+
+def make_session(**options):
+    options.setdefault('backoff', 0)
+    session = create_session(**options)
+    return session, session.get_adapter("http://")
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-5") == 0.0
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after(formatdate(time.time() - 10, usegmt=True)) == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_retry_after_is_waited_out(status_server):
+    server, base = status_server([(429, "0.3")])
+    session, adapter = make_session()
+    assert session.get(base).status_code == 200
+    (_, first), (_, second) = server.requests
+    assert second - first >= 0.3
+    assert adapter.retried == 1
+    # A 429 means the host is up: it does not count towards the breaker.
+    assert adapter.breaker("127.0.0.1").failures == 0
+
+
+def test_retry_after_is_capped(status_server):
+    server, base = status_server([(503, "3600")])
+    session, _ = make_session(max_retry_after=0.1)
+    start = time.monotonic()
+    assert session.get(base).status_code == 200
+    assert time.monotonic() - start < 5
+    assert len(server.requests) == 2
+
+
+def test_gives_up_after_max_retries(status_server):
+    server, base = status_server([503] * 10)
+    session, adapter = make_session(max_retries=2)
+    assert session.get(base).status_code == 503
+    assert len(server.requests) == 3
+    assert adapter.retried == 2
+
+
+def test_post_is_not_retried(status_server):
+    server, base = status_server([503, 503])
+    session, adapter = make_session()
+    assert session.post(base, data=b"x").status_code == 503
+    assert [method for method, _ in server.requests] == ['POST']
+    assert adapter.retried == 0
+
+
+def test_connection_errors_are_retried_up_to_the_limit():
+    # Nothing listens on port 9 of localhost; every attempt is refused.
+    session, adapter = make_session(max_retries=2, breaker_threshold=0)
+    with pytest.raises(requests.ConnectionError):
+        session.get("http://127.0.0.1:9/")
+    assert adapter.requests == 3
+
+
+def test_circuit_breaker_opens_then_half_opens_then_closes(status_server):
+    server, base = status_server([503, 503, 503])
+    session, adapter = make_session(max_retries=0, breaker_threshold=2, breaker_reset=0.2)
+    breaker = adapter.breaker("127.0.0.1")
+    server.watch = lambda: breaker.state
+
+    assert session.get(base).status_code == 503
+    assert breaker.state == 'closed'
+    assert session.get(base).status_code == 503
+    assert breaker.state == 'open'
+
+    # While open, requests fail without reaching the server.
+    with pytest.raises(CircuitOpenError):
+        session.get(base)
+    assert len(server.requests) == 2 and adapter.rejected == 1
+
+    # After breaker_reset one trial request goes through; it fails, so the
+    # breaker opens again straight away.
+    time.sleep(0.25)
+    assert session.get(base).status_code == 503
+    assert server.seen[-1] == 'half-open'
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        session.get(base)
+
+    # The next trial succeeds and closes it.
+    time.sleep(0.25)
+    assert session.get(base).status_code == 200
+    assert server.seen[-1] == 'half-open'
+    assert breaker.state == 'closed'
+    assert session.get(base).status_code == 200
+    assert adapter.stats()['breakers'] == {'127.0.0.1': 'closed'}
+
+
+def test_429_during_half_open_closes_the_breaker(status_server):
+    server, base = status_server([503, 503, (429, "0")])
+    session, adapter = make_session(max_retries=0, breaker_threshold=2, breaker_reset=0.2)
+    breaker = adapter.breaker("127.0.0.1")
+    session.get(base)
+    session.get(base)
+    assert breaker.state == 'open'
+    time.sleep(0.25)
+    # The mirror answers, if only to say "slow down": it is up.
+    assert session.get(base).status_code == 429
+    assert breaker.state == 'closed'
+    assert session.get(base).status_code == 200
+
+
+def test_interrupted_trial_does_not_keep_the_breaker_open(status_server, monkeypatch):
+    server, base = status_server([503, 503])
+    session, adapter = make_session(max_retries=0, breaker_threshold=2, breaker_reset=0.2)
+    breaker = adapter.breaker("127.0.0.1")
+    session.get(base)
+    session.get(base)
+    time.sleep(0.25)
+
+    def interrupted(*args, **kwargs):
+        raise RuntimeError("interrupted")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(requests.adapters.HTTPAdapter, "send", interrupted)
+        with pytest.raises(RuntimeError):
+            session.get(base)
+    assert breaker.state == 'open'
+    # The next request is the trial instead.
+    assert session.get(base).status_code == 200
+    assert breaker.state == 'closed'
@@ -0,0 +1,186 @@
+# thumbnail_cache.py
+import hashlib
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from atomic_file import write_atomic
+
+
+class MemoryCache:
+    # LRU of decoded objects, bounded by the byte size reported on put().
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._items[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.current_bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+
+class DiskCache:
+    # Blobs are stored by the sha256 of their content; an sqlite index maps
+    # each URL to its blob plus the validators needed to revalidate it.
+    def __init__(self, cache_dir, max_bytes, max_age=24 * 3600):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.bytes_served = 0
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._db.commit()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def lookup(self, url):
+        # Returns (data, entry) where entry holds the validators, or (None, None).
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, etag, last_modified, fetched_at FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None, None
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        try:
+            with open(self._blob_path(row[0]), 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._db.commit()
+                self.misses += 1
+            return None, None
+        with self._lock:
+            self.hits += 1
+            self.bytes_served += len(data)
+        entry = {'etag': row[1], 'last_modified': row[2], 'fresh': time.time() - row[3] < self.max_age}
+        return data, entry
+
+    def validators(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def touch(self, url):
+        # The server answered 304; the cached copy is fresh again.
+        with self._lock:
+            self.revalidated += 1
+            self._db.execute("UPDATE entries SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+
+    def store(self, url, data, etag=None, last_modified=None):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, data)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, len(data), etag, last_modified, now, now),
+            )
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, digest, size in self._db.execute(
+            "SELECT url, digest, size FROM entries ORDER BY accessed_at"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            total -= size
+            still_used = self._db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+            if not still_used:
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+        self._db.commit()
+
+    def size(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, memory_bytes=64 * 1024 * 1024, disk_bytes=256 * 1024 * 1024, max_age=24 * 3600):
+        self.memory = MemoryCache(memory_bytes)
+        self.disk = DiskCache(cache_dir, disk_bytes, max_age=max_age)
+        self.network_fetches = 0
+        self.network_bytes = 0
+
+    def record_network(self, nbytes):
+        self.network_fetches += 1
+        self.network_bytes += nbytes
+
+    def stats(self):
+        return {
+            'memory_hits': self.memory.hits,
+            'memory_misses': self.memory.misses,
+            'memory_bytes': self.memory.current_bytes,
+            'disk_hits': self.disk.hits,
+            'disk_misses': self.disk.misses,
+            'disk_revalidated': self.disk.revalidated,
+            'disk_bytes_served': self.disk.bytes_served,
+            'disk_bytes': self.disk.size(),
+            'network_fetches': self.network_fetches,
+            'network_bytes': self.network_bytes,
+        }
@@ -0,0 +1,183 @@
+# thumbnail_loader.py
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import requests
+from PyQt6.QtCore import QBuffer, QByteArray, QIODevice, QObject, QSize, Qt, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage, QImageReader
+
+from transport import create_session
+
+
+def decode_thumbnail(data, size):
+    # Decodes straight to (roughly) the target size: for JPEG, QImageReader
+    # asks libjpeg for a 1/2, 1/4 or 1/8 scale decode instead of decoding
+    # every pixel and shrinking afterwards. Safe off the GUI thread.
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+    reader = QImageReader(buffer)
+    reader.setAutoTransform(True)
+    original = reader.size()
+    if original.isValid():
+        scaled = original.scaled(QSize(size[0], size[1]), Qt.AspectRatioMode.KeepAspectRatio)
+        if scaled.width() < original.width():
+            reader.setScaledSize(scaled)
+    image = reader.read()
+    if not image.isNull() and (image.width() > size[0] or image.height() > size[1]):
+        # Formats that ignore the scaled size (or EXIF-rotated ones).
+        image = image.scaled(size[0], size[1], Qt.AspectRatioMode.KeepAspectRatio,
+                             Qt.TransformationMode.SmoothTransformation)
+    return image
+
+
+class ThumbnailLoader(QObject):
+    # Emitted on the GUI thread (queued) with the ticket returned by request().
+    thumbnail_ready = pyqtSignal(int, QImage)
+    thumbnail_failed = pyqtSignal(int)
+
+    def __init__(self, headers=None, cache=None, max_in_flight=6, timeout=(5, 10), transport=None, decoders=None,
+                 parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.timeout = timeout
+
+        # One connection pool shared by every fetch; the executor bounds how
+        # many requests are in flight at once. Retries and backoff are left
+        # to the transport.
+        self.session = create_session(headers, transport=transport, pool_connections=4, pool_maxsize=max_in_flight)
+        self.metrics = self.session.get_adapter("https://").metrics
+        if cache is not None:
+            self.metrics.add_collector("thumbnail_cache", cache.stats)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="thumbnail")
+        # Decoding is CPU work, so it gets its own pool sized to the cores
+        # rather than tying up (or being starved by) the network threads.
+        self.decoder = ThreadPoolExecutor(max_workers=decoders or min(4, os.cpu_count() or 1),
+                                          thread_name_prefix="thumbnail-decode")
+        self._decode_lock = Lock()
+        self.decoded = 0
+        self.decode_seconds = 0.0
+        self.decode_max = 0.0
+
+        self._tickets = itertools.count(1)
+        self._generation = 0
+        self._futures = {}
+
+    def request(self, url, size):
+        ticket = next(self._tickets)
+        if self.cache is not None:
+            image = self.cache.memory.get((url, size))
+            if image is not None:
+                # Deliver on the next event loop pass so the caller can
+                # register the ticket first.
+                QTimer.singleShot(0, lambda: self.thumbnail_ready.emit(ticket, image))
+                return ticket
+        future = self.executor.submit(self._fetch, ticket, url, size, self._generation, time.perf_counter())
+        self._futures[ticket] = future
+        future.add_done_callback(lambda _, t=ticket: self._futures.pop(t, None))
+        return ticket
+
+    def cancel(self, ticket):
+        # Only succeeds for fetches that have not started yet.
+        future = self._futures.get(ticket)
+        if future is not None and future.cancel():
+            self._futures.pop(ticket, None)
+            return True
+        return False
+
+    def cancel_pending(self):
+        # Fetches that have not started are dropped; running ones notice the
+        # generation change and discard their result.
+        self._generation += 1
+        for future in list(self._futures.values()):
+            future.cancel()
+        self._futures.clear()
+
+    def shutdown(self):
+        self.cancel_pending()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.decoder.shutdown(wait=False, cancel_futures=True)
+
+    def decode_stats(self):
+        with self._decode_lock:
+            return {
+                'decoded': self.decoded,
+                'mean_ms': self.decode_seconds / self.decoded * 1000 if self.decoded else 0.0,
+                'max_ms': self.decode_max * 1000,
+            }
+
+    def _fetch(self, ticket, url, size, generation, queued_at):
+        # Time spent waiting for a free fetch thread.
+        self.metrics.observe("thumbnail_queue_seconds", time.perf_counter() - queued_at)
+        data = self._cached_data(url) if self.cache is not None else None
+        if data is None:
+            data = self._download(url, generation)
+        if generation != self._generation:
+            return
+        if not data:
+            self.thumbnail_failed.emit(ticket)
+            return
+        try:
+            self.decoder.submit(self._decode, ticket, url, size, data, generation)
+        except RuntimeError:
+            # Shut down while this fetch was in flight.
+            pass
+
+    def _decode(self, ticket, url, size, data, generation):
+        if generation != self._generation:
+            return
+        start = time.perf_counter()
+        image = decode_thumbnail(data, size)
+        elapsed = time.perf_counter() - start
+        self.metrics.observe("thumbnail_decode_seconds", elapsed)
+        with self._decode_lock:
+            self.decoded += 1
+            self.decode_seconds += elapsed
+            self.decode_max = max(self.decode_max, elapsed)
+        if image.isNull():
+            self.thumbnail_failed.emit(ticket)
+            return
+        if self.cache is not None:
+            self.cache.memory.put((url, size), image, image.sizeInBytes())
+        if generation == self._generation:
+            self.thumbnail_ready.emit(ticket, image)
+
+    def _cached_data(self, url):
+        data, entry = self.cache.disk.lookup(url)
+        if data is None or entry['fresh']:
+            return data
+        try:
+            response = self.session.get(url, timeout=self.timeout, headers=self.cache.disk.validators(entry))
+            if response.status_code == 304:
+                self.cache.disk.touch(url)
+                return data
+            response.raise_for_status()
+            return self._store(url, response)
+        except requests.exceptions.RequestException:
+            # A stale thumbnail beats no thumbnail when the mirror is unreachable.
+            return data
+
+    def _store(self, url, response):
+        data = response.content
+        if self.cache is not None:
+            self.cache.record_network(len(data))
+            self.cache.disk.store(url, data, etag=response.headers.get('ETag'),
+                                  last_modified=response.headers.get('Last-Modified'))
+        return data
+
+    def _download(self, url, generation):
+        if generation != self._generation:
+            return None
+        try:
+            with self.metrics.track("thumbnail_fetch_seconds", in_flight="thumbnail_fetches_in_flight"):
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                return self._store(url, response)
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to load thumbnail: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred during thumbnail load: {e}")
+        return None
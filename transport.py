@@ -0,0 +1,297 @@
+# transport.py
+# Shared HTTP policy for every request the app makes: per-host rate limits,
+# retries with jittered backoff that honour Retry-After, default timeouts and
+# a circuit breaker per host. Mounted on each requests.Session as its adapter.
+# It also times every request into its Metrics: connection setup (DNS and
+# TCP, then TLS) and time to response headers, per host.
+import random
+import time
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from metrics import Metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    # "Full jitter": a random delay up to the exponential bound, so clients
+    # that failed together do not retry together.
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date.
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate=None, burst=None):
+        # rate is requests per second; None only honours hold().
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate or 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = Lock()
+
+    def acquire(self):
+        # Blocks until the caller may send. Tokens can go negative, which
+        # queues callers in arrival order without a condition variable.
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.blocked_until - now)
+            if self.rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def hold(self, seconds):
+        # The server asked us to back off (Retry-After); stall every caller.
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failures and rejects requests for
+    # `reset_after` seconds; then lets one trial request through (half-open)
+    # and closes again if it succeeds.
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.trial else 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.reset_after:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial or (self.threshold and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+    def abandon(self):
+        # The trial request ended without saying anything about the host
+        # (e.g. it was interrupted); the next request becomes the trial.
+        with self._lock:
+            self.trial = False
+
+
+class TimedConnection:
+    # Mixed into urllib3's connections to record how long a new connection
+    # took to set up; the adapter reports it with the first response on it.
+    connect_seconds = None
+    setup_seconds = None
+
+    def _new_conn(self):
+        # Name resolution plus the TCP handshake.
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        self.connect_seconds = time.perf_counter() - start
+        return sock
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        self.setup_seconds = time.perf_counter() - start
+
+
+class TimedHTTPConnection(TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnection, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TransportAdapter(HTTPAdapter):
+    def __init__(self, timeout=(10, 30), max_retries=3, backoff=0.5, max_backoff=30.0, max_retry_after=120.0,
+                 breaker_threshold=5, breaker_reset=30.0, pool_connections=10, pool_maxsize=10, metrics=None):
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        # Shared by everything that uses this transport.
+        self.metrics = metrics or Metrics()
+        self.timeout = timeout
+        self.retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._rates = {}
+        self._buckets = {}
+        self._breakers = {}
+        self._lock = Lock()
+        self.requests = 0
+        self.retried = 0
+        self.throttled_seconds = 0.0
+        self.rejected = 0
+        self.metrics.add_collector("transport", self.stats)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
+
+    def set_rate_limit(self, host, rate, burst=None):
+        with self._lock:
+            self._rates[host] = (rate, burst)
+            self._buckets.pop(host, None)
+
+    def bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate, burst = self._rates.get(host, (None, None))
+                bucket = self._buckets[host] = TokenBucket(rate, burst)
+            return bucket
+
+    def breaker(self, host):
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        host = urlsplit(request.url).hostname
+        bucket, breaker = self.bucket(host), self.breaker(host)
+        retryable = request.method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.rejected += 1
+                raise CircuitOpenError(f"{host} keeps failing; requests are paused for a while.", request=request)
+            self.throttled_seconds += bucket.acquire()
+            self.requests += 1
+            try:
+                with self.metrics.track("http_response_seconds", in_flight="http_requests_in_flight", host=host):
+                    response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.inc("http_responses_total", host=host, status=type(e).__name__)
+                breaker.failure()
+                if not retryable or attempt >= self.retries:
+                    raise
+                delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+            except BaseException:
+                breaker.abandon()
+                raise
+            else:
+                self.record_response(host, response)
+                if response.status_code in RETRY_STATUSES and response.status_code != 429:
+                    breaker.failure()
+                else:
+                    # 429 means the mirror is up but wants us to slow down.
+                    breaker.success()
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                if not retryable or attempt >= self.retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None:
+                    delay = min(retry_after, self.max_retry_after)
+                    bucket.hold(delay)
+                else:
+                    delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+                response.close()
+            attempt += 1
+            self.retried += 1
+            time.sleep(delay)
+
+    def record_response(self, host, response):
+        self.metrics.inc("http_responses_total", host=host, status=response.status_code)
+        # As declared by the server; the body may not have been read yet.
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            self.metrics.inc("http_response_bytes_total", int(length), host=host)
+        connection = getattr(response.raw, 'connection', None)
+        if getattr(connection, 'setup_seconds', None) is not None:
+            self.metrics.inc("http_connections_opened_total", host=host)
+            self.metrics.observe("http_connect_seconds", connection.connect_seconds or 0.0, host=host)
+            if isinstance(connection, HTTPSConnection):
+                self.metrics.observe("http_tls_seconds", connection.setup_seconds - (connection.connect_seconds or 0.0),
+                                     host=host)
+            connection.setup_seconds = None
+
+    def stats(self):
+        with self._lock:
+            breakers = {host: breaker.state for host, breaker in self._breakers.items()}
+        return {
+            'requests': self.requests,
+            'retried': self.retried,
+            'throttled_seconds': self.throttled_seconds,
+            'rejected': self.rejected,
+            'breakers': breakers,
+        }
+
+
+def create_session(headers=None, transport=None, **options):
+    # options are TransportAdapter arguments, used when no shared transport
+    # is passed in.
+    session = requests.Session()
+    if headers:
+        session.headers.update(headers)
+    transport = transport or TransportAdapter(**options)
+    session.mount("http://", transport)
+    session.mount("https://", transport)
+    return session
+
+
+def host_of(url):
+    return urlsplit(url).hostname
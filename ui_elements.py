@@ -1,127 +1,342 @@
 # ui_elements.py
-from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QSizePolicy
-from PyQt6.QtGui import QPixmap
-from PyQt6.QtCore import Qt, pyqtSignal, QByteArray
-import requests
-from threading import Thread
-import time
+from collections import OrderedDict
 
-class ImageResultWidget(QWidget):
-    download_requested = pyqtSignal(str, str)
+from PyQt6.QtWidgets import (QListView, QStyledItemDelegate, QAbstractItemView, QDockWidget, QWidget, QVBoxLayout,
+                             QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QHeaderView)
+from PyQt6.QtGui import QPixmap, QColor, QPen, QFont, QFontMetrics, QPainter
+from PyQt6.QtCore import Qt, pyqtSignal, QAbstractListModel, QModelIndex, QRect, QSize, QEvent, QTimer
 
-    def __init__(self, parent=None, image_data=None, api=None):
+from metrics import Metrics
+
+POST_ROLE = Qt.ItemDataRole.UserRole
+THUMBNAIL_ROLE = Qt.ItemDataRole.UserRole + 1
+THUMBNAIL_STATE_ROLE = Qt.ItemDataRole.UserRole + 2
+DOWNLOADED_ROLE = Qt.ItemDataRole.UserRole + 3
+
+ROW_HEIGHT = 200
+THUMBNAIL_SIZE = (180, 180)
+
+
+class PostListModel(QAbstractListModel):
+    # Pixmaps are only kept for recently painted rows; anything evicted is
+    # requested again (usually from the thumbnail memory cache) when it is
+    # scrolled back into view.
+    MAX_PIXMAPS = 300
+
+    def __init__(self, thumbnail_loader, parent=None):
         super().__init__(parent)
-        self.image_data = image_data or {}
-        self.api = api
-        self.download_url = self.image_data.get('download_url', '')
-        self.file_extension = self.image_data.get('file_extension', '.jpg')
-        self.initUI()
-        self.load_thumbnail()
-
-    def initUI(self):
-        self.setObjectName("ImageResultWidget")
-        self.setMinimumHeight(200)
-        self.setMaximumHeight(200)
-
-        self.setStyleSheet("""
-            #ImageResultWidget {
-                border: 1px solid #ccc;
-                border-radius: 5px;
-                background-color: #ffffff;
-            }
-            QLabel {
-                font-family: sans-serif;
-            }
-        """)
-
-        main_layout = QHBoxLayout(self)
-
-        # Image Placeholder
-        self.image_label = QLabel("Loading...")
-        self.image_label.setFixedSize(180, 180)
-        self.image_label.setStyleSheet("border: 1px solid black; background-color: #f0f0f0; text-align: center;")
-        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        main_layout.addWidget(self.image_label)
-
-        # Details Layout
-        details_layout = QVBoxLayout()
-        details_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-
-        self.name_label = QLabel(f"name: {self.image_data.get('name', 'N/A')}")
-        self.tags_label = QLabel(f"tags: {', '.join(self.image_data.get('tags', []))}")
-        self.tags_label.setWordWrap(True)
-        self.author_label = QLabel(f"author: {self.image_data.get('author', 'N/A')}")
-        
-        details_layout.addWidget(self.name_label)
-        details_layout.addWidget(self.tags_label)
-        details_layout.addWidget(self.author_label)
-
-        main_layout.addLayout(details_layout)
-        main_layout.addStretch(1)
-
-        # Download Button
-        self.download_button = QPushButton("Download")
-        self.download_button.setFixedWidth(80)
-        self.download_button.setObjectName("downloadButton")
-        self.download_button.clicked.connect(self.download_image_clicked)
-        main_layout.addWidget(self.download_button, alignment=Qt.AlignmentFlag.AlignBottom)
+        self.thumbnail_loader = thumbnail_loader
+        self._posts = []
+        self._pixmaps = OrderedDict()
+        self._states = {}
+        self._tickets = {}
+        self._pending_rows = set()
+        self.thumbnail_loader.thumbnail_ready.connect(self._on_thumbnail_ready)
+        self.thumbnail_loader.thumbnail_failed.connect(self._on_thumbnail_failed)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._posts)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        post = self._posts[index.row()]
+        if role == POST_ROLE:
+            return post
+        if role == Qt.ItemDataRole.DisplayRole:
+            return post.name
+        if role == THUMBNAIL_ROLE:
+            pixmap = self._pixmaps.get(index.row())
+            if pixmap is not None:
+                self._pixmaps.move_to_end(index.row())
+            return pixmap
+        if role == THUMBNAIL_STATE_ROLE:
+            if not post.preview_url:
+                return "No Preview"
+            return self._states.get(index.row(), "Loading...")
+        if role == DOWNLOADED_ROLE:
+            return post.downloaded
+        return None
+
+    def mark_downloaded(self, post_id, md5=None):
+        # md5 also catches the same image cross-posted on another source.
+        for row, post in enumerate(self._posts):
+            if (md5 and post.md5 == md5) or (post_id is not None and post.source is None and post.id == post_id):
+                post.downloaded = True
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [DOWNLOADED_ROLE])
+
+    def set_posts(self, posts):
+        self.beginResetModel()
+        self._reset_thumbnails()
+        self._posts = list(posts)
+        self.endResetModel()
+
+    def append_posts(self, posts):
+        if not posts:
+            return
+        first = len(self._posts)
+        self.beginInsertRows(QModelIndex(), first, first + len(posts) - 1)
+        self._posts.extend(posts)
+        self.endInsertRows()
+
+    def clear(self):
+        self.set_posts([])
+
+    def _reset_thumbnails(self):
+        self.thumbnail_loader.cancel_pending()
+        self._pixmaps.clear()
+        self._states.clear()
+        self._tickets.clear()
+        self._pending_rows.clear()
+
+    def ensure_thumbnail(self, row):
+        # Called while painting, so only visible rows ever hit the network.
+        if row in self._pixmaps or row in self._states or row in self._pending_rows:
+            return
+        url = self._posts[row].preview_url
+        if url:
+            self._tickets[self.thumbnail_loader.request(url, THUMBNAIL_SIZE)] = row
+            self._pending_rows.add(row)
+
+    def cancel_outside(self, first, last):
+        for ticket, row in list(self._tickets.items()):
+            if row < first or row > last:
+                if self.thumbnail_loader.cancel(ticket):
+                    del self._tickets[ticket]
+                    self._pending_rows.discard(row)
+
+    def _on_thumbnail_ready(self, ticket, image):
+        row = self._tickets.pop(ticket, None)
+        if row is None:
+            return
+        self._pending_rows.discard(row)
+        self._pixmaps[row] = QPixmap.fromImage(image)
+        while len(self._pixmaps) > self.MAX_PIXMAPS:
+            self._pixmaps.popitem(last=False)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [THUMBNAIL_ROLE])
+
+    def _on_thumbnail_failed(self, ticket):
+        row = self._tickets.pop(ticket, None)
+        if row is None:
+            return
+        self._pending_rows.discard(row)
+        self._states[row] = "Failed"
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [THUMBNAIL_STATE_ROLE])
+
+
+class PostDelegate(QStyledItemDelegate):
+    download_requested = pyqtSignal(object)
+
+    MARGIN = 10
+    BUTTON_SIZE = QSize(80, 28)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.button_color = QColor("#007BFF")
+        self.font = QFont("sans-serif")
+        self.metrics = QFontMetrics(self.font)
+        self.hover_pos = None
 
     def set_button_color(self, color):
-        self.download_button.setStyleSheet(f"""
-            #downloadButton {{
-                background-color: {color};
-                color: white;
-                border: none;
-                border-radius: 3px;
-                padding: 5px 10px;
-            }}
-            #downloadButton:hover {{
-                background-color: #0056b3;
-            }}
-        """)
-
-    def load_thumbnail(self):
-        thumbnail_url = self.image_data.get('preview_url')
-        if not thumbnail_url:
-            self.image_label.setText("No Preview")
+        self.button_color = QColor(color)
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), ROW_HEIGHT)
+
+    def _frame_rect(self, option):
+        return option.rect.adjusted(2, 5, -2, -5)
+
+    def _button_rect(self, option):
+        frame = self._frame_rect(option)
+        return QRect(frame.right() - self.MARGIN - self.BUTTON_SIZE.width(),
+                     frame.bottom() - self.MARGIN - self.BUTTON_SIZE.height(),
+                     self.BUTTON_SIZE.width(), self.BUTTON_SIZE.height())
+
+    def paint(self, painter, option, index):
+        post = index.data(POST_ROLE)
+        index.model().ensure_thumbnail(index.row())
+        frame = self._frame_rect(option)
+
+        painter.save()
+        painter.setFont(self.font)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(QPen(QColor("#cccccc")))
+        painter.setBrush(QColor("#ffffff"))
+        painter.drawRoundedRect(frame, 5, 5)
+
+        # Thumbnail
+        image_rect = QRect(frame.left() + self.MARGIN, frame.top() + (frame.height() - THUMBNAIL_SIZE[1]) // 2,
+                           THUMBNAIL_SIZE[0], THUMBNAIL_SIZE[1])
+        painter.setPen(QPen(QColor("#000000")))
+        painter.setBrush(QColor("#f0f0f0"))
+        painter.drawRect(image_rect)
+        pixmap = index.data(THUMBNAIL_ROLE)
+        if pixmap is not None:
+            target = QRect(0, 0, pixmap.width(), pixmap.height())
+            target.moveCenter(image_rect.center())
+            painter.drawPixmap(target, pixmap)
+        else:
+            painter.drawText(image_rect, Qt.AlignmentFlag.AlignCenter, index.data(THUMBNAIL_STATE_ROLE))
+
+        # Details
+        button_rect = self._button_rect(option)
+        text_left = image_rect.right() + self.MARGIN
+        text_width = button_rect.left() - self.MARGIN - text_left
+        line = self.metrics.height()
+        top = frame.top() + self.MARGIN
+        painter.drawText(QRect(text_left, top, text_width, line), Qt.AlignmentFlag.AlignLeft,
+                         self.metrics.elidedText(f"name: {post.name}", Qt.TextElideMode.ElideRight,
+                                                 text_width))
+        tags_rect = QRect(text_left, top + line, text_width, frame.bottom() - top - 3 * line - self.MARGIN)
+        painter.drawText(tags_rect, Qt.AlignmentFlag.AlignLeft | Qt.TextFlag.TextWordWrap,
+                         f"tags: {', '.join(post.tags)}")
+        painter.drawText(QRect(text_left, tags_rect.bottom() + line // 2, text_width, line),
+                         Qt.AlignmentFlag.AlignLeft,
+                         self.metrics.elidedText(f"author: {post.author or 'N/A'}", Qt.TextElideMode.ElideRight,
+                                                 text_width))
+
+        # Download affordance
+        downloaded = index.data(DOWNLOADED_ROLE)
+        hovered = self.hover_pos is not None and button_rect.contains(self.hover_pos)
+        color = QColor("#8a8a8a") if downloaded else self.button_color
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(color.darker(120) if hovered else color)
+        painter.drawRoundedRect(button_rect, 3, 3)
+        painter.setPen(QPen(QColor("white")))
+        painter.drawText(button_rect, Qt.AlignmentFlag.AlignCenter, "Downloaded" if downloaded else "Download")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+            if self._button_rect(option).contains(event.position().toPoint()):
+                self.download_requested.emit(index.data(POST_ROLE))
+                return True
+        return super().editorEvent(event, model, option, index)
+
+
+class ResultsView(QListView):
+    # Rows this far outside the viewport keep their pending thumbnail fetches.
+    PREFETCH_ROWS = 5
+
+    def __init__(self, parent=None, metrics=None):
+        super().__init__(parent)
+        self.metrics = metrics or Metrics()
+        self.setUniformItemSizes(True)
+        # Batched layout keeps relayouts and scrolling from walking every row.
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(200)
+        self.setMouseTracking(True)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setSpacing(0)
+        self.verticalScrollBar().valueChanged.connect(self._cancel_offscreen)
+
+    def timerEvent(self, event):
+        # Delayed and batched relayouts of the rows run from the view's timers.
+        with self.metrics.track("results_layout_seconds"):
+            super().timerEvent(event)
+
+    def paintEvent(self, event):
+        with self.metrics.track("results_paint_seconds"):
+            super().paintEvent(event)
+
+    def mouseMoveEvent(self, event):
+        self.itemDelegate().hover_pos = event.position().toPoint()
+        self.viewport().update()
+        super().mouseMoveEvent(event)
+
+    def leaveEvent(self, event):
+        self.itemDelegate().hover_pos = None
+        self.viewport().update()
+        super().leaveEvent(event)
+
+    def is_near_end(self, rows=3):
+        scroll_bar = self.verticalScrollBar()
+        return scroll_bar.maximum() - scroll_bar.value() <= rows * ROW_HEIGHT
+
+    def visible_rows(self):
+        first = self.indexAt(self.viewport().rect().topLeft())
+        last = self.indexAt(self.viewport().rect().bottomLeft())
+        first_row = first.row() if first.isValid() else 0
+        last_row = last.row() if last.isValid() else self.model().rowCount() - 1
+        return first_row, last_row
+
+    def _cancel_offscreen(self):
+        if self.model() is None:
             return
-        
-        def fetch_image_with_retry():
-            max_retries = 3
-            for i in range(max_retries):
-                try:
-                    response = self.api.session.get(thumbnail_url, timeout=5)
-                    response.raise_for_status()
-                    image_data = response.content
-                    self.load_pixmap(image_data)
-                    return
-                except requests.exceptions.RequestException as e:
-                    print(f"Attempt {i+1} failed to load thumbnail: {e}")
-                    time.sleep(1)
-                except Exception as e:
-                    print(f"An unexpected error occurred during thumbnail load: {e}")
-                    break
-
-            self.load_pixmap(None)
-            self.image_label.setText("Failed")
-
-        thread = Thread(target=fetch_image_with_retry)
-        thread.start()
-
-    def load_pixmap(self, image_data):
-        pixmap = QPixmap()
-        if image_data:
-            pixmap.loadFromData(QByteArray(image_data))
-        
-        if not pixmap.isNull():
-            scaled_pixmap = pixmap.scaled(
-                self.image_label.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            self.image_label.setPixmap(scaled_pixmap)
+        first, last = self.visible_rows()
+        self.model().cancel_outside(first - self.PREFETCH_ROWS, last + self.PREFETCH_ROWS)
+
+
+def metric_label(entry):
+    labels = ",".join(f"{key}={value}" for key, value in entry['labels'].items())
+    return f"{entry['name']}{{{labels}}}" if labels else entry['name']
+
+
+class MetricsDock(QDockWidget):
+    # Live view of a Metrics registry; only refreshed while it is visible.
+    export_requested = pyqtSignal()
+    REFRESH_MS = 1000
+
+    def __init__(self, metrics, parent=None):
+        super().__init__("Metrics", parent)
+        self.setObjectName("metricsDock")
+        self.metrics = metrics
+
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+        self.histogram_table = self._table(["Timing", "Count", "p50 ms", "p95 ms", "p99 ms", "Max ms"])
+        self.value_table = self._table(["Counter / gauge", "Value"])
+        layout.addWidget(self.histogram_table, 3)
+        layout.addWidget(self.value_table, 2)
+
+        buttons = QHBoxLayout()
+        self.export_button = QPushButton("Export...")
+        self.export_button.clicked.connect(self.export_requested)
+        buttons.addStretch()
+        buttons.addWidget(self.export_button)
+        layout.addLayout(buttons)
+        self.setWidget(widget)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self._on_visibility_changed)
+
+    def _table(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        return table
+
+    def _on_visibility_changed(self, visible):
+        if visible:
+            self.refresh()
+            self.timer.start(self.REFRESH_MS)
         else:
-            self.image_label.setText("Failed")
+            self.timer.stop()
+
+    def _fill(self, table, rows):
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                table.setItem(row, column, item)
 
-    def download_image_clicked(self):
-        self.download_requested.emit(self.download_url, self.file_extension)
\ No newline at end of file
+    def refresh(self):
+        snapshot = self.metrics.snapshot()
+        self._fill(self.histogram_table, [
+            [metric_label(h), str(h['count'])] + [f"{h[key] * 1000:.1f}" for key in ('p50', 'p95', 'p99', 'max')]
+            for h in snapshot['histograms']
+        ])
+        self._fill(self.value_table, [
+            [metric_label(entry), f"{entry['value']:.3g}" if isinstance(entry['value'], float) else str(entry['value'])]
+            for entry in snapshot['counters'] + snapshot['gauges']
+        ])